@@ -0,0 +1,143 @@
+"""Study-wide aggregates computed in SQL.
+
+Each query is a single GROUP BY over the response tables, so the database
+returns one row per trial or participant instead of every response. Response
+time percentiles use the nearest-rank method over ``ROW_NUMBER()`` /
+``COUNT(*)`` windows, which MySQL 8 and SQLite >= 3.25 both support (neither
+has ``PERCENTILE_CONT``).
+
+Results are cached as encoded JSON, keyed by endpoint, query parameters and
+``analytics_generation``. Handlers that write trial responses, SAM/TLX
+responses or session rows bump the generation, so a dashboard polling an
+unchanged study is served from memory.
+"""
+from typing import Callable, Dict, List, Optional
+
+import orjson
+from fastapi.responses import Response
+from sqlalchemy import and_, case, func, select
+from sqlalchemy.orm import Session as DBSession
+
+from app.cache import analytics_cache, analytics_generation
+from app.database import Database
+from app.models import SAMResponse, StudySession, TLXResponse, TrialResponse
+
+PERCENTILES = (50, 90, 95, 99)
+TLX_SCALES = ("mental_demand", "physical_demand", "temporal_demand", "performance", "effort", "frustration")
+SAM_SCALES = ("pleasure", "arousal", "dominance")
+
+
+def _float(value) -> Optional[float]:
+    # MySQL returns AVG() as Decimal
+    return float(value) if value is not None else None
+
+
+def _filter(stmt, model, participant_id: Optional[str], completed_only: bool):
+    if participant_id is not None:
+        stmt = stmt.where(model.participant_id == participant_id)
+    if completed_only:
+        stmt = stmt.join(StudySession, StudySession.session_id == model.session_id).where(
+            StudySession.completed.is_(True)
+        )
+    return stmt
+
+
+def trial_accuracy(db: DBSession, participant_id: Optional[str], completed_only: bool) -> List[Dict]:
+    """Responses and correct answers per trial; accuracy is None for trials without a correct_answer"""
+    # is_correct is scored at insert, so this reads ix_trial_responses_trial_correct alone
+    correct = case((TrialResponse.is_correct.is_(True), 1), else_=0)
+    stmt = (
+        select(
+            TrialResponse.trial_id,
+            func.count().label("response_count"),
+            func.count(TrialResponse.is_correct).label("scored_count"),
+            func.sum(correct).label("correct_count"),
+        )
+        .group_by(TrialResponse.trial_id)
+        .order_by(TrialResponse.trial_id)
+    )
+    rows = db.execute(_filter(stmt, TrialResponse, participant_id, completed_only)).all()
+    return [
+        {
+            "trial_id": row.trial_id,
+            "response_count": row.response_count,
+            "correct_count": int(row.correct_count or 0),
+            "accuracy": int(row.correct_count or 0) / row.scored_count if row.scored_count else None,
+        }
+        for row in rows
+    ]
+
+
+def response_times(db: DBSession, participant_id: Optional[str], completed_only: bool) -> List[Dict]:
+    """Mean, min, max and nearest-rank percentiles of response_time per trial"""
+    ranked = _filter(
+        select(
+            TrialResponse.trial_id,
+            TrialResponse.response_time,
+            func.row_number()
+            .over(partition_by=TrialResponse.trial_id, order_by=TrialResponse.response_time)
+            .label("rank"),
+            func.count().over(partition_by=TrialResponse.trial_id).label("n"),
+        ),
+        TrialResponse,
+        participant_id,
+        completed_only,
+    ).subquery()
+
+    def nearest_rank(p: int):
+        # The smallest rank r with r / n >= p / 100, in integer arithmetic
+        at_rank = and_(ranked.c.rank * 100 >= ranked.c.n * p, (ranked.c.rank - 1) * 100 < ranked.c.n * p)
+        return func.max(case((at_rank, ranked.c.response_time))).label(f"p{p}")
+
+    stmt = (
+        select(
+            ranked.c.trial_id,
+            func.count().label("response_count"),
+            func.avg(ranked.c.response_time).label("mean"),
+            func.min(ranked.c.response_time).label("min"),
+            *(nearest_rank(p) for p in PERCENTILES),
+            func.max(ranked.c.response_time).label("max"),
+        )
+        .group_by(ranked.c.trial_id)
+        .order_by(ranked.c.trial_id)
+    )
+    return [
+        {**row._asdict(), "mean": _float(row.mean)}
+        for row in db.execute(stmt)
+    ]
+
+
+def questionnaires(db: DBSession, participant_id: Optional[str], completed_only: bool) -> List[Dict]:
+    """Mean NASA-TLX and SAM scores per participant; raw_tlx is the unweighted mean of the six scales"""
+    tlx_columns = [getattr(TLXResponse, name) for name in TLX_SCALES]
+    tlx = select(
+        TLXResponse.participant_id,
+        func.count().label("count"),
+        *(func.avg(column).label(column.name) for column in tlx_columns),
+        func.avg(sum(tlx_columns) / float(len(tlx_columns))).label("raw_tlx"),
+    ).group_by(TLXResponse.participant_id)
+    sam = select(
+        SAMResponse.participant_id,
+        func.count().label("count"),
+        *(func.avg(getattr(SAMResponse, name)).label(name) for name in SAM_SCALES),
+    ).group_by(SAMResponse.participant_id)
+
+    participants: Dict[str, Dict] = {}
+    for key, stmt, model in (("tlx", tlx, TLXResponse), ("sam", sam, SAMResponse)):
+        for row in db.execute(_filter(stmt, model, participant_id, completed_only)):
+            values = row._asdict()
+            pid = values.pop("participant_id")
+            entry = participants.setdefault(pid, {"participant_id": pid, "tlx": None, "sam": None})
+            entry[key] = {name: value if name == "count" else _float(value) for name, value in values.items()}
+    return [participants[pid] for pid in sorted(participants)]
+
+
+async def cached(db: Database, name: str, fn: Callable, *params) -> Response:
+    """Serve ``fn(db, *params)`` as JSON from the analytics cache, computing it on a miss"""
+    # Read the generation first: a write landing mid-query leaves this entry under a stale key
+    key = (name, params, analytics_generation.value)
+    body = analytics_cache.get(key)
+    if body is None:
+        body = orjson.dumps(await db.run(fn, *params))
+        analytics_cache.set(key, body)
+    return Response(body, media_type="application/json")
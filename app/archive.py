@@ -0,0 +1,274 @@
+"""Columnar archive for eye tracking samples of completed sessions.
+
+Each trial of an archived session is stored as one ``.npy`` file per column
+under ``<archive_dir>/<session_id>/trial_<trial_id>.<last id>/``, sorted by
+(timestamp, id), with float32 gaze/pupil values (the precision of the MySQL
+FLOAT columns). Files are left uncompressed so readers can memory-map them and
+slice time ranges with a binary search instead of loading whole trials.
+
+Archiving writes a new directory per trial (suffixed with the highest sample
+id it holds), then points ``eye_tracking_archives`` at it and deletes the hot
+rows in one transaction. Until that commits readers keep using the previous
+directory plus the hot rows; if it fails, nothing refers to the new files and
+a retry starts over. Superseded directories are removed after the commit.
+Paths are stored relative to ``ARCHIVE_DIR``.
+
+Readers go through the helpers here, which merge archived samples with any
+hot rows that arrived after archiving. ``python -m app.archive`` archives
+completed sessions from the command line.
+"""
+import argparse
+import heapq
+import shutil
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+from urllib.parse import quote
+
+import numpy as np
+from sqlalchemy import delete, select
+from sqlalchemy.orm import Session as DBSession
+
+from app.config import settings
+from app.database import SessionLocal
+from app.eye_tracking import Cursor, read_page
+from app.models import EyeTrackingArchive, EyeTrackingData, StudySession
+from app.storage import write_columns
+
+COLUMNS = {
+    "id": np.int64,
+    "timestamp": np.int64,
+    "gaze_x": np.float32,
+    "gaze_y": np.float32,
+    "pupil_diameter": np.float32,
+}
+
+
+def _trial_path(session_id: str, trial_id: int, last_id: int) -> str:
+    """Location of a trial's files relative to ARCHIVE_DIR; a new one for every archiving run"""
+    return f"{quote(session_id, safe='')}/trial_{trial_id}.{last_id}"
+
+
+def _resolve(path: str) -> Path:
+    return Path(settings.archive_dir) / path
+
+
+def _open_trial(path: str) -> Dict[str, np.ndarray]:
+    return {name: np.load(_resolve(path) / f"{name}.npy", mmap_mode="r") for name in COLUMNS}
+
+
+def archived_trials(db: DBSession, session_id: str) -> List[EyeTrackingArchive]:
+    return (
+        db.query(EyeTrackingArchive)
+        .filter(EyeTrackingArchive.session_id == session_id)
+        .order_by(EyeTrackingArchive.trial_id)
+        .all()
+    )
+
+
+def _hot_columns(db: DBSession, session_id: str) -> Dict[str, np.ndarray]:
+    table = EyeTrackingData.__table__
+    names = ["trial_id", *COLUMNS]
+    rows = db.execute(
+        select(*(table.c[name] for name in names)).where(table.c.session_id == session_id)
+    ).all()
+    data = np.array(rows, dtype=np.float64).reshape(-1, len(names))
+    return {
+        name: data[:, i].astype(COLUMNS.get(name, np.int64))
+        for i, name in enumerate(names)
+    }
+
+
+def load_columns(db: DBSession, session_id: str) -> Dict[str, np.ndarray]:
+    """All samples of a session as columns (trial_id plus COLUMNS), archived and hot combined"""
+    parts = [_hot_columns(db, session_id)]
+    for entry in archived_trials(db, session_id):
+        columns = {name: np.asarray(values) for name, values in _open_trial(entry.path).items()}
+        columns["trial_id"] = np.full(entry.sample_count, entry.trial_id, dtype=np.int64)
+        parts.append(columns)
+    return {name: np.concatenate([part[name] for part in parts]) for name in parts[0]}
+
+
+def archive_session(db: DBSession, session_id: str) -> int:
+    """Move a completed session's hot samples into the archive; returns samples moved"""
+    session = db.query(StudySession).filter(StudySession.session_id == session_id).first()
+    if session is None or not session.completed:
+        raise ValueError(f"Session {session_id} is not completed")
+
+    hot = _hot_columns(db, session_id)
+    if not len(hot["id"]):
+        return 0
+    existing = {entry.trial_id: entry for entry in archived_trials(db, session_id)}
+
+    written: List[str] = []
+    superseded: List[str] = []
+    try:
+        for trial_id in np.unique(hot["trial_id"]).tolist():
+            mask = hot["trial_id"] == trial_id
+            columns = {name: hot[name][mask] for name in COLUMNS}
+            entry = existing.get(trial_id)
+            if entry is not None:
+                # Late samples for an already archived trial: merge with the stored columns
+                stored = _open_trial(entry.path)
+                columns = {name: np.concatenate([np.asarray(stored[name]), columns[name]]) for name in COLUMNS}
+            order = np.lexsort((columns["id"], columns["timestamp"]))
+            columns = {name: np.ascontiguousarray(values[order]) for name, values in columns.items()}
+
+            path = _trial_path(session_id, trial_id, int(columns["id"].max()))
+            write_columns(_resolve(path), columns)
+            written.append(path)
+            if entry is None:
+                entry = EyeTrackingArchive(session_id=session_id, trial_id=trial_id)
+                db.add(entry)
+            elif entry.path != path:
+                superseded.append(entry.path)
+            entry.path = path
+            entry.sample_count = len(order)
+            entry.first_timestamp = int(columns["timestamp"][0])
+            entry.last_timestamp = int(columns["timestamp"][-1])
+
+        db.execute(delete(EyeTrackingData).where(
+            EyeTrackingData.session_id == session_id,
+            EyeTrackingData.id.in_(hot["id"].tolist()),
+        ))
+        db.commit()
+    except Exception:
+        db.rollback()
+        for path in written:
+            shutil.rmtree(_resolve(path), ignore_errors=True)
+        raise
+
+    # Readers that already opened these keep their memory maps
+    for path in superseded:
+        shutil.rmtree(_resolve(path), ignore_errors=True)
+    return len(hot["id"])
+
+
+def _archived_slice(
+    columns: Dict[str, np.ndarray],
+    start: Optional[int],
+    end: Optional[int],
+    cursor: Optional[Tuple[int, int]],
+) -> Tuple[int, int]:
+    """Index range of an archived trial within [start, end] and after the (timestamp, id) cursor"""
+    timestamps = columns["timestamp"]
+    lo = 0 if start is None else int(np.searchsorted(timestamps, start, "left"))
+    hi = len(timestamps) if end is None else int(np.searchsorted(timestamps, end, "right"))
+    if cursor is not None:
+        last_ts, last_id = cursor
+        ts_lo = int(np.searchsorted(timestamps, last_ts, "left"))
+        ts_hi = int(np.searchsorted(timestamps, last_ts, "right"))
+        lo = max(lo, ts_lo + int(np.searchsorted(columns["id"][ts_lo:ts_hi], last_id, "right")))
+    return lo, hi
+
+
+def _archived_rows(session_id: str, entry: EyeTrackingArchive, columns, lo: int, hi: int) -> List[Dict]:
+    chunk = {name: np.asarray(values[lo:hi]) for name, values in columns.items()}
+    floats = {
+        name: np.where(np.isnan(chunk[name]), None, chunk[name].astype(object)).tolist()
+        for name in ("gaze_x", "gaze_y", "pupil_diameter")
+    }
+    return [
+        {
+            "id": row_id,
+            "session_id": session_id,
+            "trial_id": entry.trial_id,
+            "timestamp": ts,
+            "gaze_x": x,
+            "gaze_y": y,
+            "pupil_diameter": p,
+        }
+        for row_id, ts, x, y, p in zip(
+            chunk["id"].tolist(), chunk["timestamp"].tolist(),
+            floats["gaze_x"], floats["gaze_y"], floats["pupil_diameter"],
+        )
+    ]
+
+
+def _keyset(row: Dict) -> Tuple[int, int, int]:
+    return row["trial_id"], row["timestamp"], row["id"]
+
+
+def read_samples_page(
+    db: DBSession,
+    session_id: str,
+    trial_id: Optional[int] = None,
+    start: Optional[int] = None,
+    end: Optional[int] = None,
+    cursor: Optional[Cursor] = None,
+    limit: int = 1000,
+) -> Tuple[List[Dict], Optional[Cursor]]:
+    """``read_page`` over hot and archived samples, with the same ordering and cursor"""
+    entries = [
+        entry for entry in archived_trials(db, session_id)
+        if trial_id is None or entry.trial_id == trial_id
+    ]
+    if not entries:
+        return read_page(db, session_id, trial_id, start, end, cursor, limit)
+
+    archived: List[Dict] = []
+    for entry in entries:
+        if len(archived) > limit:
+            break
+        if cursor is not None and entry.trial_id < cursor[0]:
+            continue
+        columns = _open_trial(entry.path)
+        trial_cursor = cursor[1:] if cursor is not None and entry.trial_id == cursor[0] else None
+        lo, hi = _archived_slice(columns, start, end, trial_cursor)
+        hi = min(hi, lo + limit + 1 - len(archived))
+        if hi > lo:
+            archived.extend(_archived_rows(session_id, entry, columns, lo, hi))
+
+    # limit + 1 hot rows so a page boundary inside the hot rows is still detected
+    hot, _ = read_page(db, session_id, trial_id, start, end, limit=limit + 1, cursor=cursor)
+
+    rows = list(heapq.merge(archived, hot, key=_keyset))
+    if len(rows) > limit:
+        rows = rows[:limit]
+        return rows, _keyset(rows[-1])
+    return rows, None
+
+
+def iter_archived_rows(
+    db: DBSession, session_ids: List[str], columns: List[str], batch_size: int
+) -> Iterator[List[tuple]]:
+    """Archived samples as tuples in ``columns`` order, in batches, for exports"""
+    entries = (
+        db.query(EyeTrackingArchive)
+        .filter(EyeTrackingArchive.session_id.in_(session_ids))
+        .order_by(EyeTrackingArchive.session_id, EyeTrackingArchive.trial_id)
+        .all()
+    )
+    for entry in entries:
+        stored = _open_trial(entry.path)
+        for lo in range(0, entry.sample_count, batch_size):
+            rows = _archived_rows(entry.session_id, entry, stored, lo, min(lo + batch_size, entry.sample_count))
+            yield [tuple(row[name] for name in columns) for row in rows]
+
+
+def archive_completed_sessions(db: DBSession) -> Dict[str, int]:
+    """Archive every completed session that still has hot samples"""
+    session_ids = [
+        session_id for (session_id,) in db.execute(
+            select(StudySession.session_id)
+            .where(StudySession.completed.is_(True))
+            .where(StudySession.session_id.in_(select(EyeTrackingData.session_id).distinct()))
+        )
+    ]
+    return {session_id: archive_session(db, session_id) for session_id in session_ids}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Archive eye tracking samples of completed sessions")
+    parser.add_argument("--session", help="archive a single session (default: all completed sessions)")
+    args = parser.parse_args()
+    with SessionLocal() as db:
+        if args.session:
+            archived = {args.session: archive_session(db, args.session)}
+        else:
+            archived = archive_completed_sessions(db)
+    for session_id, count in archived.items():
+        print(f"{session_id}: archived {count} samples")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, NamedTuple, Optional
+
+from app.config import settings
+
+
+class TTLCache:
+    """Thread-safe LRU cache whose entries expire ``ttl`` seconds after being set.
+
+    ``ttl=None`` keeps entries until they are evicted or discarded. With
+    ``maxbytes`` the cache also evicts least recently used entries until the
+    summed ``weigh(value)`` fits; a value heavier than ``maxbytes`` is not stored.
+    """
+
+    def __init__(
+        self,
+        maxsize: int,
+        ttl: Optional[float] = None,
+        maxbytes: Optional[int] = None,
+        weigh: Callable[[Any], int] = len,
+    ):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.maxbytes = maxbytes
+        self.weigh = weigh
+        self.hits = 0
+        self.misses = 0
+        self.nbytes = 0
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _pop(self, key: Hashable) -> None:
+        entry = self._data.pop(key, None)
+        if entry is not None:
+            self.nbytes -= entry[2]
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None:
+                value, expires_at, _ = entry
+                if expires_at is None or expires_at > time.monotonic():
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return value
+                self._pop(key)
+            self.misses += 1
+            return default
+
+    def set(self, key: Hashable, value: Any) -> None:
+        expires_at = time.monotonic() + self.ttl if self.ttl is not None else None
+        weight = self.weigh(value) if self.maxbytes is not None else 0
+        with self._lock:
+            self._pop(key)
+            if self.maxbytes is not None and weight > self.maxbytes:
+                return
+            self._data[key] = (value, expires_at, weight)
+            self.nbytes += weight
+            while len(self._data) > self.maxsize or (self.maxbytes is not None and self.nbytes > self.maxbytes):
+                self._pop(next(iter(self._data)))
+
+    def discard(self, key: Hashable) -> None:
+        with self._lock:
+            self._pop(key)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+            self.nbytes = 0
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def stats(self) -> Dict[str, int]:
+        stats = {"size": len(self._data), "hits": self.hits, "misses": self.misses}
+        if self.maxbytes is not None:
+            stats["bytes"] = self.nbytes
+        return stats
+
+
+class CachedBody(NamedTuple):
+    """An encoded JSON response with its validators"""
+    body: bytes
+    etag: str
+    last_modified: Optional[str] = None
+
+
+class Generation:
+    """Counter bumped whenever the rows behind a cache change.
+
+    Keying entries on the current value makes every older entry unreachable at
+    once, without walking the cache; the orphans age out through LRU/TTL.
+    """
+
+    def __init__(self):
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def bump(self) -> None:
+        with self._lock:
+            self.value += 1
+
+
+# session_id -> completed flag for sessions known to exist, so ingest endpoints can skip the
+# parent lookup and only touch updated_at for completed ones. Per process: a completion
+# handled by another worker is seen here within the TTL.
+known_sessions = TTLCache(settings.session_cache_size, settings.session_cache_ttl)
+
+# Pupil summaries of completed sessions, keyed by session_id. Per process: late samples
+# written through another worker (or its stream / write-behind flush) show up within the TTL.
+pupil_summaries = TTLCache(settings.pupil_summary_cache_size, settings.pupil_summary_cache_ttl)
+
+# Encoded GET bodies of completed sessions, keyed by (view, session_id) and bounded by total size.
+# Per process: a late write handled by another worker shows up within the TTL.
+SESSION_VIEWS = ("session", "session+trial_responses", "responses")
+session_bodies = TTLCache(
+    settings.session_body_cache_size,
+    settings.session_body_cache_ttl,
+    maxbytes=settings.session_body_cache_bytes,
+    weigh=lambda entry: len(entry.body),
+)
+
+# session_ids this process wrote recently; reads for them skip the replicas
+recent_writes = TTLCache(settings.session_cache_size, settings.read_your_writes_window)
+
+# Study-wide analytics results, keyed by (endpoint, params, analytics_generation.value).
+# The generation is per process, so the TTL bounds staleness from other workers' writes.
+analytics_cache = TTLCache(settings.analytics_cache_size, settings.analytics_cache_ttl)
+analytics_generation = Generation()
+
+
+def invalidate_session(session_id: str) -> None:
+    """Drop derived data cached for a session after its rows change"""
+    pupil_summaries.discard(session_id)
+    for view in SESSION_VIEWS:
+        session_bodies.discard((view, session_id))
+    recent_writes.set(session_id, True)
@@ -0,0 +1,145 @@
+"""Response compression negotiated via ``Accept-Encoding``.
+
+zstd is preferred when the client accepts it and the ``zstandard`` package is
+installed, gzip otherwise. Single-body responses smaller than
+``compression_min_size`` are sent as is: below that the CPU cost outweighs
+the bytes saved. Streaming responses (exports) are compressed chunk by chunk.
+
+A compressed body is no longer byte-identical to the uncompressed one, so its
+strong ``ETag`` is sent weak (``W/"..."``); ``If-None-Match`` in
+``app.main`` uses weak comparison, so revalidation still matches either form.
+"""
+import zlib
+from typing import Optional
+
+from app.config import settings
+
+try:
+    import zstandard
+except ImportError:  # zstd is optional; gzip is always available
+    zstandard = None
+
+# Content types that are already compressed or must not be buffered
+SKIP_CONTENT_TYPES = (b"application/octet-stream", b"text/event-stream", b"image/", b"application/zip")
+
+
+def _accepted(header: str) -> dict:
+    """Parse an Accept-Encoding header into {coding: q}"""
+    accepted = {}
+    for part in header.split(","):
+        coding, _, params = part.strip().partition(";")
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        if coding:
+            accepted[coding.strip().lower()] = q
+    return accepted
+
+
+def choose_encoding(header: str) -> Optional[str]:
+    accepted = _accepted(header)
+    wildcard = accepted.get("*", 0.0)
+    candidates = ["zstd", "gzip"] if zstandard is not None else ["gzip"]
+    best, best_q = None, 0.0
+    for coding in candidates:
+        q = accepted.get(coding, wildcard)
+        if q > best_q:
+            best, best_q = coding, q
+    return best
+
+
+def _weak_etag(headers: list) -> list:
+    return [(k, b"W/" + v if k == b"etag" and not v.startswith(b"W/") else v) for k, v in headers]
+
+
+class _Compressor:
+    def __init__(self, encoding: str):
+        if encoding == "zstd":
+            self._obj = zstandard.ZstdCompressor(level=settings.compression_zstd_level).compressobj()
+            self._finish = lambda: self._obj.flush(zstandard.COMPRESSOBJ_FLUSH_FINISH)
+        else:
+            self._obj = zlib.compressobj(settings.compression_gzip_level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+            self._finish = self._obj.flush
+
+    def compress(self, data: bytes) -> bytes:
+        return self._obj.compress(data)
+
+    def finish(self) -> bytes:
+        return self._finish()
+
+
+class CompressionMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        encoding = None
+        for name, value in scope["headers"]:
+            if name == b"accept-encoding":
+                encoding = choose_encoding(value.decode("latin-1"))
+                break
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start_message = None
+        compressor: Optional[_Compressor] = None
+        passthrough = False
+
+        async def send_wrapper(message):
+            nonlocal start_message, compressor, passthrough
+            if message["type"] == "http.response.start":
+                headers = message.get("headers", [])
+                if message["status"] == 304:
+                    # Must carry the validator the compressed 200 would have sent
+                    await send({**message, "headers": _weak_etag(headers)})
+                    passthrough = True
+                    return
+                content_type = next((v for k, v in headers if k == b"content-type"), b"")
+                if any(k == b"content-encoding" for k, _ in headers) or content_type.startswith(SKIP_CONTENT_TYPES):
+                    passthrough = True
+                    await send(message)
+                else:
+                    # Hold the start until the first body chunk shows whether compression pays off
+                    start_message = message
+                return
+            if passthrough or message["type"] != "http.response.body":
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+            if start_message is not None:
+                start, start_message = start_message, None
+                if not more_body and len(body) < settings.compression_min_size:
+                    passthrough = True
+                    await send(start)
+                    await send(message)
+                    return
+                compressor = _Compressor(encoding)
+                headers = [(k, v) for k, v in _weak_etag(start.get("headers", [])) if k not in (b"content-length", b"vary")]
+                vary = [v for k, v in start.get("headers", []) if k == b"vary"]
+                headers.append((b"content-encoding", encoding.encode()))
+                headers.append((b"vary", b", ".join(vary + [b"Accept-Encoding"])))
+                if not more_body:
+                    compressed = compressor.compress(body) + compressor.finish()
+                    headers.append((b"content-length", str(len(compressed)).encode()))
+                    await send({**start, "headers": headers})
+                    await send({"type": "http.response.body", "body": compressed})
+                    return
+                await send({**start, "headers": headers})
+
+            chunk = compressor.compress(body)
+            if not more_body:
+                chunk += compressor.finish()
+            if chunk or not more_body:
+                await send({"type": "http.response.body", "body": chunk, "more_body": more_body})
+
+        await self.app(scope, receive, send_wrapper)
@@ -1,5 +1,6 @@
 from pydantic_settings import BaseSettings
-from typing import List
+from sqlalchemy.engine import make_url
+from typing import List, Literal
 from urllib.parse import quote_plus
 
 
@@ -9,17 +10,128 @@ class Settings(BaseSettings):
     db_user: str = "root"
     db_password: str = "password"
     db_name: str = "pupil_study"
+    # Full SQLAlchemy URL, overriding the db_* fields (e.g. sqlite:///bench.db for local runs)
+    db_url: str = ""
+    db_backend: Literal["mysql", "sqlite"] = "mysql"
+    db_sqlite_path: str = "pupil_study.db"
+    # Connection pool, per worker process: keep workers * (size + overflow) under the
+    # server's max_connections (see benchmarks/pool_sizing.py)
+    db_pool_size: int = 10
+    db_max_overflow: int = 20
+    db_pool_recycle: int = 3600
+    db_pool_timeout: float = 30.0
+    db_pool_pre_ping: bool = True
+    # CA bundle for MySQL TLS; empty connects without SSL
+    db_ssl_ca: str = "/etc/ssl/do-mysql-ca.crt"
+    # Read replicas (comma-separated URLs) for read-only endpoints. A replica that fails
+    # is skipped for db_replica_retry_interval seconds; sessions written by this process
+    # in the last read_your_writes_window seconds are read from the primary.
+    db_replica_urls: str = ""
+    db_replica_retry_interval: float = 30.0
+    read_your_writes_window: float = 5.0
+    # Startup: compare schema_version with the code (off | warn | strict) and open this
+    # many pooled connections before serving
+    schema_check: Literal["off", "warn", "strict"] = "warn"
+    db_pool_warmup: int = 0
     cors_origins: str = "http://localhost:3000"
+    # Async mode uses an asyncio MySQL driver with AsyncSession; otherwise DB
+    # calls run on a thread pool (0 = size it to the connection pool)
+    db_async: bool = False
+    db_async_driver: str = "aiomysql"
+    db_thread_pool_size: int = 0
+    eye_tracking_max_batch_size: int = 10000
+    eye_tracking_max_page_size: int = 10000
+    event_log_max_page_size: int = 5000
+    # event_data keys stored as indexed generated columns, as name:int|float|str pairs
+    # (e.g. "trial_id:int,element:str"); apply with `python -m app.migrate`
+    event_log_promoted_keys: str = ""
+    session_cache_size: int = 10000
+    session_cache_ttl: float = 300.0
+    # Idempotency-Key results are kept in the database for this long
+    idempotency_ttl: float = 600.0
+    export_batch_size: int = 2000
+    pupil_baseline_ms: int = 500
+    pupil_summary_cache_size: int = 256
+    pupil_summary_cache_ttl: float = 300.0
+    # Encoded GET bodies of completed sessions (LRU bounded by entries and total bytes)
+    session_body_cache_size: int = 2048
+    session_body_cache_bytes: int = 64 * 1024 * 1024
+    session_body_cache_ttl: float = 300.0
+    # In-memory trial catalog: reload interval to pick up other workers' edits (0 = never),
+    # and Cache-Control max-age for GET /api/trials
+    trial_catalog_refresh_interval: float = 60.0
+    trial_catalog_max_age: int = 60
+    # Study-wide analytics responses; other workers' writes show up within the TTL
+    analytics_cache_size: int = 512
+    analytics_cache_ttl: float = 30.0
+    # WebSocket streaming ingest
+    ws_flush_interval: float = 0.5
+    ws_flush_batch_size: int = 2000
+    ws_max_buffered_rows: int = 20000
+    # Columnar archive of completed sessions' eye tracking samples
+    archive_dir: str = "archive"
+    archive_on_complete: bool = False
+    # Post-completion preprocessing of eye tracking samples in a process pool
+    preprocessing_enabled: bool = False
+    preprocess_workers: int = 2
+    preprocess_dir: str = "preprocessed"
+    preprocess_rate_hz: float = 60.0
+    preprocess_lowpass_hz: float = 4.0
+    preprocess_blink_padding_ms: float = 100.0
+    preprocess_max_gap_ms: float = 500.0
+    preprocess_poll_interval: float = 10.0
+    preprocess_lease_seconds: float = 600.0
+    preprocess_max_attempts: int = 3
+    # Write-behind: acknowledge event logs / eye tracking once spooled locally
+    write_behind_enabled: bool = False
+    write_behind_spool_dir: str = "spool"
+    write_behind_batch_size: int = 1000
+    write_behind_flush_interval: float = 1.0
+    write_behind_fsync: bool = False
+    # Reject writes (503) while this many rows are waiting for the database
+    write_behind_max_pending_rows: int = 100000
+    # Prometheus /metrics (set PROMETHEUS_MULTIPROC_DIR when running several workers)
+    metrics_enabled: bool = True
+    # Compress responses above this many bytes (zstd when accepted, else gzip)
+    compression_enabled: bool = True
+    compression_min_size: int = 1024
+    compression_gzip_level: int = 6
+    compression_zstd_level: int = 3
+    # Sampling profiler: profile this fraction of requests, plus any carrying profile_header
+    profiling_enabled: bool = False
+    profile_sample_rate: float = 0.0
+    profile_header: str = "X-Profile"
+    profile_dir: str = "profiles"
+    profile_interval: float = 0.001
+    # Log statements slower than this many milliseconds (0 = off)
+    slow_query_ms: float = 0.0
     
     class Config:
         env_file = ".env"
     
     @property
     def database_url(self) -> str:
+        if self.db_url:
+            return self.db_url
+        if self.db_backend == "sqlite":
+            return f"sqlite:///{self.db_sqlite_path}"
         # URL-encode the password to handle special characters like @
         encoded_password = quote_plus(self.db_password)
         return f"mysql+pymysql://{self.db_user}:{encoded_password}@{self.db_host}:{self.db_port}/{self.db_name}"
     
+    @property
+    def async_database_url(self) -> str:
+        url = make_url(self.database_url)
+        if url.get_backend_name() == "sqlite":
+            driver = "sqlite+aiosqlite"
+        else:
+            driver = f"mysql+{self.db_async_driver}"
+        return url.set(drivername=driver).render_as_string(hide_password=False)
+    
+    @property
+    def db_replica_urls_list(self) -> List[str]:
+        return [url.strip() for url in self.db_replica_urls.split(",") if url.strip()]
+    
     @property
     def cors_origins_list(self) -> List[str]:
         # return [origin.strip() for origin in self.cors_origins.split(",")]
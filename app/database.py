@@ -1,33 +1,341 @@
-from sqlalchemy import create_engine
+import asyncio
+import contextvars
+import itertools
+import logging
+import ssl
+import time
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, List, Optional, Sequence
+
+from fastapi import Request
+from sqlalchemy import and_, create_engine, event, or_
+from sqlalchemy.engine import make_url
+from sqlalchemy.exc import OperationalError, TimeoutError as PoolTimeoutError
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import Session, sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+from app.cache import recent_writes
 from app.config import settings
+from app.metrics import instrument_engine, timed_pool
+from app.profiling import install_slow_query_log
 
-# engine = create_engine(settings.database_url)
+logger = logging.getLogger(__name__)
 
-SSL_CA_PATH = "/etc/ssl/do-mysql-ca.crt"
 
-engine = create_engine(
-    settings.database_url,
-    pool_pre_ping=True,
-    pool_size=10,
-    max_overflow=20,
-    connect_args={
-        "ssl": {
-            "ca": SSL_CA_PATH
-        }
-    },
-)
+def _connect_args(url: str) -> dict:
+    backend = make_url(url).get_backend_name()
+    if backend == "mysql":
+        if not settings.db_ssl_ca:
+            return {}
+        if make_url(url).get_driver_name() == "pymysql":
+            return {"ssl": {"ca": settings.db_ssl_ca}}
+        # asyncio drivers take an SSLContext
+        return {"ssl": ssl.create_default_context(cafile=settings.db_ssl_ca)}
+    if backend == "sqlite":
+        # Sessions are used from the db_executor threads
+        return {"check_same_thread": False}
+    return {}
+
+
+def make_engine(url: str, name: str):
+    """Create a sync engine with the configured pool, instrumented for metrics and the slow-query log"""
+    engine = create_engine(
+        url,
+        pool_pre_ping=settings.db_pool_pre_ping,
+        pool_size=settings.db_pool_size,
+        max_overflow=settings.db_max_overflow,
+        pool_recycle=settings.db_pool_recycle,
+        pool_timeout=settings.db_pool_timeout,
+        poolclass=timed_pool(QueuePool, name),
+        connect_args=_connect_args(url),
+    )
+    instrument_engine(engine, name)
+    install_slow_query_log(engine)
+    if engine.dialect.name == "sqlite":
+        _explicit_sqlite_transactions(engine)
+    return engine
+
 
+def _explicit_sqlite_transactions(engine) -> None:
+    """Let SQLAlchemy emit BEGIN itself instead of pysqlite.
+
+    pysqlite only opens a transaction before DML, so a SAVEPOINT issued
+    first (``Session.begin_nested``) runs outside one and its RELEASE
+    commits. This is SQLAlchemy's documented workaround.
+    """
+    @event.listens_for(engine, "connect")
+    def disable_pysqlite_begin(dbapi_connection, connection_record):
+        dbapi_connection.isolation_level = None
+
+    @event.listens_for(engine, "begin")
+    def begin(conn):
+        if conn.get_execution_options().get("isolation_level") != "AUTOCOMMIT":
+            # On the driver connection, so it is not counted as a statement (MySQL's BEGIN is implicit too)
+            conn.connection.driver_connection.execute("BEGIN")
+
+
+engine = make_engine(settings.database_url, "primary")
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 Base = declarative_base()
 
+# Async mode: same pool sizing, but connections are driven by an asyncio driver
+async_engine = None
+AsyncSessionLocal = None
+if settings.db_async:
+    from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+    async_engine = create_async_engine(
+        settings.async_database_url,
+        pool_pre_ping=settings.db_pool_pre_ping,
+        pool_size=settings.db_pool_size,
+        max_overflow=settings.db_max_overflow,
+        pool_recycle=settings.db_pool_recycle,
+        pool_timeout=settings.db_pool_timeout,
+        poolclass=timed_pool(AsyncAdaptedQueuePool, "primary_async"),
+        connect_args=_connect_args(settings.async_database_url),
+    )
+    instrument_engine(async_engine.sync_engine, "primary_async")
+    install_slow_query_log(async_engine.sync_engine)
+    AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False)
+
+# Read replicas: always driven through the thread pool, whatever db_async says
+replica_engines = [
+    make_engine(url, f"replica_{index}") for index, url in enumerate(settings.db_replica_urls_list)
+]
+ReplicaSessionLocals = [
+    sessionmaker(autocommit=False, autoflush=False, bind=replica) for replica in replica_engines
+]
+
+# Sync fallback: DB work runs on a dedicated thread pool sized to the connection
+# pool, so concurrency scales with available connections instead of the event loop
+db_executor = ThreadPoolExecutor(
+    max_workers=settings.db_thread_pool_size or settings.db_pool_size + settings.db_max_overflow,
+    thread_name_prefix="db",
+)
+
+
+def dialect_insert(db: Session, model):
+    """Return an INSERT construct with the dialect's upsert extensions (MySQL or SQLite)"""
+    if db.get_bind().dialect.name == "mysql":
+        from sqlalchemy.dialects.mysql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+    return insert(model)
+
+
+def _after(columns: Sequence, values: Sequence):
+    (column, *rest_columns), (value, *rest_values) = columns, values
+    if not rest_columns:
+        return column > value
+    return or_(column > value, and_(column == value, _after(rest_columns, rest_values)))
+
+
+def keyset_after(columns: Sequence, values: Sequence):
+    """``(c1, c2, ...) > (v1, v2, ...)`` written out as nested OR/AND comparisons.
+
+    MySQL's range optimizer ignores row-constructor inequalities, which turns a
+    deep keyset page into a scan from the start of the index prefix. The
+    expanded form, with a redundant ``c1 >= v1`` bound, is a set of index
+    ranges on both MySQL and SQLite.
+    """
+    return and_(columns[0] >= values[0], _after(columns, values))
+
+
+class Database(ABC):
+    """Request-scoped database handle.
+
+    Endpoint code is written as plain functions taking a sync ``Session`` and is
+    awaited through ``run``, so the event loop never blocks on a DB round trip.
+    """
+
+    # True when the last ``run`` was answered by a read replica, which may lag the primary
+    from_replica = False
+
+    @abstractmethod
+    async def run(self, fn: Callable[..., Any], *args: Any) -> Any:
+        """Run ``fn(session, *args)`` and return its result"""
+
+    @abstractmethod
+    async def close(self) -> None:
+        """Release the underlying session"""
+
+
+class AsyncDatabase(Database):
+    """Runs ORM code on an ``AsyncSession`` backed by an async driver"""
+
+    def __init__(self, session):
+        self.session = session
+
+    async def run(self, fn, *args):
+        return await self.session.run_sync(fn, *args)
+
+    async def close(self):
+        await self.session.close()
+
+
+class ThreadedDatabase(Database):
+    """Runs ORM code for sync drivers on the bounded ``db_executor`` pool"""
+
+    def __init__(self, session: Session):
+        self.session = session
+
+    async def run(self, fn, *args):
+        loop = asyncio.get_running_loop()
+        ctx = contextvars.copy_context()
+        return await loop.run_in_executor(db_executor, ctx.run, fn, self.session, *args)
+
+    async def close(self):
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(db_executor, self.session.close)
+
+
+class ReplicaRouter:
+    """Round-robin over the replicas that are not marked down"""
 
-def get_db():
-    db = SessionLocal()
+    def __init__(self, count: int, retry_interval: float):
+        self.retry_interval = retry_interval
+        self._down_until = [0.0] * count
+        self._counter = itertools.count()
+
+    def pick(self) -> Optional[int]:
+        """Index of the next healthy replica, or None when all are down"""
+        now = time.monotonic()
+        for _ in range(len(self._down_until)):
+            index = next(self._counter) % len(self._down_until)
+            if self._down_until[index] <= now:
+                return index
+        return None
+
+    def mark_down(self, index: int) -> None:
+        self._down_until[index] = time.monotonic() + self.retry_interval
+
+    def healthy(self) -> List[bool]:
+        now = time.monotonic()
+        return [down_until <= now for down_until in self._down_until]
+
+
+replica_router = ReplicaRouter(len(replica_engines), settings.db_replica_retry_interval)
+
+
+class ReplicaDatabase(Database):
+    """Runs read-only ORM code on a replica, retrying on the primary if the replica fails.
+
+    Only safe for functions that do not write: a failed call is simply run again.
+    """
+
+    def __init__(self, index: int):
+        self.index = index
+        self.replica: Optional[Database] = ThreadedDatabase(ReplicaSessionLocals[index]())
+        self.primary: Optional[Database] = None
+
+    async def run(self, fn, *args):
+        if self.replica is not None:
+            try:
+                result = await self.replica.run(fn, *args)
+                self.from_replica = True
+                return result
+            except (OperationalError, PoolTimeoutError) as exc:
+                if isinstance(exc, OperationalError):
+                    # Unreachable or broken: stop routing to it for a while
+                    replica_router.mark_down(self.index)
+                logger.warning("Replica %d failed (%s); falling back to the primary", self.index, exc)
+                replica, self.replica = self.replica, None
+                await replica.close()
+        if self.primary is None:
+            self.primary = open_database()
+        self.from_replica = False
+        return await self.primary.run(fn, *args)
+
+    async def close(self):
+        for db in (self.replica, self.primary):
+            if db is not None:
+                await db.close()
+
+
+def open_database() -> Database:
+    """Open a database handle for the configured mode"""
+    if AsyncSessionLocal is not None:
+        return AsyncDatabase(AsyncSessionLocal())
+    return ThreadedDatabase(SessionLocal())
+
+
+async def get_db():
+    db = open_database()
     try:
         yield db
     finally:
-        db.close()
+        await db.close()
+
+
+def open_read_database(session_id: Optional[str] = None) -> Database:
+    """Open a handle for read-only work on a healthy replica, or the primary.
+
+    Sessions this process wrote in the last ``read_your_writes_window`` seconds
+    are read from the primary so a client never reads behind its own writes.
+    """
+    if not ReplicaSessionLocals or (session_id is not None and recent_writes.get(session_id)):
+        return open_database()
+    index = replica_router.pick()
+    if index is None:
+        return open_database()
+    return ReplicaDatabase(index)
+
+
+def open_read_session(session_ids: Optional[List[str]] = None) -> Session:
+    """Sync session for long read-only work (exports): a healthy replica unless a session was just written"""
+    if ReplicaSessionLocals and not any(recent_writes.get(session_id) for session_id in session_ids or ()):
+        index = replica_router.pick()
+        if index is not None:
+            return ReplicaSessionLocals[index]()
+    return SessionLocal()
+
+
+async def get_read_db(request: Request):
+    """Dependency for read-only endpoints: routes to the replicas when configured"""
+    db = open_read_database(request.path_params.get("session_id"))
+    try:
+        yield db
+    finally:
+        await db.close()
+
+
+def _open_connections(target, count: int) -> None:
+    held = []
+    try:
+        for _ in range(count):
+            held.append(target.connect())
+    finally:
+        for conn in held:
+            conn.close()
+
+
+async def warm_up_pools(connections: int) -> None:
+    """Open up to ``connections`` pooled connections per engine so first requests skip the connect"""
+    count = min(connections, settings.db_pool_size)
+    if async_engine is not None:
+        held = [await async_engine.connect() for _ in range(count)]
+        for conn in held:
+            await conn.close()
+    loop = asyncio.get_running_loop()
+    for target in ([engine] if async_engine is None else []) + replica_engines:
+        await loop.run_in_executor(db_executor, _open_connections, target, count)
+
+
+def dispose_after_fork() -> None:
+    """Drop pooled connections inherited from a parent process without closing them on its behalf"""
+    for target in [engine, *replica_engines]:
+        target.dispose(close=False)
+    if async_engine is not None:
+        async_engine.sync_engine.dispose(close=False)
+
+
+async def run_in_session(fn: Callable[..., Any], *args: Any) -> Any:
+    """Run ``fn(session, *args)`` in a fresh session outside of a request"""
+    db = open_database()
+    try:
+        return await db.run(fn, *args)
+    finally:
+        await db.close()
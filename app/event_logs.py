@@ -0,0 +1,152 @@
+"""Filtered, keyset-paginated reads of event logs and promoted ``event_data`` keys.
+
+Pages always belong to one session and are ordered by (timestamp, id), which
+the composite ``(session_id, timestamp, id)`` index serves as a range scan;
+with an event_type filter the ``(session_id, event_type, timestamp)`` index
+does. The cursor is the (timestamp, id) of the last row returned, so a page
+costs the same no matter how deep it is.
+
+``event_data`` is free-form JSON, and filtering on a key inside it means
+parsing every candidate row. Keys listed in ``EVENT_LOG_PROMOTED_KEYS``
+(``name:type`` pairs, e.g. ``trial_id:int,element:str``) become virtual
+generated columns named ``data_<name>``, each indexed together with
+session_id and timestamp. ``python -m app.migrate`` adds the columns and
+indexes for the configured keys. The database computes them on insert, so
+the write path does not change. Only promoted keys can be filtered on.
+"""
+import re
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from sqlalchemy import BigInteger, Float, String, column, inspect, select, text
+from sqlalchemy.engine import Connection
+from sqlalchemy.orm import Session as DBSession
+
+from app.config import settings
+from app.database import keyset_after
+from app.models import EventLog
+
+TYPES = {"int": BigInteger(), "float": Float(), "str": String(255)}
+_NAME = re.compile(r"^[A-Za-z_][A-Za-z0-9_]{0,50}$")
+
+
+class PromotedKey(NamedTuple):
+    name: str
+    type: str
+
+    @property
+    def column(self) -> str:
+        return f"data_{self.name}"
+
+    @property
+    def index(self) -> str:
+        return f"ix_event_logs_data_{self.name}"
+
+    def parse(self, value: str):
+        return int(value) if self.type == "int" else float(value) if self.type == "float" else value
+
+
+def promoted_keys(spec: Optional[str] = None) -> Dict[str, PromotedKey]:
+    """Parse ``EVENT_LOG_PROMOTED_KEYS``; key names end up in DDL, so they must be plain identifiers"""
+    keys = {}
+    for item in (settings.event_log_promoted_keys if spec is None else spec).split(","):
+        if not item.strip():
+            continue
+        name, _, type_ = item.strip().partition(":")
+        type_ = type_ or "str"
+        if not _NAME.match(name) or type_ not in TYPES:
+            raise ValueError(f"Invalid promoted event_data key {item!r}; expected name:int|float|str")
+        keys[name] = PromotedKey(name, type_)
+    return keys
+
+
+PROMOTED_KEYS = promoted_keys()
+
+
+def _generated_expression(dialect: str, key: PromotedKey) -> str:
+    path = f"'$.{key.name}'"
+    if dialect == "mysql":
+        value = f"event_data->>{path}"
+        if key.type == "int":
+            return f"CAST({value} AS SIGNED)"
+        if key.type == "float":
+            return f"CAST({value} AS DOUBLE)"
+        return f"CAST({value} AS CHAR(255))"
+    return f"json_extract(event_data, {path})"
+
+
+def missing_columns(conn: Connection) -> List[PromotedKey]:
+    existing = {c["name"] for c in inspect(conn).get_columns(EventLog.__tablename__)}
+    return [key for key in PROMOTED_KEYS.values() if key.column not in existing]
+
+
+def sync_promoted_columns(conn: Connection) -> List[str]:
+    """Add generated columns and indexes for configured keys that don't have them yet.
+
+    Columns for keys removed from the setting are left in place; drop them by hand.
+    """
+    dialect = conn.dialect.name
+    table = EventLog.__tablename__
+    added = []
+    for key in missing_columns(conn):
+        column_type = TYPES[key.type].compile(conn.dialect)
+        conn.execute(text(
+            f"ALTER TABLE {table} ADD COLUMN {key.column} {column_type} "
+            f"GENERATED ALWAYS AS ({_generated_expression(dialect, key)}) VIRTUAL"
+        ))
+        added.append(key.column)
+    indexes = {index["name"] for index in inspect(conn).get_indexes(table)}
+    for key in PROMOTED_KEYS.values():
+        if key.index not in indexes:
+            conn.execute(text(f"CREATE INDEX {key.index} ON {table} ({key.column}, session_id, timestamp)"))
+    return added
+
+
+def encode_cursor(row: Dict) -> str:
+    return f"{row['timestamp']}:{row['id']}"
+
+
+def decode_cursor(cursor: str) -> Tuple[int, int]:
+    try:
+        timestamp, row_id = cursor.split(":")
+        return int(timestamp), int(row_id)
+    except ValueError:
+        raise ValueError(f"Malformed cursor {cursor!r}")
+
+
+def read_page(
+    db: DBSession,
+    session_id: str,
+    event_type: Optional[str] = None,
+    start: Optional[int] = None,
+    end: Optional[int] = None,
+    data: Optional[Dict[str, str]] = None,
+    cursor: Optional[str] = None,
+    limit: int = 1000,
+) -> Tuple[List[Dict], Optional[str]]:
+    """Read one page of a session's events ordered by (timestamp, id).
+
+    ``data`` maps promoted key names to the value to match. Returns the rows
+    and the cursor for the next page (None on the last page).
+    """
+    table = EventLog.__table__
+    stmt = select(table).where(table.c.session_id == session_id)
+    if event_type is not None:
+        stmt = stmt.where(table.c.event_type == event_type)
+    if start is not None:
+        stmt = stmt.where(table.c.timestamp >= start)
+    if end is not None:
+        stmt = stmt.where(table.c.timestamp <= end)
+    for name, value in (data or {}).items():
+        key = PROMOTED_KEYS.get(name)
+        if key is None:
+            raise LookupError(f"event_data.{name} is not a promoted key; add it to EVENT_LOG_PROMOTED_KEYS")
+        stmt = stmt.where(column(key.column) == key.parse(value))
+    if cursor is not None:
+        stmt = stmt.where(keyset_after((table.c.timestamp, table.c.id), decode_cursor(cursor)))
+
+    stmt = stmt.order_by(table.c.timestamp, table.c.id).limit(limit + 1)
+    rows = [dict(row) for row in db.execute(stmt).mappings()]
+    if len(rows) > limit:
+        rows = rows[:limit]
+        return rows, encode_cursor(rows[-1])
+    return rows, None
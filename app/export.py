@@ -0,0 +1,99 @@
+"""Streaming NDJSON/CSV export of session data.
+
+Rows are read through server-side cursors (``yield_per``) and written out one
+partition at a time, so memory stays flat regardless of session size.
+"""
+import csv
+import io
+import json
+from datetime import date, datetime
+from typing import Iterator, List
+
+from sqlalchemy import select
+
+from app.archive import iter_archived_rows
+from app.config import settings
+from app.database import open_read_session
+from app.models import (
+    StudySession,
+    TrialResponse,
+    FeedbackResponse,
+    SAMResponse,
+    TLXResponse,
+    EventLog,
+    EyeTrackingData,
+)
+
+EXPORT_MODELS = [
+    StudySession,
+    TrialResponse,
+    FeedbackResponse,
+    SAMResponse,
+    TLXResponse,
+    EventLog,
+    EyeTrackingData,
+]
+
+MEDIA_TYPES = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv",
+}
+
+
+def _encode_value(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return value
+
+
+def _iter_partitions(session_ids: List[str]) -> Iterator:
+    """Yield (table name, column names, rows) for every table, one cursor partition at a time"""
+    db = open_read_session(session_ids)
+    try:
+        for model in EXPORT_MODELS:
+            table = model.__table__
+            columns = [column.name for column in table.columns]
+            stmt = (
+                select(table)
+                .where(table.c.session_id.in_(session_ids))
+                .order_by(table.c.session_id, table.c.id)
+                .execution_options(yield_per=settings.export_batch_size)
+            )
+            for partition in db.execute(stmt).partitions():
+                yield table.name, columns, partition
+            if model is EyeTrackingData:
+                # Samples of archived sessions live in the columnar archive, not the table
+                for rows in iter_archived_rows(db, session_ids, columns, settings.export_batch_size):
+                    yield table.name, columns, rows
+    finally:
+        db.close()
+
+
+def stream_ndjson(session_ids: List[str]) -> Iterator[str]:
+    for table, columns, rows in _iter_partitions(session_ids):
+        yield "".join(
+            json.dumps({"table": table, **{col: _encode_value(val) for col, val in zip(columns, row)}}) + "\n"
+            for row in rows
+        )
+
+
+def stream_csv(session_ids: List[str]) -> Iterator[str]:
+    # Tables have different columns, so each table section starts with its own header row
+    current_table = None
+    for table, columns, rows in _iter_partitions(session_ids):
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        if table != current_table:
+            writer.writerow(["table", *columns])
+            current_table = table
+        for row in rows:
+            writer.writerow([table, *(
+                json.dumps(val) if isinstance(val, (dict, list)) else _encode_value(val) for val in row
+            )])
+        yield buffer.getvalue()
+
+
+STREAMERS = {
+    "ndjson": stream_ndjson,
+    "csv": stream_csv,
+}
@@ -0,0 +1,165 @@
+"""Eye tracking ingest helpers: packed binary codec and bulk inserts"""
+import struct
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from sqlalchemy import insert, select
+from sqlalchemy.orm import Session as DBSession
+
+from app.database import keyset_after
+from app.models import EyeTrackingData
+from app.trial_stats import record_eye_tracking
+
+# Packed payload layout (little endian):
+#   header:  magic (4s) | session_id byte length (uint16) | trial_id (int32)
+#   body:    session_id (utf-8), then N fixed-width records
+#   record:  timestamp (int64 ms) | gaze_x (float32) | gaze_y (float32) | pupil_diameter (float32)
+# Missing gaze/pupil values are encoded as NaN.
+PACKED_MAGIC = b"ETK1"
+PACKED_CONTENT_TYPE = "application/octet-stream"
+HEADER = struct.Struct("<4sHi")
+RECORD_DTYPE = np.dtype([
+    ("timestamp", "<i8"),
+    ("gaze_x", "<f4"),
+    ("gaze_y", "<f4"),
+    ("pupil_diameter", "<f4"),
+])
+VALUE_FIELDS = ("gaze_x", "gaze_y", "pupil_diameter")
+
+
+class PackedFormatError(ValueError):
+    """Raised when a packed eye tracking payload is malformed or invalid"""
+
+
+def encode_samples(session_id: str, trial_id: int, records: np.ndarray) -> bytes:
+    """Pack a RECORD_DTYPE array into the binary upload format"""
+    session_bytes = session_id.encode("utf-8")
+    header = HEADER.pack(PACKED_MAGIC, len(session_bytes), trial_id)
+    return header + session_bytes + np.ascontiguousarray(records, dtype=RECORD_DTYPE).tobytes()
+
+
+def decode_samples(payload: bytes) -> Tuple[str, int, np.ndarray]:
+    """Decode a packed payload into (session_id, trial_id, records).
+
+    The records array is a read-only view over ``payload``; no sample data is copied.
+    """
+    if len(payload) < HEADER.size:
+        raise PackedFormatError("Payload shorter than header")
+    magic, session_len, trial_id = HEADER.unpack_from(payload)
+    if magic != PACKED_MAGIC:
+        raise PackedFormatError("Bad magic")
+
+    offset = HEADER.size + session_len
+    if len(payload) < offset:
+        raise PackedFormatError("Truncated session_id")
+    try:
+        session_id = payload[HEADER.size:offset].decode("utf-8")
+    except UnicodeDecodeError:
+        raise PackedFormatError("session_id is not valid utf-8")
+
+    body_len = len(payload) - offset
+    if body_len % RECORD_DTYPE.itemsize:
+        raise PackedFormatError("Body is not a whole number of records")
+
+    records = np.frombuffer(payload, dtype=RECORD_DTYPE, offset=offset)
+    validate_records(records)
+    return session_id, trial_id, records
+
+
+def validate_records(records: np.ndarray) -> None:
+    """Validate every record in one vectorized pass"""
+    if not len(records):
+        return
+    bad = records["timestamp"] <= 0
+    for field in VALUE_FIELDS:
+        bad |= np.isinf(records[field])
+    # NaN compares False, so missing pupil samples pass this check
+    bad |= records["pupil_diameter"] < 0
+    if bad.any():
+        raise PackedFormatError(f"Invalid sample at index {int(np.argmax(bad))}")
+
+
+def _nullable(column: np.ndarray) -> list:
+    """Convert a float column to a list of Python floats with NaN mapped to None"""
+    return np.where(np.isnan(column), None, column.astype(object)).tolist()
+
+
+def records_to_rows(session_id: str, trial_id: int, records: np.ndarray) -> List[Dict]:
+    """Build insert parameter dicts for ``EyeTrackingData`` from decoded records"""
+    timestamps = records["timestamp"].tolist()
+    gaze_x, gaze_y, pupil = (_nullable(records[field]) for field in VALUE_FIELDS)
+    return [
+        {
+            "session_id": session_id,
+            "trial_id": trial_id,
+            "timestamp": ts,
+            "gaze_x": x,
+            "gaze_y": y,
+            "pupil_diameter": p,
+        }
+        for ts, x, y, p in zip(timestamps, gaze_x, gaze_y, pupil)
+    ]
+
+
+def bulk_insert(db: DBSession, rows: List[Dict], commit: bool = True) -> int:
+    """Write eye tracking rows with a single multi-row insert and commit (unless ``commit=False``)"""
+    if rows:
+        db.execute(insert(EyeTrackingData), rows)
+        record_eye_tracking(db, (row["trial_id"] for row in rows))
+    if commit:
+        db.commit()
+    return len(rows)
+
+
+Cursor = Tuple[int, int, int]
+
+
+def encode_cursor(row: Dict) -> str:
+    """Opaque page cursor: the (trial_id, timestamp, id) position of the last row returned"""
+    return f"{row['trial_id']}:{row['timestamp']}:{row['id']}"
+
+
+def decode_cursor(cursor: str) -> Cursor:
+    try:
+        trial_id, timestamp, row_id = cursor.split(":")
+        return int(trial_id), int(timestamp), int(row_id)
+    except ValueError:
+        raise ValueError(f"Malformed cursor {cursor!r}")
+
+
+def read_page(
+    db: DBSession,
+    session_id: str,
+    trial_id: Optional[int] = None,
+    start: Optional[int] = None,
+    end: Optional[int] = None,
+    cursor: Optional[Cursor] = None,
+    limit: int = 1000,
+) -> Tuple[List[Dict], Optional[Cursor]]:
+    """Read one page of samples ordered by (trial_id, timestamp, id).
+
+    Keyset pagination: ``cursor`` is the (trial_id, timestamp, id) of the last
+    row of the previous page and the next page starts strictly after it, so
+    every page is an index range scan on (session_id, trial_id, timestamp) no
+    matter how deep it is. Returns the rows and the cursor for the next page
+    (None on the last page).
+    """
+    table = EyeTrackingData.__table__
+    stmt = select(table).where(table.c.session_id == session_id)
+    if trial_id is not None:
+        stmt = stmt.where(table.c.trial_id == trial_id)
+    if start is not None:
+        stmt = stmt.where(table.c.timestamp >= start)
+    if end is not None:
+        stmt = stmt.where(table.c.timestamp <= end)
+    if cursor is not None:
+        # Expanded rather than a row-value comparison, which MySQL can't use as an index range
+        stmt = stmt.where(keyset_after((table.c.trial_id, table.c.timestamp, table.c.id), cursor))
+
+    stmt = stmt.order_by(table.c.trial_id, table.c.timestamp, table.c.id).limit(limit + 1)
+    rows = [dict(row._mapping) for row in db.execute(stmt)]
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        return rows, (last["trial_id"], last["timestamp"], last["id"])
+    return rows, None
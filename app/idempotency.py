@@ -0,0 +1,118 @@
+"""Database-backed dedup of client retries.
+
+POST handlers accept an ``Idempotency-Key`` header. The key is claimed by
+inserting a row into ``idempotency_keys`` (unique on route and key) in the
+same transaction as the write itself, and the encoded response is stored in
+that row before the commit. Retries, from any worker, either find the
+committed row and get the stored response back, or (while the first request
+is still running) block on the unique index until it commits or rolls back.
+So a key yields exactly one write, or none if the write failed.
+
+The row also records a hash of the request body: reusing a key for a
+different body is a client bug and gets 422 instead of someone else's result.
+Keys expire after ``idempotency_ttl`` seconds; ``python -m app.idempotency
+purge`` deletes expired rows.
+"""
+import argparse
+import hashlib
+import time
+from typing import Any, NamedTuple, Optional
+
+import orjson
+from fastapi import HTTPException
+from fastapi.responses import Response
+from pydantic import BaseModel
+from sqlalchemy import delete, select, update
+from sqlalchemy.orm import Session as DBSession
+
+from app.config import settings
+from app.database import SessionLocal, dialect_insert
+from app.models import IdempotencyKey
+
+MAX_KEY_LENGTH = 255
+
+
+class IdempotencyScope(NamedTuple):
+    route: str
+    key: str
+    request_hash: str
+
+
+def make_scope(route: str, key: str, body: bytes) -> IdempotencyScope:
+    if len(key) > MAX_KEY_LENGTH:
+        raise HTTPException(status_code=400, detail=f"Idempotency-Key is longer than {MAX_KEY_LENGTH} characters")
+    return IdempotencyScope(route, key, hashlib.sha256(body).hexdigest())
+
+
+def _now_ms() -> int:
+    return int(time.time() * 1000)
+
+
+def claim(db: DBSession, scope: Optional[IdempotencyScope]) -> Optional[Response]:
+    """Claim the key in the current transaction.
+
+    Returns None when the caller owns the key and should do the write, or the
+    stored response of the request that already used it.
+    """
+    if scope is None:
+        return None
+    table = IdempotencyKey.__table__
+    now = _now_ms()
+    stmt = dialect_insert(db, IdempotencyKey).values(
+        route=scope.route, key=scope.key, request_hash=scope.request_hash, created_ms=now
+    )
+    # IGNORE / DO NOTHING: a duplicate waits for the other transaction, then reports 0 rows
+    if db.get_bind().dialect.name == "mysql":
+        stmt = stmt.prefix_with("IGNORE")
+    else:
+        stmt = stmt.on_conflict_do_nothing(index_elements=[table.c.route, table.c.key])
+    if db.execute(stmt).rowcount == 1:
+        return None
+
+    same_key = (table.c.route == scope.route, table.c.key == scope.key)
+    # An expired key is taken over as if it were new
+    expired = db.execute(
+        update(table)
+        .where(*same_key, table.c.created_ms < now - int(settings.idempotency_ttl * 1000))
+        .values(request_hash=scope.request_hash, status_code=None, response=None, created_ms=now)
+    )
+    if expired.rowcount == 1:
+        return None
+
+    stored = db.execute(select(table.c.request_hash, table.c.status_code, table.c.response).where(*same_key)).one()
+    if stored.request_hash != scope.request_hash:
+        raise HTTPException(status_code=422, detail="Idempotency-Key was already used with a different request body")
+    return Response(content=stored.response, status_code=stored.status_code, media_type="application/json")
+
+
+def store(db: DBSession, scope: Optional[IdempotencyScope], result: Any, status_code: int = 200) -> None:
+    """Record the response for a claimed key; call before the write's commit"""
+    if scope is None:
+        return
+    payload = result.model_dump() if isinstance(result, BaseModel) else result
+    table = IdempotencyKey.__table__
+    db.execute(
+        update(table)
+        .where(table.c.route == scope.route, table.c.key == scope.key)
+        .values(status_code=status_code, response=orjson.dumps(payload).decode())
+    )
+
+
+def purge_expired(db: DBSession) -> int:
+    """Delete keys older than ``idempotency_ttl``; caller commits"""
+    cutoff = _now_ms() - int(settings.idempotency_ttl * 1000)
+    return db.execute(delete(IdempotencyKey).where(IdempotencyKey.created_ms < cutoff)).rowcount
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Maintain the idempotency_keys table")
+    parser.add_argument("command", choices=["purge"])
+    parser.parse_args()
+    with SessionLocal() as db:
+        count = purge_expired(db)
+        db.commit()
+    print(f"Deleted {count} expired idempotency keys")
+
+
+if __name__ == "__main__":
+    main()
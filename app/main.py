@@ -1,17 +1,48 @@
-from fastapi import FastAPI, Depends, HTTPException, Request
+from fastapi import BackgroundTasks, FastAPI, Depends, Header, HTTPException, Query, Request, WebSocket
 from fastapi.middleware.cors import CORSMiddleware
-from sqlalchemy.orm import Session as DBSession
-from typing import List, Dict, Any
+from fastapi.responses import JSONResponse, ORJSONResponse, Response, StreamingResponse
+from sqlalchemy import func, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session as DBSession, joinedload, selectinload
+from contextlib import asynccontextmanager, contextmanager
+from datetime import datetime, timezone
+from email.utils import format_datetime
+from typing import Iterable, List, Dict, Any, Literal, Optional, Set
 from pydantic import BaseModel
+import hashlib
 import logging
+import numpy as np
+import orjson
 
+from app import analytics, archive, event_logs, metrics, migrate, profiling
+from app.compression import CompressionMiddleware
+from app.cache import (
+    CachedBody,
+    analytics_cache,
+    analytics_generation,
+    invalidate_session,
+    known_sessions,
+    pupil_summaries,
+    session_bodies,
+)
 from app.config import settings
-from app.database import get_db, engine, Base
-from app.models import StudySession, TrialResponse, FeedbackResponse, SAMResponse, TLXResponse, EventLog, EyeTrackingData, Trial
+from app.database import Database, get_db, get_read_db, dialect_insert, run_in_session, warm_up_pools
+from app import idempotency
+from app.idempotency import IdempotencyScope
+from app.pupillometry import summarize_trials
+from app.streaming import EyeTrackingStream
+from app.export import MEDIA_TYPES, STREAMERS
+from app.eye_tracking import PackedFormatError, bulk_insert, decode_cursor, decode_samples, encode_cursor, records_to_rows
+from app.models import StudySession, TrialResponse, FeedbackResponse, SAMResponse, TLXResponse, EventLog, EyeTrackingData, PreprocessingJob, Trial, TrialStats
+from app import trial_stats
+from app.preprocessing import preprocessor, queue_job
+from app.trial_catalog import rescore, score, trial_catalog
+from app.write_behind import WriteBehindFull, write_behind
 from app.schemas import (
     SessionCreate,
     SessionUpdate,
     SessionResponse,
+    SessionSummary,
     TrialResponseCreate,
     TrialResponseSchema,
     FeedbackResponseCreate,
@@ -22,8 +53,19 @@ from app.schemas import (
     TLXResponseSchema,
     EventLogCreate,
     EventLogSchema,
+    EventLogPage,
+    PreprocessingJobSchema,
     EyeTrackingDataCreate,
     EyeTrackingDataSchema,
+    EyeTrackingBatchResponse,
+    EyeTrackingPage,
+    PupilSummaryResponse,
+    TrialStatsSchema,
+    TrialCreate,
+    TrialSchema,
+    TrialAccuracy,
+    ResponseTimeStats,
+    ParticipantQuestionnaires,
 )
 
 
@@ -31,24 +73,36 @@ class HealthResponse(BaseModel):
     status: str
     message: str
 
-# Create database tables
-Base.metadata.create_all(bind=engine)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Tables are created by `python -m app.migrate`, not at import. Under gunicorn the
+    # master has already checked; this covers single-process servers (run.py, uvicorn)
+    if settings.schema_check != "off" and not migrate.schema_checked:
+        await run_in_session(migrate.check_schema)
+    if settings.db_pool_warmup:
+        await warm_up_pools(settings.db_pool_warmup)
+    await trial_catalog.start()
+    if write_behind is not None:
+        await write_behind.start()
+    if preprocessor is not None:
+        await preprocessor.start()
+    yield
+    if preprocessor is not None:
+        await preprocessor.stop()
+    if write_behind is not None:
+        await write_behind.stop()
+    await trial_catalog.stop()
+
 
 app = FastAPI(
     title="Pupil Study API",
     description="Backend API for POCUS Medical Study",
     version="1.0.0",
+    lifespan=lifespan,
+    default_response_class=ORJSONResponse,
 )
 
-# Debug middleware
-@app.middleware("http")
-async def debug_cors(request: Request, call_next):
-    origin = request.headers.get("origin")
-    print(f"Incoming request: {request.method} {request.url.path}")
-    print(f"Origin: {origin}")
-    response = await call_next(request)
-    return response
-
 # CORS middleware
 # Expanded origins to include IP addresses and 127.0.0.1
 origins = [
@@ -73,6 +127,16 @@ app.add_middleware(
     expose_headers=["*"],
 )
 
+if settings.compression_enabled:
+    app.add_middleware(CompressionMiddleware)
+
+if settings.profiling_enabled or settings.slow_query_ms > 0:
+    app.add_middleware(profiling.ProfilingMiddleware)
+
+if settings.metrics_enabled:
+    # Added last so it wraps CORS and times the whole request
+    app.add_middleware(metrics.MetricsMiddleware)
+
 
 @app.get("/", response_model=HealthResponse)
 async def root():
@@ -84,64 +148,340 @@ async def health_check():
     return {"status": "ok", "message": "API is healthy"}
 
 
+@app.get(metrics.METRICS_PATH, include_in_schema=False)
+async def metrics_endpoint():
+    """Prometheus scrape endpoint"""
+    if not settings.metrics_enabled:
+        raise HTTPException(status_code=404, detail="Metrics are disabled")
+    body, content_type = metrics.render()
+    return Response(content=body, media_type=content_type)
+
+
+@app.get("/api/cache-stats")
+async def cache_stats():
+    """Hit/miss counters for the in-process caches"""
+    return {
+        "session_cache": known_sessions.stats(),
+        "pupil_summary_cache": pupil_summaries.stats(),
+        "session_body_cache": session_bodies.stats(),
+        "analytics_cache": analytics_cache.stats(),
+        "trial_catalog": trial_catalog.stats(),
+    }
+
+
+@app.get("/api/write-behind/stats")
+async def write_behind_stats():
+    """Queue depth and flush latency of the write-behind buffer"""
+    if write_behind is None:
+        return {"enabled": False}
+    return {"enabled": True, **write_behind.stats()}
+
+
+@app.get("/api/preprocessing/stats")
+async def preprocessing_stats():
+    """Jobs run and queued by this worker's preprocessing pipeline"""
+    if preprocessor is None:
+        return {"enabled": False}
+    return {"enabled": True, **preprocessor.stats()}
+
+
+def _claim_enqueue(db: DBSession, session_ids: Iterable[str], scope: Optional[IdempotencyScope]):
+    replay = idempotency.claim(db, scope)
+    if replay is None:
+        _require_sessions(db, session_ids)
+    return replay
+
+
+def _store_enqueued(db: DBSession, scope: IdempotencyScope, content: Dict) -> None:
+    idempotency.store(db, scope, content, status_code=202)
+    db.commit()
+
+
+async def _enqueue(
+    db: Database, table: str, session_ids: Iterable[str], rows: List[Dict], scope: Optional[IdempotencyScope]
+) -> Response:
+    """Validate the sessions, then hand the rows to the write-behind buffer"""
+    replay = await db.run(_claim_enqueue, session_ids, scope)
+    if replay is not None:
+        return replay
+    try:
+        write_behind.append(table, rows)
+    except WriteBehindFull as exc:
+        # Closing the handle rolls back the key claim, so a retry can try again
+        raise HTTPException(status_code=503, detail=f"Write-behind queue is full: {exc}", headers={"Retry-After": "5"})
+    content = {"status": "accepted", "queued": len(rows)}
+    if scope is not None:
+        # Stored after the rows are spooled: a crash in between leaves the key unclaimed
+        await db.run(_store_enqueued, scope, content)
+    return JSONResponse(status_code=202, content=content)
+
+
+def _require_sessions(db: DBSession, session_ids: Iterable[str]) -> None:
+    """Raise 404 unless every session exists, querying only ids not already cached"""
+    missing = {session_id for session_id in session_ids if known_sessions.get(session_id) is None}
+    if not missing:
+        return
+    found = set()
+    for row in db.query(StudySession.session_id, StudySession.completed).filter(StudySession.session_id.in_(missing)):
+        known_sessions.set(row.session_id, bool(row.completed))
+        found.add(row.session_id)
+    if found != missing:
+        raise HTTPException(status_code=404, detail="Session not found")
+
+
+@contextmanager
+def _session_fk_guard(db: DBSession, *session_ids: str):
+    """Map a foreign key violation on session_id (session deleted behind a cached entry) to 404"""
+    try:
+        yield
+    except IntegrityError:
+        db.rollback()
+        for session_id in session_ids:
+            known_sessions.discard(session_id)
+        raise HTTPException(status_code=404, detail="Session not found")
+
+
+async def idempotency_scope(
+    request: Request, key: Optional[str] = Header(None, alias="Idempotency-Key")
+) -> Optional[IdempotencyScope]:
+    """Dedup key for client retries, scoped to the route and tied to the request body"""
+    if not key:
+        return None
+    return idempotency.make_scope(request.url.path, key, await request.body())
+
+
+def _saved(db: DBSession, row, schema, scope: Optional[IdempotencyScope]):
+    """Serialize a new row before the commit, so the result is stored with it under the Idempotency-Key"""
+    db.flush()
+    db.refresh(row)
+    result = schema.model_validate(row)
+    idempotency.store(db, scope, result)
+    return result
+
+
+SESSION_FIELDS = set(SessionSummary.model_fields)
+SESSION_INCLUDES = {"trial_responses"}
+
+
+def _split_param(value: Optional[str]) -> Optional[Set[str]]:
+    if value is None:
+        return None
+    return {item.strip() for item in value.split(",") if item.strip()}
+
+
+def _load_session(db: DBSession, session_id: str, include: Set[str] = SESSION_INCLUDES) -> Optional[StudySession]:
+    """Load a session, eagerly loading only the requested relationships"""
+    query = db.query(StudySession).filter(StudySession.session_id == session_id)
+    if "trial_responses" in include:
+        query = query.options(selectinload(StudySession.trial_responses))
+    return query.first()
+
+
+def _create_session(db: DBSession, session: SessionCreate):
+    values = session.model_dump()
+    # One autocommitted upsert instead of SELECT + INSERT + COMMIT + refresh. Concurrent
+    # creates of the same session_id all land on the same row instead of racing the
+    # unique constraint.
+    db.connection(execution_options={"isolation_level": "AUTOCOMMIT"})
+    stmt = dialect_insert(db, StudySession).values(**values)
+    if db.get_bind().dialect.name == "mysql":
+        # MySQL can't return the row, so it is always read back below
+        stmt = stmt.on_duplicate_key_update(session_id=stmt.inserted.session_id)
+    else:
+        stmt = stmt.on_conflict_do_nothing(index_elements=["session_id"])
+    result = db.execute(stmt)
+    invalidate_session(session.session_id)
+    analytics_generation.bump()
+
+    if db.get_bind().dialect.name != "mysql" and result.rowcount == 1:
+        # Freshly inserted: the request already holds every column we return
+        known_sessions.set(session.session_id, session.completed)
+        return SessionResponse(id=result.lastrowid, **values, trial_responses=[])
+
+    # Existing session (or MySQL): return the stored row, trial responses joined in
+    existing_session = (
+        db.query(StudySession)
+        .options(joinedload(StudySession.trial_responses))
+        .filter(StudySession.session_id == session.session_id)
+        .one()
+    )
+    known_sessions.set(session.session_id, bool(existing_session.completed))
+    return SessionResponse.model_validate(existing_session)
+
+
 @app.post("/api/sessions", response_model=SessionResponse)
-async def create_session(session: SessionCreate, db: DBSession = Depends(get_db)):
+async def create_session(session: SessionCreate, db: Database = Depends(get_db)):
     """Create a new study session"""
-    # Check if session already exists
-    existing_session = db.query(StudySession).filter(StudySession.session_id == session.session_id).first()
-    if existing_session:
-        return existing_session
-    
-    db_session = StudySession(
-        session_id=session.session_id,
-        participant_id=session.participant_id,
-        start_time=session.start_time,
-        completed=session.completed,
+    return await db.run(_create_session, session)
+
+
+def _opaque_tag(tag: str) -> str:
+    tag = tag.strip()
+    return tag[2:] if tag.startswith("W/") else tag
+
+
+def _etag_matches(request: Request, etag: str) -> bool:
+    header = request.headers.get("if-none-match")
+    if header is None:
+        return False
+    # Weak comparison: compression changes the bytes, not the representation
+    tags = {_opaque_tag(tag) for tag in header.split(",")}
+    return "*" in tags or _opaque_tag(etag) in tags
+
+
+def _conditional_response(request: Request, entry: CachedBody, cache_control: str) -> Response:
+    """200 with the body, or 304 when the client's If-None-Match already names this version"""
+    headers = {"ETag": entry.etag, "Cache-Control": cache_control}
+    if entry.last_modified is not None:
+        headers["Last-Modified"] = entry.last_modified
+    if _etag_matches(request, entry.etag):
+        return Response(status_code=304, headers=headers)
+    return Response(entry.body, media_type="application/json", headers=headers)
+
+
+def _catalog_response(request: Request, body: bytes, etag: str) -> Response:
+    return _conditional_response(
+        request, CachedBody(body, etag), f"public, max-age={settings.trial_catalog_max_age}"
     )
-    db.add(db_session)
-    db.commit()
-    db.refresh(db_session)
-    return db_session
 
 
-@app.get("/api/sessions/{session_id}", response_model=SessionResponse)
-async def get_session(session_id: str, db: DBSession = Depends(get_db)):
-    """Get a session by ID"""
-    session = db.query(StudySession).filter(StudySession.session_id == session_id).first()
+def _encode_session_body(payload: Dict, updated_at: Optional[datetime], completed: bool) -> CachedBody:
+    """Encode a session view with validators derived from the session's updated_at"""
+    body = orjson.dumps(payload)
+    modified = updated_at.replace(tzinfo=timezone.utc) if updated_at is not None else None
+    # The digest keeps the tag honest when two writes land within updated_at's one-second resolution
+    version = int(modified.timestamp()) if modified is not None else 0
+    etag = f'"{version}-{hashlib.blake2b(body, digest_size=8).hexdigest()}"'
+    last_modified = format_datetime(modified, usegmt=True) if completed and modified is not None else None
+    return CachedBody(body, etag, last_modified)
+
+
+async def _session_view(request: Request, db: Database, view: str, session_id: str, fn, *args) -> Response:
+    """Serve a session view from session_bodies, running ``fn`` (returning (body, completed)) on a miss"""
+    entry = session_bodies.get((view, session_id))
+    if entry is None:
+        entry, completed = await db.run(fn, session_id, *args)
+        # Completed sessions only change through update_session or late child writes, both of which invalidate.
+        # Never from a replica: a lagging one can report completed before it has the final writes.
+        if completed and not db.from_replica:
+            session_bodies.set((view, session_id), entry)
+    return _conditional_response(request, entry, "no-cache")
+
+
+def _get_session_fields(db: DBSession, session_id: str, fields: Set[str]):
+    # Projection: a single-row query over just the requested columns (plus completed, for known_sessions)
+    columns = [StudySession.__table__.c[name] for name in sorted(fields | {"completed"})]
+    row = db.execute(select(*columns).where(StudySession.session_id == session_id)).first()
+    if row is None:
+        known_sessions.discard(session_id)
+        raise HTTPException(status_code=404, detail="Session not found")
+    known_sessions.set(session_id, bool(row.completed))
+    return {name: value for name, value in row._mapping.items() if name in fields}
+
+
+def _get_session(db: DBSession, session_id: str, include: Set[str]):
+    session = _load_session(db, session_id, include)
     if not session:
+        known_sessions.discard(session_id)
         raise HTTPException(status_code=404, detail="Session not found")
-    return session
+    known_sessions.set(session_id, bool(session.completed))
+    schema = SessionResponse if "trial_responses" in include else SessionSummary
+    payload = schema.model_validate(session).model_dump()
+    return _encode_session_body(payload, session.updated_at, bool(session.completed)), bool(session.completed)
+
+
+@app.get("/api/sessions/{session_id}", responses={200: {"model": SessionResponse}})
+async def get_session(
+    session_id: str,
+    request: Request,
+    include: Optional[str] = Query(None, description="Relationships to embed, e.g. trial_responses (default); empty for none"),
+    fields: Optional[str] = Query(None, description="Comma-separated session columns to return"),
+    db: Database = Depends(get_read_db),
+):
+    """Get a session by ID"""
+    include_set = _split_param(include)
+    fields_set = _split_param(fields)
+    if include_set is None:
+        include_set = set() if fields_set is not None else SESSION_INCLUDES
+    if include_set - SESSION_INCLUDES:
+        raise HTTPException(status_code=400, detail=f"include must be a subset of {sorted(SESSION_INCLUDES)}")
+    if fields_set is not None and (not fields_set or fields_set - SESSION_FIELDS):
+        raise HTTPException(status_code=400, detail=f"fields must be a subset of {sorted(SESSION_FIELDS)}")
+    if fields_set is not None and include_set:
+        raise HTTPException(status_code=400, detail="fields cannot be combined with include")
+    if fields_set is not None:
+        return await db.run(_get_session_fields, session_id, fields_set)
+    view = "session+trial_responses" if include_set else "session"
+    return await _session_view(request, db, view, session_id, _get_session, include_set)
+
+
+def _update_session(db: DBSession, session_id: str, session_update: SessionUpdate):
+    values = session_update.model_dump(exclude_none=True)
+    same_session = StudySession.session_id == session_id
+    # Set-based UPDATEs (updated_at via onupdate) instead of SELECT, modify, flush
+    found = True
+    if values:
+        completing = False
+        if values.get("completed") and preprocessor is not None:
+            # Only the request that actually completes the session queues its job,
+            # committed with the completion so the job survives a crash before it runs
+            completing = db.execute(
+                update(StudySession).where(same_session, StudySession.completed.isnot(True)).values(**values)
+            ).rowcount == 1
+            if completing:
+                queue_job(db, session_id)
+        if not completing:
+            found = db.execute(update(StudySession).where(same_session).values(**values)).rowcount == 1
+        db.commit()
+    # Reload the row (server-side updated_at) and its trial responses in two explicit queries
+    session = _load_session(db, session_id) if found else None
+    if session is None:
+        known_sessions.discard(session_id)
+        raise HTTPException(status_code=404, detail="Session not found")
+    known_sessions.set(session_id, bool(session.completed))
+    if values:
+        invalidate_session(session_id)
+        analytics_generation.bump()
+    return SessionResponse.model_validate(session)
 
 
 @app.put("/api/sessions/{session_id}", response_model=SessionResponse)
 async def update_session(
-    session_id: str, session_update: SessionUpdate, db: DBSession = Depends(get_db)
+    session_id: str,
+    session_update: SessionUpdate,
+    background_tasks: BackgroundTasks,
+    db: Database = Depends(get_db),
 ):
     """Update a session"""
-    session = db.query(StudySession).filter(StudySession.session_id == session_id).first()
-    if not session:
-        raise HTTPException(status_code=404, detail="Session not found")
-    
-    if session_update.completed is not None:
-        session.completed = session_update.completed
-    
-    if session_update.end_time is not None:
-        session.end_time = session_update.end_time
-    
-    db.commit()
-    db.refresh(session)
+    session = await db.run(_update_session, session_id, session_update)
+    if session.completed and settings.archive_on_complete:
+        background_tasks.add_task(run_in_session, archive.archive_session, session_id)
+    if session.completed and preprocessor is not None:
+        preprocessor.notify(session_id)
     return session
 
 
-@app.post("/api/trial-responses", response_model=TrialResponseSchema)
-async def create_trial_response(
-    response: TrialResponseCreate, db: DBSession = Depends(get_db)
-):
-    """Save a trial response"""
+def _touch_if_completed(db: DBSession, session_id: str) -> None:
+    """A late write into a completed session moves its updated_at, so Last-Modified follows it.
+
+    Relies on the completed flag cached by ``_require_sessions``, so writes into
+    sessions still in progress (nearly all of them) cost no extra statement.
+    """
+    if not known_sessions.get(session_id):
+        return
+    db.execute(
+        update(StudySession)
+        .where(StudySession.session_id == session_id, StudySession.completed.is_(True))
+        .values(updated_at=func.current_timestamp())
+    )
+
+
+def _create_trial_response(db: DBSession, response: TrialResponseCreate, scope: Optional[IdempotencyScope] = None):
+    replay = idempotency.claim(db, scope)
+    if replay is not None:
+        return replay
     # Verify session exists
-    session = db.query(StudySession).filter(StudySession.session_id == response.session_id).first()
-    if not session:
-        raise HTTPException(status_code=404, detail="Session not found")
+    _require_sessions(db, [response.session_id])
     
     db_response = TrialResponse(
         session_id=response.session_id,
@@ -156,22 +496,36 @@ async def create_trial_response(
         cross_end_time=response.cross_end_time,
         response_time=response.response_time,
         timestamp=response.timestamp,
+        # Scored from the in-memory catalog: no query against trials
+        is_correct=score(trial_catalog.correct_answer(response.trial_id), response.selected_option),
     )
-    db.add(db_response)
-    db.commit()
-    db.refresh(db_response)
-    return db_response
+    with _session_fk_guard(db, response.session_id):
+        db.add(db_response)
+        trial_stats.record_trial_response(db, response.trial_id, response.response_time)
+        _touch_if_completed(db, response.session_id)
+        result = _saved(db, db_response, TrialResponseSchema, scope)
+        db.commit()
+    invalidate_session(response.session_id)
+    analytics_generation.bump()
+    return result
 
 
-@app.post("/api/feedback-responses", response_model=FeedbackResponseSchema)
-async def create_feedback_response(
-    response: FeedbackResponseCreate, db: DBSession = Depends(get_db)
+@app.post("/api/trial-responses", response_model=TrialResponseSchema)
+async def create_trial_response(
+    response: TrialResponseCreate,
+    scope: Optional[IdempotencyScope] = Depends(idempotency_scope),
+    db: Database = Depends(get_db),
 ):
-    """Save a feedback response"""
+    """Save a trial response"""
+    return await db.run(_create_trial_response, response, scope)
+
+
+def _create_feedback_response(db: DBSession, response: FeedbackResponseCreate, scope: Optional[IdempotencyScope] = None):
+    replay = idempotency.claim(db, scope)
+    if replay is not None:
+        return replay
     # Verify session exists
-    session = db.query(StudySession).filter(StudySession.session_id == response.session_id).first()
-    if not session:
-        raise HTTPException(status_code=404, detail="Session not found")
+    _require_sessions(db, [response.session_id])
     
     db_response = FeedbackResponse(
         session_id=response.session_id,
@@ -183,21 +537,31 @@ async def create_feedback_response(
         familiarity=response.familiarity,
         timestamp=response.timestamp,
     )
-    db.add(db_response)
-    db.commit()
-    db.refresh(db_response)
-    return db_response
+    with _session_fk_guard(db, response.session_id):
+        db.add(db_response)
+        trial_stats.record_feedback(db, response.trial_id, response.mental_effort, response.confidence)
+        result = _saved(db, db_response, FeedbackResponseSchema, scope)
+        db.commit()
+    invalidate_session(response.session_id)
+    return result
 
 
-@app.post("/api/sam-responses", response_model=SAMResponseSchema)
-async def create_sam_response(
-    response: SAMResponseCreate, db: DBSession = Depends(get_db)
+@app.post("/api/feedback-responses", response_model=FeedbackResponseSchema)
+async def create_feedback_response(
+    response: FeedbackResponseCreate,
+    scope: Optional[IdempotencyScope] = Depends(idempotency_scope),
+    db: Database = Depends(get_db),
 ):
-    """Save a SAM response"""
+    """Save a feedback response"""
+    return await db.run(_create_feedback_response, response, scope)
+
+
+def _create_sam_response(db: DBSession, response: SAMResponseCreate, scope: Optional[IdempotencyScope] = None):
+    replay = idempotency.claim(db, scope)
+    if replay is not None:
+        return replay
     # Verify session exists
-    session = db.query(StudySession).filter(StudySession.session_id == response.session_id).first()
-    if not session:
-        raise HTTPException(status_code=404, detail="Session not found")
+    _require_sessions(db, [response.session_id])
     
     db_response = SAMResponse(
         session_id=response.session_id,
@@ -207,21 +571,31 @@ async def create_sam_response(
         dominance=response.dominance,
         timestamp=response.timestamp,
     )
-    db.add(db_response)
-    db.commit()
-    db.refresh(db_response)
-    return db_response
+    with _session_fk_guard(db, response.session_id):
+        db.add(db_response)
+        result = _saved(db, db_response, SAMResponseSchema, scope)
+        db.commit()
+    invalidate_session(response.session_id)
+    analytics_generation.bump()
+    return result
 
 
-@app.post("/api/tlx-responses", response_model=TLXResponseSchema)
-async def create_tlx_response(
-    response: TLXResponseCreate, db: DBSession = Depends(get_db)
+@app.post("/api/sam-responses", response_model=SAMResponseSchema)
+async def create_sam_response(
+    response: SAMResponseCreate,
+    scope: Optional[IdempotencyScope] = Depends(idempotency_scope),
+    db: Database = Depends(get_db),
 ):
-    """Save a NASA-TLX response"""
+    """Save a SAM response"""
+    return await db.run(_create_sam_response, response, scope)
+
+
+def _create_tlx_response(db: DBSession, response: TLXResponseCreate, scope: Optional[IdempotencyScope] = None):
+    replay = idempotency.claim(db, scope)
+    if replay is not None:
+        return replay
     # Verify session exists
-    session = db.query(StudySession).filter(StudySession.session_id == response.session_id).first()
-    if not session:
-        raise HTTPException(status_code=404, detail="Session not found")
+    _require_sessions(db, [response.session_id])
     
     db_response = TLXResponse(
         session_id=response.session_id,
@@ -234,21 +608,31 @@ async def create_tlx_response(
         frustration=response.frustration,
         timestamp=response.timestamp,
     )
-    db.add(db_response)
-    db.commit()
-    db.refresh(db_response)
-    return db_response
+    with _session_fk_guard(db, response.session_id):
+        db.add(db_response)
+        result = _saved(db, db_response, TLXResponseSchema, scope)
+        db.commit()
+    invalidate_session(response.session_id)
+    analytics_generation.bump()
+    return result
 
 
-@app.post("/api/event-logs", response_model=EventLogSchema)
-async def create_event_log(
-    event: EventLogCreate, db: DBSession = Depends(get_db)
+@app.post("/api/tlx-responses", response_model=TLXResponseSchema)
+async def create_tlx_response(
+    response: TLXResponseCreate,
+    scope: Optional[IdempotencyScope] = Depends(idempotency_scope),
+    db: Database = Depends(get_db),
 ):
-    """Save an event log"""
+    """Save a NASA-TLX response"""
+    return await db.run(_create_tlx_response, response, scope)
+
+
+def _create_event_log(db: DBSession, event: EventLogCreate, scope: Optional[IdempotencyScope] = None):
+    replay = idempotency.claim(db, scope)
+    if replay is not None:
+        return replay
     # Verify session exists
-    session = db.query(StudySession).filter(StudySession.session_id == event.session_id).first()
-    if not session:
-        raise HTTPException(status_code=404, detail="Session not found")
+    _require_sessions(db, [event.session_id])
     
     db_event = EventLog(
         session_id=event.session_id,
@@ -256,21 +640,65 @@ async def create_event_log(
         event_data=event.event_data,
         timestamp=event.timestamp,
     )
-    db.add(db_event)
-    db.commit()
-    db.refresh(db_event)
-    return db_event
+    with _session_fk_guard(db, event.session_id):
+        db.add(db_event)
+        _touch_if_completed(db, event.session_id)
+        result = _saved(db, db_event, EventLogSchema, scope)
+        db.commit()
+    invalidate_session(event.session_id)
+    return result
 
 
-@app.post("/api/eye-tracking", response_model=EyeTrackingDataSchema)
-async def create_eye_tracking_data(
-    data: EyeTrackingDataCreate, db: DBSession = Depends(get_db)
+@app.post("/api/event-logs", response_model=EventLogSchema)
+async def create_event_log(
+    event: EventLogCreate,
+    scope: Optional[IdempotencyScope] = Depends(idempotency_scope),
+    db: Database = Depends(get_db),
 ):
-    """Save eye tracking data"""
+    """Save an event log"""
+    if write_behind is not None:
+        return await _enqueue(db, EventLog.__tablename__, [event.session_id], [event.model_dump()], scope)
+    return await db.run(_create_event_log, event, scope)
+
+
+EVENT_LOG_PARAMS = {"session_id", "event_type", "from", "to", "cursor", "limit"}
+
+
+def _event_log_page(db: DBSession, *args):
+    try:
+        items, next_cursor = event_logs.read_page(db, *args)
+    except (LookupError, ValueError) as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+    return EventLogPage(items=items, next_cursor=next_cursor)
+
+
+@app.get("/api/event-logs", response_model=EventLogPage)
+async def get_event_logs(
+    request: Request,
+    session_id: str,
+    event_type: Optional[str] = None,
+    start: Optional[int] = Query(None, alias="from"),
+    end: Optional[int] = Query(None, alias="to"),
+    cursor: Optional[str] = None,
+    limit: int = Query(1000, ge=1, le=settings.event_log_max_page_size),
+    db: Database = Depends(get_read_db),
+):
+    """Read a session's event logs in a time range, one keyset-paginated page at a time; filter promoted keys with data.<key>="""
+    data = {}
+    for name, value in request.query_params.items():
+        if name.startswith("data."):
+            data[name[len("data."):]] = value
+        elif name not in EVENT_LOG_PARAMS:
+            raise HTTPException(status_code=400, detail=f"Unknown filter {name}")
+    return await db.run(_event_log_page, session_id, event_type, start, end, data, cursor, limit)
+
+
+def _create_eye_tracking_data(db: DBSession, data: EyeTrackingDataCreate, scope: Optional[IdempotencyScope] = None):
+    replay = idempotency.claim(db, scope)
+    if replay is not None:
+        return replay
     # Verify session exists
-    session = db.query(StudySession).filter(StudySession.session_id == data.session_id).first()
-    if not session:
-        raise HTTPException(status_code=404, detail="Session not found")
+    _require_sessions(db, [data.session_id])
     
     db_data = EyeTrackingData(
         session_id=data.session_id,
@@ -280,32 +708,360 @@ async def create_eye_tracking_data(
         gaze_y=data.gaze_y,
         pupil_diameter=data.pupil_diameter,
     )
-    db.add(db_data)
-    db.commit()
-    db.refresh(db_data)
-    return db_data
+    with _session_fk_guard(db, data.session_id):
+        db.add(db_data)
+        trial_stats.record_eye_tracking(db, [data.trial_id])
+        result = _saved(db, db_data, EyeTrackingDataSchema, scope)
+        db.commit()
+    invalidate_session(data.session_id)
+    return result
+
+
+@app.post("/api/eye-tracking", response_model=EyeTrackingDataSchema)
+async def create_eye_tracking_data(
+    data: EyeTrackingDataCreate,
+    scope: Optional[IdempotencyScope] = Depends(idempotency_scope),
+    db: Database = Depends(get_db),
+):
+    """Save eye tracking data"""
+    if write_behind is not None:
+        return await _enqueue(db, EyeTrackingData.__tablename__, [data.session_id], [data.model_dump()], scope)
+    return await db.run(_create_eye_tracking_data, data, scope)
+
+
+def _insert_samples(db: DBSession, session_ids: Set[str], rows: List[Dict], scope: Optional[IdempotencyScope]):
+    with _session_fk_guard(db, *session_ids):
+        inserted = bulk_insert(db, rows, commit=False)
+        result = {"received": len(rows), "inserted": inserted}
+        idempotency.store(db, scope, result)
+        db.commit()
+    for session_id in session_ids:
+        invalidate_session(session_id)
+    return result
+
+
+def _create_eye_tracking_batch(
+    db: DBSession, samples: List[EyeTrackingDataCreate], scope: Optional[IdempotencyScope] = None
+):
+    replay = idempotency.claim(db, scope)
+    if replay is not None:
+        return replay
+    # Verify every referenced session exists with at most one query
+    session_ids = {sample.session_id for sample in samples}
+    _require_sessions(db, session_ids)
+    return _insert_samples(db, session_ids, [sample.model_dump() for sample in samples], scope)
+
+
+@app.post("/api/eye-tracking/batch", response_model=EyeTrackingBatchResponse)
+async def create_eye_tracking_batch(
+    samples: List[EyeTrackingDataCreate],
+    scope: Optional[IdempotencyScope] = Depends(idempotency_scope),
+    db: Database = Depends(get_db),
+):
+    """Save a batch of eye tracking samples in a single multi-row insert"""
+    if len(samples) > settings.eye_tracking_max_batch_size:
+        raise HTTPException(status_code=413, detail="Too many samples in batch")
+    if not samples:
+        return {"received": 0, "inserted": 0}
+
+    if write_behind is not None:
+        return await _enqueue(
+            db,
+            EyeTrackingData.__tablename__,
+            {sample.session_id for sample in samples},
+            [sample.model_dump() for sample in samples],
+            scope,
+        )
+    return await db.run(_create_eye_tracking_batch, samples, scope)
+
+
+def _create_eye_tracking_packed(
+    db: DBSession, session_id: str, trial_id: int, records, scope: Optional[IdempotencyScope] = None
+):
+    replay = idempotency.claim(db, scope)
+    if replay is not None:
+        return replay
+    _require_sessions(db, [session_id])
+    return _insert_samples(db, {session_id}, records_to_rows(session_id, trial_id, records), scope)
+
+
+@app.post("/api/eye-tracking/packed", response_model=EyeTrackingBatchResponse)
+async def create_eye_tracking_packed(
+    request: Request,
+    scope: Optional[IdempotencyScope] = Depends(idempotency_scope),
+    db: Database = Depends(get_db),
+):
+    """Save eye tracking samples sent in the packed binary format"""
+    payload = await request.body()
+    try:
+        session_id, trial_id, records = decode_samples(payload)
+    except PackedFormatError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+    if len(records) > settings.eye_tracking_max_batch_size:
+        raise HTTPException(status_code=413, detail="Too many samples in batch")
+
+    if write_behind is not None:
+        return await _enqueue(
+            db, EyeTrackingData.__tablename__, [session_id], records_to_rows(session_id, trial_id, records), scope
+        )
+    return await db.run(_create_eye_tracking_packed, session_id, trial_id, records, scope)
+
+
+def _get_session_responses(db: DBSession, session_id: str):
+    # Plain row mappings straight from the cursor: no ORM identity map, no jsonable_encoder walk
+    session = db.execute(
+        select(StudySession.__table__).where(StudySession.session_id == session_id)
+    ).mappings().first()
+    if not session:
+        raise HTTPException(status_code=404, detail="Session not found")
+
+    trial_responses = db.execute(
+        select(TrialResponse.__table__).where(TrialResponse.session_id == session_id)
+    ).mappings().all()
+
+    event_logs = db.execute(
+        select(EventLog.__table__).where(EventLog.session_id == session_id)
+    ).mappings().all()
+
+    payload = {
+        "session": dict(session),
+        "trial_responses": [dict(row) for row in trial_responses],
+        "event_logs": [dict(row) for row in event_logs],
+    }
+    return _encode_session_body(payload, session["updated_at"], bool(session["completed"])), bool(session["completed"])
 
 
 @app.get("/api/sessions/{session_id}/responses")
-async def get_session_responses(session_id: str, db: DBSession = Depends(get_db)):
+async def get_session_responses(session_id: str, request: Request, db: Database = Depends(get_read_db)):
     """Get all responses for a session"""
+    return await _session_view(request, db, "responses", session_id, _get_session_responses)
+
+
+@app.websocket("/ws/sessions/{session_id}/eye-tracking")
+async def stream_eye_tracking(websocket: WebSocket, session_id: str):
+    """Stream eye tracking samples for one session over a single connection"""
+    await websocket.accept()
+    try:
+        # Validated once per connection instead of once per sample
+        await run_in_session(_require_sessions, [session_id])
+    except HTTPException:
+        await websocket.close(code=4404, reason="Session not found")
+        return
+    await EyeTrackingStream(websocket, session_id).run()
+
+
+def _eye_tracking_page(db: DBSession, session_id: str, trial_id, start, end, cursor: Optional[str], limit: int):
+    _require_sessions(db, [session_id])
+    try:
+        position = decode_cursor(cursor) if cursor is not None else None
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+    items, next_position = archive.read_samples_page(db, session_id, trial_id, start, end, position, limit)
+    next_cursor = encode_cursor(items[-1]) if next_position is not None else None
+    return EyeTrackingPage(items=items, next_cursor=next_cursor)
+
+
+@app.get("/api/sessions/{session_id}/eye-tracking", response_model=EyeTrackingPage)
+async def get_eye_tracking(
+    session_id: str,
+    trial_id: Optional[int] = None,
+    start: Optional[int] = Query(None, alias="from"),
+    end: Optional[int] = Query(None, alias="to"),
+    cursor: Optional[str] = None,
+    limit: int = Query(1000, ge=1, le=settings.eye_tracking_max_page_size),
+    db: Database = Depends(get_read_db),
+):
+    """Read eye tracking samples in a time range, one keyset-paginated page at a time"""
+    return await db.run(_eye_tracking_page, session_id, trial_id, start, end, cursor, limit)
+
+
+def _pupil_summary(db: DBSession, session_id: str):
     session = db.query(StudySession).filter(StudySession.session_id == session_id).first()
     if not session:
         raise HTTPException(status_code=404, detail="Session not found")
-    
-    trial_responses = db.query(TrialResponse).filter(
-        TrialResponse.session_id == session_id
-    ).all()
-    
-    event_logs = db.query(EventLog).filter(
-        EventLog.session_id == session_id
-    ).all()
-    
-    return {
-        "session": session,
-        "trial_responses": trial_responses,
-        "event_logs": event_logs,
-    }
+
+    # Columnar load of hot and archived samples
+    columns = archive.load_columns(db, session_id)
+    stimulus_starts = dict(db.execute(
+        select(TrialResponse.trial_id, func.min(TrialResponse.stimulus_start_time))
+        .where(TrialResponse.session_id == session_id)
+        .group_by(TrialResponse.trial_id)
+    ).all())
+
+    trials = summarize_trials(
+        columns["trial_id"],
+        columns["timestamp"],
+        columns["pupil_diameter"].astype(np.float64),
+        stimulus_starts,
+        settings.pupil_baseline_ms,
+    )
+    return PupilSummaryResponse(session_id=session_id, completed=bool(session.completed), trials=trials)
+
+
+@app.get("/api/sessions/{session_id}/pupil-summary", response_model=PupilSummaryResponse)
+async def get_pupil_summary(session_id: str, db: Database = Depends(get_read_db)):
+    """Per-trial pupil metrics computed from the session's eye tracking samples"""
+    summary = pupil_summaries.get(session_id)
+    if summary is None:
+        summary = await db.run(_pupil_summary, session_id)
+        # Only completed sessions are stable enough to cache, and only as read from the
+        # primary: a lagging replica may not have the last samples yet
+        if summary.completed and not db.from_replica:
+            pupil_summaries.set(session_id, summary)
+    return summary
+
+
+@app.get("/api/trials", responses={200: {"model": List[TrialSchema]}})
+async def list_trials(request: Request):
+    """List the trial catalog"""
+    snapshot = trial_catalog.snapshot
+    return _catalog_response(request, snapshot.body, snapshot.etag)
+
+
+@app.get("/api/trials/{trial_id}", responses={200: {"model": TrialSchema}})
+async def get_trial(trial_id: int, request: Request):
+    """Get one trial from the catalog"""
+    snapshot = trial_catalog.snapshot
+    trial = snapshot.trials.get(trial_id)
+    if trial is None:
+        raise HTTPException(status_code=404, detail="Trial not found")
+    return _catalog_response(request, orjson.dumps(trial.model_dump()), snapshot.etag)
+
+
+def _save_trial(db: DBSession, trial: TrialCreate):
+    db_trial = db.query(Trial).filter(Trial.trial_id == trial.trial_id).first()
+    if db_trial is None:
+        db_trial = Trial(**trial.model_dump())
+        db.add(db_trial)
+        answer_changed = True
+    else:
+        answer_changed = db_trial.correct_answer != trial.correct_answer
+        for name, value in trial.model_dump().items():
+            setattr(db_trial, name, value)
+    try:
+        db.flush()
+    except IntegrityError:
+        db.rollback()
+        raise HTTPException(status_code=409, detail="Trial was created concurrently; retry")
+    if answer_changed:
+        # Responses recorded before the answer was known (or changed) are scored again
+        rescore(db, trial.trial_id)
+    db.commit()
+    return TrialSchema.model_validate(db_trial)
+
+
+@app.post("/api/trials", response_model=TrialSchema)
+async def save_trial(trial: TrialCreate, db: Database = Depends(get_db)):
+    """Create or replace a trial in the catalog"""
+    saved = await db.run(_save_trial, trial)
+    analytics_generation.bump()
+    await trial_catalog.refresh()
+    return saved
+
+
+def _get_trial_stats(db: DBSession, trial_id: int):
+    stats = db.get(TrialStats, trial_id)
+    if not stats:
+        raise HTTPException(status_code=404, detail="No stats for trial")
+    return TrialStatsSchema.model_validate(trial_stats.describe(stats))
+
+
+@app.get("/api/trials/{trial_id}/stats", response_model=TrialStatsSchema)
+async def get_trial_stats(trial_id: int, db: Database = Depends(get_read_db)):
+    """Per-trial counts, means and standard deviations from the trial_stats table"""
+    return await db.run(_get_trial_stats, trial_id)
+
+
+@app.get("/api/analytics/accuracy", responses={200: {"model": List[TrialAccuracy]}})
+async def get_accuracy(
+    participant_id: Optional[str] = None, completed_only: bool = False, db: Database = Depends(get_read_db)
+):
+    """Per-trial accuracy against the trials table's correct answers"""
+    return await analytics.cached(db, "accuracy", analytics.trial_accuracy, participant_id, completed_only)
+
+
+@app.get("/api/analytics/response-times", responses={200: {"model": List[ResponseTimeStats]}})
+async def get_response_times(
+    participant_id: Optional[str] = None, completed_only: bool = False, db: Database = Depends(get_read_db)
+):
+    """Per-trial response time mean and percentiles"""
+    return await analytics.cached(db, "response-times", analytics.response_times, participant_id, completed_only)
+
+
+@app.get("/api/analytics/questionnaires", responses={200: {"model": List[ParticipantQuestionnaires]}})
+async def get_questionnaires(
+    participant_id: Optional[str] = None, completed_only: bool = False, db: Database = Depends(get_read_db)
+):
+    """Mean NASA-TLX and SAM scores per participant"""
+    return await analytics.cached(db, "questionnaires", analytics.questionnaires, participant_id, completed_only)
+
+
+def _get_preprocessing_job(db: DBSession, session_id: str):
+    job = db.query(PreprocessingJob).filter(PreprocessingJob.session_id == session_id).first()
+    if not job:
+        raise HTTPException(status_code=404, detail="No preprocessing job for session")
+    return PreprocessingJobSchema.model_validate(job)
+
+
+@app.get("/api/sessions/{session_id}/preprocessing", response_model=PreprocessingJobSchema)
+async def get_preprocessing_job(session_id: str, db: Database = Depends(get_db)):
+    """Status of the session's preprocessing job"""
+    # Read from the primary: job status changes faster than replicas follow
+    return await db.run(_get_preprocessing_job, session_id)
+
+
+def _queue_preprocessing(db: DBSession, session_id: str):
+    session = db.query(StudySession).filter(StudySession.session_id == session_id).first()
+    if not session:
+        raise HTTPException(status_code=404, detail="Session not found")
+    if not session.completed:
+        raise HTTPException(status_code=409, detail="Session is not completed")
+    queue_job(db, session_id)
+    db.commit()
+    return _get_preprocessing_job(db, session_id)
+
+
+@app.post("/api/sessions/{session_id}/preprocessing", response_model=PreprocessingJobSchema, status_code=202)
+async def queue_preprocessing(session_id: str, db: Database = Depends(get_db)):
+    """Queue (or re-run) preprocessing of a completed session"""
+    if preprocessor is None:
+        raise HTTPException(status_code=503, detail="Preprocessing is disabled")
+    job = await db.run(_queue_preprocessing, session_id)
+    preprocessor.notify(session_id)
+    return job
+
+
+def _export_response(session_ids: List[str], format: str, filename: str) -> StreamingResponse:
+    return StreamingResponse(
+        STREAMERS[format](session_ids),
+        media_type=MEDIA_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="{filename}.{format}"'},
+    )
+
+
+@app.get("/api/sessions/{session_id}/export")
+async def export_session(
+    session_id: str, format: Literal["ndjson", "csv"] = "ndjson", db: Database = Depends(get_read_db)
+):
+    """Stream every row recorded for a session"""
+    await db.run(_require_sessions, [session_id])
+    return _export_response([session_id], format, session_id)
+
+
+def _participant_session_ids(db: DBSession, participant_id: str) -> List[str]:
+    rows = db.query(StudySession.session_id).filter(StudySession.participant_id == participant_id).all()
+    return [row.session_id for row in rows]
+
+
+@app.get("/api/export")
+async def export_participant(
+    participant_id: str, format: Literal["ndjson", "csv"] = "ndjson", db: Database = Depends(get_read_db)
+):
+    """Stream every row recorded for all sessions of a participant"""
+    session_ids = await db.run(_participant_session_ids, participant_id)
+    if not session_ids:
+        raise HTTPException(status_code=404, detail="No sessions for participant")
+    return _export_response(session_ids, format, participant_id)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,224 @@
+"""Prometheus metrics for HTTP traffic and the database pool.
+
+``MetricsMiddleware`` is a plain ASGI middleware (no per-request task or
+response buffering) that records, per route template:
+
+- request counts by status and unhandled exceptions
+- latency, request body and response body size histograms
+- the number of SQL statements the request executed
+
+plus an in-flight gauge per method. Database metrics come from the engine:
+pool checkout latency (time spent waiting for a free connection), checked-out
+and overflow connections, and a per-statement counter that feeds the
+per-request query count through a context variable. The write-behind buffer
+reports its queue depth and flush durations.
+
+Under several uvicorn/gunicorn workers set ``PROMETHEUS_MULTIPROC_DIR`` to an
+empty, writable directory before the workers start: every process then writes
+its samples to mmap files there and ``/metrics`` aggregates all of them, so a
+scrape sees the whole server rather than the worker that happened to answer.
+"""
+import os
+import time
+from contextvars import ContextVar
+from typing import List, Optional, Tuple
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from app.config import settings
+
+METRICS_PATH = "/metrics"
+UNMATCHED_ROUTE = "<unmatched>"
+
+SIZE_BUCKETS = (100, 1_000, 10_000, 100_000, 1_000_000, 10_000_000, 100_000_000)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+HTTP_REQUESTS = Counter(
+    "http_requests_total", "HTTP requests by route and status", ["method", "route", "status"]
+)
+HTTP_EXCEPTIONS = Counter(
+    "http_request_exceptions_total", "Requests that raised an unhandled exception", ["method", "route"]
+)
+HTTP_LATENCY = Histogram(
+    "http_request_duration_seconds", "Time from request start to last response byte", ["method", "route"]
+)
+HTTP_REQUEST_SIZE = Histogram(
+    "http_request_size_bytes", "Request body size", ["method", "route"], buckets=SIZE_BUCKETS
+)
+HTTP_RESPONSE_SIZE = Histogram(
+    "http_response_size_bytes", "Response body size", ["method", "route"], buckets=SIZE_BUCKETS
+)
+HTTP_IN_PROGRESS = Gauge(
+    "http_requests_in_progress", "Requests currently being served", ["method"], multiprocess_mode="livesum"
+)
+HTTP_QUERIES = Histogram(
+    "http_request_db_queries", "SQL statements executed per request", ["method", "route"], buckets=QUERY_BUCKETS
+)
+
+DB_POOL_CHECKOUT = Histogram(
+    "db_pool_checkout_seconds",
+    "Time to get a connection from the pool, including waiting for a free slot",
+    ["pool"],
+    buckets=(0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 30),
+)
+DB_POOL_SIZE = Gauge("db_pool_size", "Configured pool size", ["pool"], multiprocess_mode="livesum")
+DB_POOL_CHECKED_OUT = Gauge(
+    "db_pool_checked_out", "Connections currently checked out", ["pool"], multiprocess_mode="livesum"
+)
+DB_POOL_OVERFLOW = Gauge(
+    "db_pool_overflow", "Connections open beyond pool_size", ["pool"], multiprocess_mode="livesum"
+)
+DB_QUERIES = Counter("db_queries_total", "SQL statements executed", ["pool"])
+
+WRITE_BEHIND_PENDING = Gauge(
+    "write_behind_pending_rows", "Rows acknowledged but not yet written to the database", multiprocess_mode="livesum"
+)
+WRITE_BEHIND_FLUSH = Histogram(
+    "write_behind_flush_seconds",
+    "Time to write one write-behind batch to the database (successful flushes)",
+    buckets=(0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30),
+)
+
+# Statement counter of the request being served; None outside of a request
+_request_queries: ContextVar[Optional[List[int]]] = ContextVar("request_queries", default=None)
+
+
+def timed_pool(base, name: str):
+    """Subclass a pool class so every checkout records how long it took"""
+    if not settings.metrics_enabled:
+        return base
+    wait = DB_POOL_CHECKOUT.labels(name)
+
+    class TimedPool(base):
+        def _do_get(self):
+            start = time.perf_counter()
+            try:
+                return super()._do_get()
+            finally:
+                wait.observe(time.perf_counter() - start)
+
+    TimedPool.__name__ = f"Timed{base.__name__}"
+    return TimedPool
+
+
+def instrument_engine(engine: Engine, name: str) -> None:
+    """Attach pool gauges and the statement counter to a sync engine (or ``async_engine.sync_engine``)"""
+    if not settings.metrics_enabled:
+        return
+    checked_out = DB_POOL_CHECKED_OUT.labels(name)
+    overflow = DB_POOL_OVERFLOW.labels(name)
+    queries = DB_QUERIES.labels(name)
+    if hasattr(engine.pool, "size"):
+        DB_POOL_SIZE.labels(name).set(engine.pool.size())
+
+    # Registered on the engine rather than the pool so they survive engine.dispose()
+    @event.listens_for(engine, "checkout")
+    def on_checkout(*_):
+        update_usage(0)
+
+    @event.listens_for(engine, "checkin")
+    def on_checkin(*_):
+        # Fires just before the connection goes back into the pool
+        update_usage(-1)
+
+    def update_usage(pending: int):
+        pool = engine.pool
+        if hasattr(pool, "checkedout"):
+            checked_out.set(pool.checkedout() + pending)
+            overflow.set(max(pool.overflow(), 0))
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def count_query(*_):
+        queries.inc()
+        counter = _request_queries.get()
+        if counter is not None:
+            counter[0] += 1
+
+
+def set_write_behind_pending(rows: int) -> None:
+    if settings.metrics_enabled:
+        WRITE_BEHIND_PENDING.set(rows)
+
+
+def observe_write_behind_flush(seconds: float) -> None:
+    if settings.metrics_enabled:
+        WRITE_BEHIND_FLUSH.observe(seconds)
+
+
+class MetricsMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] == METRICS_PATH:
+            await self.app(scope, receive, send)
+            return
+
+        method = scope["method"]
+        status = 500
+        request_size = 0
+        response_size = 0
+
+        async def receive_wrapper():
+            nonlocal request_size
+            message = await receive()
+            if message["type"] == "http.request":
+                request_size += len(message.get("body", b""))
+            return message
+
+        async def send_wrapper(message):
+            nonlocal status, response_size
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            elif message["type"] == "http.response.body":
+                response_size += len(message.get("body", b""))
+            await send(message)
+
+        in_progress = HTTP_IN_PROGRESS.labels(method)
+        in_progress.inc()
+        queries = [0]
+        token = _request_queries.set(queries)
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive_wrapper, send_wrapper)
+        except Exception:
+            HTTP_EXCEPTIONS.labels(method, _route_of(scope)).inc()
+            raise
+        finally:
+            elapsed = time.perf_counter() - start
+            _request_queries.reset(token)
+            in_progress.dec()
+            route = _route_of(scope)
+            HTTP_REQUESTS.labels(method, route, str(status)).inc()
+            HTTP_LATENCY.labels(method, route).observe(elapsed)
+            HTTP_REQUEST_SIZE.labels(method, route).observe(request_size)
+            HTTP_RESPONSE_SIZE.labels(method, route).observe(response_size)
+            HTTP_QUERIES.labels(method, route).observe(queries[0])
+
+
+def _route_of(scope) -> str:
+    # The router stores the matched route in the scope; labelling by its path
+    # template keeps one series per endpoint instead of one per session_id
+    route = scope.get("route")
+    return route.path if route is not None else UNMATCHED_ROUTE
+
+
+def render() -> Tuple[bytes, str]:
+    """Serialize every metric in the Prometheus text format"""
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
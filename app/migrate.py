@@ -0,0 +1,163 @@
+"""Explicit schema migrations.
+
+``python -m app.migrate`` brings the database up to ``SCHEMA_VERSION`` by
+running, in order, every migration newer than the highest version recorded in
+``schema_version``. The API no longer creates tables at import; at startup it
+only compares the recorded version with ``SCHEMA_VERSION`` (``SCHEMA_CHECK``:
+warn, strict or off).
+
+Migration 1 runs ``create_all`` with the current models, so a fresh database
+gets every table and index at once. Later migrations must therefore check
+before they alter anything, which also lets databases created by the old
+create-at-import code be adopted by simply running this command.
+
+Generated columns for promoted ``event_data`` keys depend on configuration
+rather than on the code version, so every run also adds any that are missing
+(see ``app.event_logs``).
+"""
+import argparse
+import logging
+from typing import Callable, List, Tuple
+
+from sqlalchemy import Column, Table, func, insert, inspect, select, text
+from sqlalchemy.engine import Connection
+from sqlalchemy.orm import Session as DBSession
+
+from app.config import settings
+from app.database import Base, engine
+from app import event_logs
+from app.models import (
+    EventLog,
+    EyeTrackingData,
+    IdempotencyKey,
+    PreprocessingJob,
+    SchemaVersion,
+    TrialResponse,
+)
+from app.trial_catalog import rescore
+
+logger = logging.getLogger(__name__)
+
+
+def _create_tables(conn: Connection) -> None:
+    Base.metadata.create_all(conn)
+
+
+def _create_index(conn: Connection, table: Table, name: str) -> None:
+    if name not in {index["name"] for index in inspect(conn).get_indexes(table.name)}:
+        next(index for index in table.indexes if index.name == name).create(conn)
+
+
+def _add_column(conn: Connection, column: Column) -> None:
+    if column.name not in {c["name"] for c in inspect(conn).get_columns(column.table.name)}:
+        ddl = f"ALTER TABLE {column.table.name} ADD COLUMN {column.name} {column.type.compile(conn.dialect)}"
+        conn.execute(text(ddl))
+
+
+def _eye_tracking_range_index(conn: Connection) -> None:
+    _create_index(conn, EyeTrackingData.__table__, "ix_eye_tracking_session_trial_ts")
+
+
+def _trial_response_scoring(conn: Connection) -> None:
+    _add_column(conn, TrialResponse.__table__.c.is_correct)
+    _create_index(conn, TrialResponse.__table__, "ix_trial_responses_trial_correct")
+    rescore(conn)
+
+
+def _event_log_filter_index(conn: Connection) -> None:
+    _create_index(conn, EventLog.__table__, "ix_event_logs_session_type_ts")
+
+
+def _preprocessing_jobs(conn: Connection) -> None:
+    PreprocessingJob.__table__.create(conn, checkfirst=True)
+
+
+def _idempotency_keys(conn: Connection) -> None:
+    IdempotencyKey.__table__.create(conn, checkfirst=True)
+
+
+def _event_log_page_index(conn: Connection) -> None:
+    _create_index(conn, EventLog.__table__, "ix_event_logs_session_ts_id")
+
+
+MIGRATIONS: List[Tuple[int, str, Callable[[Connection], None]]] = [
+    (1, "Create tables", _create_tables),
+    (2, "Composite (session_id, trial_id, timestamp) index on eye_tracking_data", _eye_tracking_range_index),
+    (3, "trial_responses.is_correct, scored from trials.correct_answer", _trial_response_scoring),
+    (4, "Composite (session_id, event_type, timestamp) index on event_logs", _event_log_filter_index),
+    (5, "preprocessing_jobs table", _preprocessing_jobs),
+    (6, "idempotency_keys table", _idempotency_keys),
+    (7, "Composite (session_id, timestamp, id) index on event_logs", _event_log_page_index),
+]
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+
+def current_version(conn: Connection) -> int:
+    """Highest applied migration, 0 for a database that was never migrated"""
+    if not inspect(conn).has_table(SchemaVersion.__tablename__):
+        return 0
+    return conn.execute(select(func.max(SchemaVersion.version))).scalar() or 0
+
+
+def migrate() -> List[int]:
+    """Apply pending migrations, each in its own transaction; returns the versions applied"""
+    with engine.connect() as conn:
+        version = current_version(conn)
+    applied = []
+    for number, description, apply in MIGRATIONS:
+        if number <= version:
+            continue
+        with engine.begin() as conn:
+            apply(conn)  # migration 1 also creates schema_version itself
+            conn.execute(insert(SchemaVersion).values(version=number, description=description))
+        applied.append(number)
+    with engine.begin() as conn:
+        for name in event_logs.sync_promoted_columns(conn):
+            logger.info("Added generated column event_logs.%s", name)
+    return applied
+
+
+# Set by the gunicorn master (gunicorn.conf.py) once it has run check_schema, so
+# the workers it forks don't repeat it
+schema_checked = False
+
+
+def check_schema(db: DBSession) -> None:
+    """Startup check: warn (or refuse to start) when the database is behind the code"""
+    conn = db.connection()
+    version = current_version(conn)
+    if version >= SCHEMA_VERSION:
+        missing = event_logs.missing_columns(conn)
+        if not missing:
+            return
+        names = ", ".join(key.name for key in missing)
+        message = f"Promoted event_data keys without generated columns: {names}; run `python -m app.migrate`"
+    else:
+        message = f"Database schema is at version {version}, code expects {SCHEMA_VERSION}; run `python -m app.migrate`"
+    if settings.schema_check == "strict":
+        raise RuntimeError(message)
+    logger.warning(message)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Create or upgrade the database schema")
+    parser.add_argument("--check", action="store_true", help="Only report the current and expected version")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    if args.check:
+        with engine.connect() as conn:
+            version = current_version(conn)
+            missing = event_logs.missing_columns(conn) if version else []
+        print(f"Schema version {version}, code expects {SCHEMA_VERSION}")
+        if missing:
+            print(f"Missing generated columns for event_data keys: {', '.join(key.name for key in missing)}")
+        raise SystemExit(0 if version >= SCHEMA_VERSION and not missing else 1)
+    applied = migrate()
+    if applied:
+        print(f"Applied migrations {', '.join(map(str, applied))}; schema is at version {SCHEMA_VERSION}")
+    else:
+        print(f"Schema already at version {SCHEMA_VERSION}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Boolean, Float, JSON, BigInteger, ForeignKey, Text, TIMESTAMP
+from sqlalchemy import Column, Integer, String, Boolean, Float, JSON, BigInteger, ForeignKey, Text, TIMESTAMP, Index, UniqueConstraint
 from sqlalchemy.sql import func
 from sqlalchemy.orm import relationship
 from app.database import Base
@@ -17,16 +17,20 @@ class StudySession(Base):
     updated_at = Column(TIMESTAMP, server_default=func.current_timestamp(), onupdate=func.current_timestamp())
     
     # Relationships
-    trial_responses = relationship("TrialResponse", back_populates="session", cascade="all, delete-orphan")
-    feedback_responses = relationship("FeedbackResponse", back_populates="session", cascade="all, delete-orphan")
-    sam_responses = relationship("SAMResponse", back_populates="session", cascade="all, delete-orphan")
-    tlx_responses = relationship("TLXResponse", back_populates="session", cascade="all, delete-orphan")
-    event_logs = relationship("EventLog", back_populates="session", cascade="all, delete-orphan")
-    eye_tracking_data = relationship("EyeTrackingData", back_populates="session", cascade="all, delete-orphan")
+    # lazy="raise": collections must be loaded explicitly (e.g. selectinload) so
+    # serialization can never fall into per-object lazy loads
+    trial_responses = relationship("TrialResponse", back_populates="session", cascade="all, delete-orphan", lazy="raise")
+    feedback_responses = relationship("FeedbackResponse", back_populates="session", cascade="all, delete-orphan", lazy="raise")
+    sam_responses = relationship("SAMResponse", back_populates="session", cascade="all, delete-orphan", lazy="raise")
+    tlx_responses = relationship("TLXResponse", back_populates="session", cascade="all, delete-orphan", lazy="raise")
+    event_logs = relationship("EventLog", back_populates="session", cascade="all, delete-orphan", lazy="raise")
+    eye_tracking_data = relationship("EyeTrackingData", back_populates="session", cascade="all, delete-orphan", lazy="raise")
 
 
 class TrialResponse(Base):
     __tablename__ = "trial_responses"
+    # Accuracy per trial is a scan of this index, with no join against trials
+    __table_args__ = (Index("ix_trial_responses_trial_correct", "trial_id", "is_correct"),)
 
     id = Column(Integer, primary_key=True, autoincrement=True)
     session_id = Column(String(100), ForeignKey("study_sessions.session_id", ondelete="CASCADE"), nullable=False, index=True)
@@ -41,6 +45,8 @@ class TrialResponse(Base):
     cross_end_time = Column(BigInteger, nullable=False)
     response_time = Column(Integer, nullable=False)
     timestamp = Column(BigInteger, nullable=False)
+    # selected_option == trials.correct_answer, scored at insert; NULL when the trial has no correct answer
+    is_correct = Column(Boolean, nullable=True)
     created_at = Column(TIMESTAMP, server_default=func.current_timestamp())
     
     # Relationships
@@ -102,6 +108,12 @@ class TLXResponse(Base):
 
 class EventLog(Base):
     __tablename__ = "event_logs"
+    # Serve keyset-paginated reads, with and without an event_type filter; promoted
+    # event_data keys get their own indexes (app.event_logs)
+    __table_args__ = (
+        Index("ix_event_logs_session_type_ts", "session_id", "event_type", "timestamp"),
+        Index("ix_event_logs_session_ts_id", "session_id", "timestamp", "id"),
+    )
 
     id = Column(Integer, primary_key=True, autoincrement=True)
     session_id = Column(String(100), ForeignKey("study_sessions.session_id", ondelete="CASCADE"), nullable=False, index=True)
@@ -116,9 +128,15 @@ class EventLog(Base):
 
 class EyeTrackingData(Base):
     __tablename__ = "eye_tracking_data"
+    # Serves time-range reads within a session/trial; its session_id prefix also backs the foreign key
+    __table_args__ = (
+        Index("ix_eye_tracking_session_trial_ts", "session_id", "trial_id", "timestamp"),
+        # Archived samples keep their ids, so ids must never be reused (SQLite reuses them by default)
+        {"sqlite_autoincrement": True},
+    )
 
     id = Column(Integer, primary_key=True, autoincrement=True)
-    session_id = Column(String(100), ForeignKey("study_sessions.session_id", ondelete="CASCADE"), nullable=False, index=True)
+    session_id = Column(String(100), ForeignKey("study_sessions.session_id", ondelete="CASCADE"), nullable=False)
     trial_id = Column(Integer, nullable=False, index=True)
     timestamp = Column(BigInteger, nullable=False)
     gaze_x = Column(Float, nullable=True)
@@ -129,6 +147,23 @@ class EyeTrackingData(Base):
     session = relationship("StudySession", back_populates="eye_tracking_data")
 
 
+class EyeTrackingArchive(Base):
+    """Location of a completed session's eye tracking samples after they leave the hot table"""
+    __tablename__ = "eye_tracking_archives"
+    __table_args__ = (
+        UniqueConstraint("session_id", "trial_id", name="uq_eye_tracking_archive_session_trial"),
+    )
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    session_id = Column(String(100), ForeignKey("study_sessions.session_id", ondelete="CASCADE"), nullable=False)
+    trial_id = Column(Integer, nullable=False)
+    path = Column(String(500), nullable=False)
+    sample_count = Column(Integer, nullable=False)
+    first_timestamp = Column(BigInteger, nullable=True)
+    last_timestamp = Column(BigInteger, nullable=True)
+    created_at = Column(TIMESTAMP, server_default=func.current_timestamp())
+
+
 class Trial(Base):
     __tablename__ = "trials"
 
@@ -138,3 +173,64 @@ class Trial(Base):
     question = Column(Text, nullable=False)
     correct_answer = Column(String(10), nullable=True)
     created_at = Column(TIMESTAMP, server_default=func.current_timestamp())
+
+
+class TrialStats(Base):
+    """Running per-trial aggregates, updated in the same transaction as each ingest"""
+    __tablename__ = "trial_stats"
+
+    trial_id = Column(Integer, primary_key=True, autoincrement=False)
+    response_count = Column(BigInteger, nullable=False, default=0)
+    response_time_sum = Column(BigInteger, nullable=False, default=0)
+    response_time_sumsq = Column(BigInteger, nullable=False, default=0)
+    feedback_count = Column(BigInteger, nullable=False, default=0)
+    mental_effort_sum = Column(BigInteger, nullable=False, default=0)
+    mental_effort_sumsq = Column(BigInteger, nullable=False, default=0)
+    confidence_sum = Column(BigInteger, nullable=False, default=0)
+    confidence_sumsq = Column(BigInteger, nullable=False, default=0)
+    eye_tracking_sample_count = Column(BigInteger, nullable=False, default=0)
+    updated_at = Column(TIMESTAMP, server_default=func.current_timestamp(), onupdate=func.current_timestamp())
+
+
+class PreprocessingJob(Base):
+    """Post-completion preprocessing of a session's eye tracking samples (app.preprocessing)"""
+    __tablename__ = "preprocessing_jobs"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    session_id = Column(String(100), ForeignKey("study_sessions.session_id", ondelete="CASCADE"), unique=True, nullable=False)
+    status = Column(String(20), nullable=False, default="pending", index=True)  # pending | running | done | failed
+    attempts = Column(Integer, nullable=False, default=0)
+    # "<host>:<pid>" of the worker running it; the claim lapses at lease_expires (epoch ms)
+    owner = Column(String(255), nullable=True)
+    lease_expires = Column(BigInteger, nullable=True)
+    trial_count = Column(Integer, nullable=True)
+    sample_count = Column(BigInteger, nullable=True)
+    output_path = Column(String(500), nullable=True)
+    error = Column(Text, nullable=True)
+    created_at = Column(TIMESTAMP, server_default=func.current_timestamp())
+    updated_at = Column(TIMESTAMP, server_default=func.current_timestamp(), onupdate=func.current_timestamp())
+
+
+class IdempotencyKey(Base):
+    """Result of a POST sent with an Idempotency-Key header, stored with the write (app.idempotency)"""
+    __tablename__ = "idempotency_keys"
+    __table_args__ = (
+        UniqueConstraint("route", "key", name="uq_idempotency_keys_route_key"),
+    )
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    route = Column(String(255), nullable=False)
+    key = Column(String(255), nullable=False)
+    request_hash = Column(String(64), nullable=False)  # sha256 of the request body
+    status_code = Column(Integer, nullable=True)
+    response = Column(Text(16 * 1024 * 1024), nullable=True)  # encoded JSON body (MEDIUMTEXT on MySQL)
+    created_ms = Column(BigInteger, nullable=False, index=True)
+
+
+class SchemaVersion(Base):
+    """One row per migration applied by ``python -m app.migrate``"""
+    __tablename__ = "schema_version"
+
+    version = Column(Integer, primary_key=True, autoincrement=False)
+    description = Column(String(255), nullable=False)
+    applied_at = Column(TIMESTAMP, server_default=func.current_timestamp())
@@ -0,0 +1,287 @@
+"""Opt-in preprocessing of completed sessions' eye tracking samples.
+
+Completing a session (``PUT /api/sessions/{id}`` with ``completed=true``)
+records a pending row in ``preprocessing_jobs``. Each worker process runs up
+to ``PREPROCESS_WORKERS`` jobs at a time: the samples are loaded (hot and
+archived) on the DB thread pool, cleaned by ``pupillometry.preprocess_session``
+in a ``ProcessPoolExecutor`` so the CPU work never blocks the event loop, and
+written as one ``.npy`` file per column under
+``<preprocess_dir>/<session_id>/trial_<trial_id>/``.
+
+Jobs are claimed with a conditional UPDATE, so several workers (or hosts)
+can share the table without running a job twice. A claim is a lease that
+the running worker renews every third of ``PREPROCESS_LEASE_SECONDS``, so a
+long job is not taken over while it is still making progress. If its worker
+dies the job becomes claimable again once ``lease_expires`` passes, or at
+once when a worker on the same host starts and finds the owner's pid gone.
+Each worker also polls for pending jobs, which picks up jobs queued by other
+workers and anything left over from before a restart.
+"""
+import asyncio
+import logging
+import multiprocessing
+import os
+import shutil
+import socket
+import time
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from pathlib import Path
+from typing import Dict, List, Optional, Set
+from urllib.parse import quote
+
+import numpy as np
+from sqlalchemy import and_, case, or_, select, update
+from sqlalchemy.orm import Session as DBSession
+
+from app import archive
+from app.config import settings
+from app.database import dialect_insert, run_in_session
+from app.models import PreprocessingJob
+from app.pupillometry import preprocess_session
+from app.storage import pid_alive, write_columns
+
+logger = logging.getLogger(__name__)
+
+
+def _now_ms() -> int:
+    return int(time.time() * 1000)
+
+
+def queue_job(db: DBSession, session_id: str) -> None:
+    """Create the session's job, or reset a finished one to pending; caller commits"""
+    table = PreprocessingJob.__table__
+    running = table.c.status == "running"
+    # Ordered: MySQL applies ON DUPLICATE KEY assignments left to right, so status goes last
+    reset = [
+        ("attempts", case((running, table.c.attempts), else_=0)),
+        ("error", case((running, table.c.error), else_=None)),
+        ("status", case((running, table.c.status), else_="pending")),
+    ]
+    stmt = dialect_insert(db, PreprocessingJob).values(session_id=session_id, status="pending", attempts=0)
+    if db.get_bind().dialect.name == "mysql":
+        stmt = stmt.on_duplicate_key_update(reset)
+    else:
+        stmt = stmt.on_conflict_do_update(index_elements=[table.c.session_id], set_=dict(reset))
+    db.execute(stmt)
+
+
+def _claimable(table, now: int):
+    return or_(table.c.status == "pending", and_(table.c.status == "running", table.c.lease_expires < now))
+
+
+def _pending_jobs(db: DBSession, limit: int) -> List[str]:
+    table = PreprocessingJob.__table__
+    stmt = select(table.c.session_id).where(_claimable(table, _now_ms())).order_by(table.c.id).limit(limit)
+    return [session_id for (session_id,) in db.execute(stmt)]
+
+
+def _claim(db: DBSession, session_id: str, owner: str, lease_ms: int) -> bool:
+    table = PreprocessingJob.__table__
+    now = _now_ms()
+    result = db.execute(
+        update(table)
+        .where(table.c.session_id == session_id, _claimable(table, now))
+        .values(status="running", owner=owner, lease_expires=now + lease_ms, attempts=table.c.attempts + 1)
+    )
+    db.commit()
+    return result.rowcount == 1
+
+
+def _renew(db: DBSession, session_id: str, owner: str, lease_ms: int) -> bool:
+    """Extend a running job's lease; False once another worker has taken it over"""
+    table = PreprocessingJob.__table__
+    result = db.execute(
+        update(table)
+        .where(table.c.session_id == session_id, table.c.owner == owner, table.c.status == "running")
+        .values(lease_expires=_now_ms() + lease_ms)
+    )
+    db.commit()
+    return result.rowcount == 1
+
+
+def _release_dead_owners(db: DBSession, host: str) -> int:
+    """Return jobs claimed by dead processes on this host to pending"""
+    table = PreprocessingJob.__table__
+    rows = db.execute(
+        select(table.c.session_id, table.c.owner)
+        .where(table.c.status == "running", table.c.owner.like(f"{host}:%"))
+    ).all()
+    dead = [
+        session_id for session_id, owner in rows
+        if owner.rsplit(":", 1)[1].isdigit() and not pid_alive(int(owner.rsplit(":", 1)[1]))
+    ]
+    if dead:
+        db.execute(
+            update(table)
+            .where(table.c.session_id.in_(dead), table.c.status == "running")
+            .values(status="pending", owner=None, lease_expires=None)
+        )
+        db.commit()
+    return len(dead)
+
+
+def _finish(db: DBSession, session_id: str, owner: str, trial_count: int, sample_count: int, path: str) -> None:
+    table = PreprocessingJob.__table__
+    # Guarded by owner: a job whose lease was taken over belongs to the new claimant
+    db.execute(
+        update(table)
+        .where(table.c.session_id == session_id, table.c.owner == owner)
+        .values(
+            status="done", trial_count=trial_count, sample_count=sample_count,
+            output_path=path, error=None, lease_expires=None,
+        )
+    )
+    db.commit()
+
+
+def _fail(db: DBSession, session_id: str, owner: str, error: str, max_attempts: int) -> None:
+    table = PreprocessingJob.__table__
+    db.execute(
+        update(table)
+        .where(table.c.session_id == session_id, table.c.owner == owner)
+        .values(
+            status=case((table.c.attempts >= max_attempts, "failed"), else_="pending"),
+            error=error[:2000],
+            lease_expires=None,
+        )
+    )
+    db.commit()
+
+
+def _write_outputs(session_id: str, trials: Dict[int, Dict[str, np.ndarray]]) -> Path:
+    """Write every trial to a temp dir, then swap it in so readers never see a partial session"""
+    directory = Path(settings.preprocess_dir) / quote(session_id, safe="")
+    tmp = directory.with_name(directory.name + ".tmp")
+    shutil.rmtree(tmp, ignore_errors=True)
+    tmp.mkdir(parents=True)
+    for trial_id, columns in trials.items():
+        write_columns(tmp / f"trial_{trial_id}", columns)
+    shutil.rmtree(directory, ignore_errors=True)
+    os.replace(tmp, directory)
+    return directory
+
+
+class PreprocessingPipeline:
+    def __init__(self, workers: int, poll_interval: float, lease_seconds: float, max_attempts: int):
+        self.workers = workers
+        self.poll_interval = poll_interval
+        self.lease_ms = int(lease_seconds * 1000)
+        self.max_attempts = max_attempts
+        self.params = {
+            "rate_hz": settings.preprocess_rate_hz,
+            "cutoff_hz": settings.preprocess_lowpass_hz,
+            "blink_padding_ms": settings.preprocess_blink_padding_ms,
+            "max_gap_ms": settings.preprocess_max_gap_ms,
+        }
+        self.owner: Optional[str] = None
+        self.completed = 0
+        self.failed = 0
+        self.last_job_seconds: Optional[float] = None
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._queue: Optional[asyncio.Queue] = None
+        self._queued: Set[str] = set()
+        self._tasks: List[asyncio.Task] = []
+
+    async def start(self) -> None:
+        # Set here, not in __init__: gunicorn imports the app before forking workers
+        self.owner = f"{socket.gethostname()}:{os.getpid()}"
+        # spawn: forking a process that runs an event loop and DB threads is not safe
+        self._pool = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context("spawn"))
+        self._queue = asyncio.Queue()
+        released = await run_in_session(_release_dead_owners, socket.gethostname())
+        if released:
+            logger.info("Resuming %d preprocessing jobs from a previous run", released)
+        self._tasks = [asyncio.create_task(self._work()) for _ in range(self.workers)]
+        self._tasks.append(asyncio.create_task(self._poll()))
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        for task in self._tasks:
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        self._tasks = []
+        if self._pool is not None:
+            # Interrupted jobs stay claimed; the next start on this host releases them
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+    def notify(self, session_id: str) -> None:
+        """Run the session's job soon, if this worker can claim it"""
+        if self._queue is not None and session_id not in self._queued:
+            self._queued.add(session_id)
+            self._queue.put_nowait(session_id)
+
+    async def _poll(self) -> None:
+        while True:
+            try:
+                for session_id in await run_in_session(_pending_jobs, self.workers * 2):
+                    self.notify(session_id)
+            except Exception:
+                logger.exception("Polling for preprocessing jobs failed")
+            await asyncio.sleep(self.poll_interval)
+
+    async def _work(self) -> None:
+        while True:
+            session_id = await self._queue.get()
+            try:
+                await self._run(session_id)
+            except Exception:
+                logger.exception("Preprocessing session %s failed", session_id)
+            finally:
+                self._queued.discard(session_id)
+
+    async def _keep_lease(self, session_id: str) -> None:
+        while True:
+            await asyncio.sleep(self.lease_ms / 3000)
+            try:
+                if not await run_in_session(_renew, session_id, self.owner, self.lease_ms):
+                    logger.warning("Lost the preprocessing lease on session %s to another worker", session_id)
+                    return
+            except Exception:
+                # Retried on the next tick, before the lease can run out
+                logger.exception("Renewing the preprocessing lease on session %s failed", session_id)
+
+    async def _run(self, session_id: str) -> None:
+        if not await run_in_session(_claim, session_id, self.owner, self.lease_ms):
+            return  # done, or claimed by another worker
+        start = time.perf_counter()
+        loop = asyncio.get_running_loop()
+        renewer = asyncio.create_task(self._keep_lease(session_id))
+        try:
+            columns = await run_in_session(archive.load_columns, session_id)
+            trials = await loop.run_in_executor(self._pool, partial(preprocess_session, columns, **self.params))
+            path = await loop.run_in_executor(None, _write_outputs, session_id, trials)
+        except Exception as exc:
+            self.failed += 1
+            await run_in_session(_fail, session_id, self.owner, repr(exc), self.max_attempts)
+            raise
+        finally:
+            renewer.cancel()
+        await run_in_session(_finish, session_id, self.owner, len(trials), len(columns["trial_id"]), str(path))
+        self.completed += 1
+        self.last_job_seconds = time.perf_counter() - start
+
+    def stats(self) -> Dict:
+        return {
+            "workers": self.workers,
+            "queued": len(self._queued),
+            "completed": self.completed,
+            "failed": self.failed,
+            "last_job_seconds": self.last_job_seconds,
+        }
+
+
+preprocessor = (
+    PreprocessingPipeline(
+        settings.preprocess_workers,
+        settings.preprocess_poll_interval,
+        settings.preprocess_lease_seconds,
+        settings.preprocess_max_attempts,
+    )
+    if settings.preprocessing_enabled
+    else None
+)
@@ -0,0 +1,139 @@
+"""Opt-in request profiling and slow-query log.
+
+Profiling (``PROFILING_ENABLED=true``): a sampled fraction of requests
+(``PROFILE_SAMPLE_RATE``), plus any request carrying the ``PROFILE_HEADER``
+header, runs under pyinstrument's statistical profiler. Each profile is
+written as HTML to ``PROFILE_DIR/<METHOD>_<route template>/``. pyinstrument
+samples the event loop thread; in threaded DB mode time spent inside
+``db.run`` shows up as an await, so compare against the slow-query log.
+
+Slow-query log (``SLOW_QUERY_MS`` > 0): statements that take longer than the
+threshold are logged to the ``app.slow_query`` logger with their duration,
+the shape of their parameters (never the values) and the route that issued
+them.
+
+When both are off the middleware is not installed and no engine listeners
+are attached, so requests pay nothing.
+"""
+import asyncio
+import logging
+import os
+import random
+import re
+import time
+from contextvars import ContextVar
+from typing import Any, Optional
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from app.config import settings
+
+logger = logging.getLogger("app.slow_query")
+
+# ASGI scope of the request being served; the router fills in scope["route"]
+_request_scope: ContextVar[Optional[dict]] = ContextVar("request_scope", default=None)
+
+
+def _route_label(scope: Optional[dict]) -> str:
+    if scope is None:
+        return "-"
+    route = scope.get("route")
+    return f"{scope.get('method', 'WS')} {route.path if route is not None else scope['path']}"
+
+
+def _params_shape(parameters: Any, executemany: bool) -> str:
+    """Describe bound parameters without logging their values"""
+    if executemany:
+        first = parameters[0] if parameters else None
+        return f"{len(parameters)} x {_params_shape(first, False)}"
+    if isinstance(parameters, dict):
+        return "{" + ", ".join(sorted(parameters)) + "}"
+    if isinstance(parameters, (list, tuple)):
+        return f"({len(parameters)} params)"
+    return "none"
+
+
+def install_slow_query_log(engine: Engine) -> None:
+    """Log statements slower than ``settings.slow_query_ms`` run on ``engine``"""
+    if settings.slow_query_ms <= 0:
+        return
+    threshold = settings.slow_query_ms / 1000.0
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def start_timer(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def log_if_slow(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info["query_start"].pop()
+        if elapsed >= threshold:
+            logger.warning(
+                "slow query %.1f ms route=%s params=%s sql=%s",
+                elapsed * 1000,
+                _route_label(_request_scope.get()),
+                _params_shape(parameters, executemany),
+                " ".join(statement.split())[:2000],
+            )
+
+    @event.listens_for(engine, "handle_error")
+    def discard_timer(exception_context):
+        # A failed statement never reaches after_cursor_execute; drop its start
+        # time so the stack stays in step with the connection's next statement.
+        # Without an execution context the statement failed before the timer started.
+        conn = exception_context.connection
+        if conn is not None and exception_context.execution_context is not None and conn.info.get("query_start"):
+            conn.info["query_start"].pop()
+
+
+def _profile_path(scope: dict) -> str:
+    label = re.sub(r"[^A-Za-z0-9_.-]+", "_", _route_label(scope)).strip("_")
+    directory = os.path.join(settings.profile_dir, label)
+    os.makedirs(directory, exist_ok=True)
+    return os.path.join(directory, f"{time.strftime('%Y%m%dT%H%M%S')}-{time.time_ns() % 1_000_000_000}.html")
+
+
+def _write_profile(profiler, scope: dict) -> None:
+    with open(_profile_path(scope), "w") as f:
+        f.write(profiler.output_html())
+
+
+class ProfilingMiddleware:
+    """Tracks the current request for the slow-query log and profiles sampled requests"""
+
+    def __init__(self, app):
+        self.app = app
+        self.profiling = settings.profiling_enabled
+        if self.profiling:
+            from pyinstrument import Profiler
+
+            self.profiler_class = Profiler
+            self.header = settings.profile_header.lower().encode("latin-1")
+
+    def _sampled(self, scope: dict) -> bool:
+        if not self.profiling or scope["type"] != "http":
+            return False
+        if settings.profile_sample_rate > 0 and random.random() < settings.profile_sample_rate:
+            return True
+        return any(name == self.header for name, _ in scope["headers"])
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] not in ("http", "websocket"):
+            await self.app(scope, receive, send)
+            return
+
+        token = _request_scope.set(scope)
+        try:
+            if not self._sampled(scope):
+                await self.app(scope, receive, send)
+                return
+            profiler = self.profiler_class(interval=settings.profile_interval, async_mode="enabled")
+            profiler.start()
+            try:
+                await self.app(scope, receive, send)
+            finally:
+                profiler.stop()
+                # Rendering the HTML takes a while; keep it off the event loop
+                await asyncio.get_running_loop().run_in_executor(None, _write_profile, profiler, scope)
+        finally:
+            _request_scope.reset(token)
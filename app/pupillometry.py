@@ -0,0 +1,262 @@
+"""Vectorized per-trial pupillometry metrics and signal preprocessing.
+
+All metrics are computed in a single pass over columnar NumPy arrays grouped
+by trial (sort once, then ``bincount``/``reduceat`` per group) rather than by
+looping over ORM objects.
+
+The preprocessing functions (blink detection, gap interpolation, low-pass
+filtering, resampling) are pure NumPy and import nothing from the app, so
+``preprocess_session`` can run in a spawned worker process.
+"""
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+
+def _nan_to_none(values: np.ndarray) -> List[Optional[float]]:
+    return [None if np.isnan(v) else float(v) for v in values]
+
+
+def summarize_trials(
+    trial_ids: np.ndarray,
+    timestamps: np.ndarray,
+    pupil: np.ndarray,
+    stimulus_starts: Dict[int, int],
+    baseline_ms: int,
+) -> List[Dict]:
+    """Summarize pupil samples per trial.
+
+    The baseline is the mean valid pupil diameter in the ``baseline_ms`` before
+    the trial's stimulus onset (or, when no onset is known, the first
+    ``baseline_ms`` of the trial). Mean and peak are baseline-corrected over
+    the samples from onset onwards; peak latency is relative to onset.
+    Samples with a missing or non-positive diameter count as blinks/missing.
+    """
+    if not len(trial_ids):
+        return []
+
+    order = np.lexsort((timestamps, trial_ids))
+    trial_ids = trial_ids[order]
+    timestamps = timestamps[order]
+    pupil = pupil[order]
+
+    trials, starts, counts = np.unique(trial_ids, return_index=True, return_counts=True)
+    n_groups = len(trials)
+    group = np.repeat(np.arange(n_groups), counts)
+    ends = starts + counts - 1
+
+    first_ts = timestamps[starts].astype(np.float64)
+    last_ts = timestamps[ends].astype(np.float64)
+    onset = np.array(
+        [stimulus_starts.get(int(trial), np.nan) for trial in trials], dtype=np.float64
+    )
+    has_onset = ~np.isnan(onset)
+    baseline_end = np.where(has_onset, onset, first_ts + baseline_ms)
+    response_start = np.where(has_onset, onset, first_ts)
+
+    with np.errstate(invalid="ignore"):
+        valid = ~np.isnan(pupil) & (pupil > 0)
+    ts = timestamps.astype(np.float64)
+    in_baseline = valid & (ts >= baseline_end[group] - baseline_ms) & (ts < baseline_end[group])
+    in_response = valid & (ts >= response_start[group])
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        baseline = (
+            np.bincount(group, weights=np.where(in_baseline, pupil, 0.0), minlength=n_groups)
+            / np.bincount(group, weights=in_baseline, minlength=n_groups)
+        )
+        corrected = pupil - baseline[group]
+        response_counts = np.bincount(group, weights=in_response, minlength=n_groups)
+        mean_corrected = (
+            np.bincount(group, weights=np.where(in_response, corrected, 0.0), minlength=n_groups)
+            / response_counts
+        )
+
+        # Peak and the first sample that reaches it, per group
+        candidates = np.where(in_response & ~np.isnan(corrected), corrected, -np.inf)
+        peak = np.maximum.reduceat(candidates, starts)
+        at_peak = np.isfinite(candidates) & (candidates == peak[group])
+        peak_index = np.minimum.reduceat(np.where(at_peak, np.arange(len(ts)), len(ts)), starts)
+        found = peak_index < len(ts)
+        peak = np.where(found, peak, np.nan)
+        peak_latency = np.full(n_groups, np.nan)
+        peak_latency[found] = ts[peak_index[found]] - response_start[found]
+
+        missing_ratio = 1.0 - np.bincount(group, weights=valid, minlength=n_groups) / counts
+        duration_s = (last_ts - first_ts) / 1000.0
+        sample_rate = np.where(duration_s > 0, (counts - 1) / duration_s, np.nan)
+
+    return [
+        {
+            "trial_id": int(trial),
+            "sample_count": int(count),
+            "baseline_pupil": base,
+            "mean_pupil_change": mean,
+            "peak_pupil_change": pk,
+            "peak_latency_ms": latency,
+            "missing_ratio": float(missing),
+            "sample_rate_hz": rate,
+        }
+        for trial, count, base, mean, pk, latency, missing, rate in zip(
+            trials,
+            counts,
+            _nan_to_none(baseline),
+            _nan_to_none(mean_corrected),
+            _nan_to_none(peak),
+            _nan_to_none(peak_latency),
+            missing_ratio,
+            _nan_to_none(sample_rate),
+        )
+    ]
+
+
+def detect_blinks(timestamps: np.ndarray, pupil: np.ndarray, padding_ms: float) -> np.ndarray:
+    """Mask of samples within ``padding_ms`` of a missing or non-positive diameter.
+
+    The padding drops the partly occluded samples at the edges of a blink,
+    where the tracker still reports a (too small) diameter.
+    """
+    with np.errstate(invalid="ignore"):
+        invalid = np.isnan(pupil) | (pupil <= 0)
+    invalid_ts = timestamps[invalid]
+    if not len(invalid_ts):
+        return invalid
+    # Nearest invalid sample at or after ts - padding, per sample
+    nearest = np.searchsorted(invalid_ts, timestamps - padding_ms, "left")
+    found = nearest < len(invalid_ts)
+    blink = np.zeros(len(timestamps), dtype=bool)
+    blink[found] = invalid_ts[nearest[found]] <= timestamps[found] + padding_ms
+    return blink
+
+
+def interpolate_gaps(
+    timestamps: np.ndarray, values: np.ndarray, missing: np.ndarray, max_gap_ms: float
+) -> np.ndarray:
+    """Linearly interpolate ``missing`` samples across gaps up to ``max_gap_ms``.
+
+    The gap is measured between the valid samples on either side. Longer gaps,
+    and missing samples at the edges of the trial, stay NaN.
+    """
+    filled = values.astype(np.float64).copy()
+    valid_ts = timestamps[~missing]
+    if len(valid_ts) < 2:
+        # Nothing to interpolate between; the valid sample (if any) is kept
+        filled[missing] = np.nan
+        return filled
+    idx = np.flatnonzero(missing)
+    after = np.searchsorted(valid_ts, timestamps[idx], "right")
+    inside = (after > 0) & (after < len(valid_ts))
+    gap = np.full(len(idx), np.inf)
+    gap[inside] = valid_ts[after[inside]] - valid_ts[after[inside] - 1]
+    filled[idx] = np.where(
+        gap <= max_gap_ms, np.interp(timestamps[idx], valid_ts, values[~missing]), np.nan
+    )
+    return filled
+
+
+def lowpass_fir(values: np.ndarray, sample_rate: float, cutoff_hz: float) -> np.ndarray:
+    """Zero-phase low-pass: a single pass of a Hamming-windowed sinc FIR.
+
+    The kernel is symmetric, so convolving it centred on each sample adds no
+    delay. The ends are padded with an odd reflection (mirrored through the
+    end sample), which keeps a trend running into the edge instead of bending
+    it back. NaN runs are bridged by interpolation before filtering and
+    restored after.
+    """
+    nan = np.isnan(values)
+    if nan.all() or cutoff_hz >= sample_rate / 2:
+        return values
+    positions = np.arange(len(values))
+    bridged = np.interp(positions, positions[~nan], values[~nan]) if nan.any() else values
+    # About 3.3 / (transition width) taps for a Hamming window, transition ~ cutoff
+    taps = int(3.3 * sample_rate / cutoff_hz) | 1
+    taps = max(3, min(taps, (len(values) // 2) * 2 - 1))
+    n = np.arange(taps) - (taps - 1) / 2
+    kernel = np.sinc(2 * cutoff_hz / sample_rate * n) * np.hamming(taps)
+    kernel /= kernel.sum()
+    padded = np.pad(bridged, taps // 2, mode="reflect", reflect_type="odd")
+    filtered = np.convolve(padded, kernel, mode="valid")
+    filtered[nan] = np.nan
+    return filtered
+
+
+def resample(
+    timestamps: np.ndarray, values: np.ndarray, rate_hz: float, start: float, stop: float
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Linear resampling onto a fixed grid from ``start`` to ``stop`` (ms); NaN spans stay NaN"""
+    grid = np.arange(start, stop + 1e-9, 1000.0 / rate_hz)
+    nan = np.isnan(values)
+    if nan.all():
+        return grid, np.full(len(grid), np.nan)
+    out = np.interp(grid, timestamps[~nan], values[~nan])
+    if nan.any():
+        # A grid point inherits NaN from the raw sample nearest to it
+        nearest = np.clip(np.searchsorted(timestamps, grid), 1, len(timestamps) - 1)
+        nearest -= (grid - timestamps[nearest - 1]) < (timestamps[nearest] - grid)
+        out[nan[nearest]] = np.nan
+    return grid, out
+
+
+def preprocess_trial(
+    timestamps: np.ndarray,
+    pupil: np.ndarray,
+    gaze_x: np.ndarray,
+    gaze_y: np.ndarray,
+    rate_hz: float,
+    cutoff_hz: float,
+    blink_padding_ms: float,
+    max_gap_ms: float,
+) -> Dict[str, np.ndarray]:
+    """Clean one trial: blinks -> interpolation -> low-pass -> fixed-rate resampling.
+
+    The low-pass runs on a uniform grid at the trial's own median sample rate
+    before the final resampling, so it also acts as the anti-aliasing filter
+    when ``rate_hz`` is below the recorded rate.
+    """
+    order = np.argsort(timestamps, kind="stable")
+    ts = timestamps[order].astype(np.float64)
+    keep = np.concatenate(([True], np.diff(ts) > 0))  # duplicate timestamps
+    ts, pupil, gaze_x, gaze_y = ts[keep], pupil[order][keep], gaze_x[order][keep], gaze_y[order][keep]
+    pupil = pupil.astype(np.float64)
+
+    blink = detect_blinks(ts, pupil, blink_padding_ms)
+    cleaned = interpolate_gaps(ts, pupil, blink, max_gap_ms)
+
+    start, stop = ts[0], ts[-1]
+    if len(ts) > 1:
+        native_rate = 1000.0 / float(np.median(np.diff(ts)))
+        uniform_ts, uniform = resample(ts, cleaned, native_rate, start, stop)
+        filtered = lowpass_fir(uniform, native_rate, min(cutoff_hz, 0.4 * rate_hz))
+    else:
+        uniform_ts, filtered = ts, cleaned
+    grid, pupil_out = resample(uniform_ts, filtered, rate_hz, start, stop)
+
+    gaze = {}
+    for name, values in (("gaze_x", gaze_x), ("gaze_y", gaze_y)):
+        values = values.astype(np.float64)
+        _, gaze[name] = resample(ts, interpolate_gaps(ts, values, blink | np.isnan(values), max_gap_ms), rate_hz, start, stop)
+    _, blink_fraction = resample(ts, blink.astype(np.float64), rate_hz, start, stop)
+
+    return {
+        "timestamp": grid,
+        "pupil_diameter": pupil_out.astype(np.float32),
+        "gaze_x": gaze["gaze_x"].astype(np.float32),
+        "gaze_y": gaze["gaze_y"].astype(np.float32),
+        # Grid points reconstructed from interpolation rather than measured
+        "interpolated": (blink_fraction > 0) & ~np.isnan(pupil_out),
+    }
+
+
+def preprocess_session(columns: Dict[str, np.ndarray], **params) -> Dict[int, Dict[str, np.ndarray]]:
+    """``preprocess_trial`` for every trial in a session's columns (as loaded by ``archive.load_columns``)"""
+    trials = {}
+    for trial_id in np.unique(columns["trial_id"]).tolist():
+        mask = columns["trial_id"] == trial_id
+        trials[trial_id] = preprocess_trial(
+            columns["timestamp"][mask],
+            columns["pupil_diameter"][mask],
+            columns["gaze_x"][mask],
+            columns["gaze_y"][mask],
+            **params,
+        )
+    return trials
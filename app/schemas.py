@@ -1,3 +1,5 @@
+from datetime import datetime
+
 from pydantic import BaseModel
 from typing import Optional, List, Any
 
@@ -14,6 +16,7 @@ class TrialResponseSchema(BaseModel):
     cross_end_time: int
     response_time: int
     timestamp: int
+    is_correct: Optional[bool] = None
 
     class Config:
         from_attributes = True
@@ -31,19 +34,22 @@ class SessionUpdate(BaseModel):
     end_time: Optional[int] = None
 
 
-class SessionResponse(BaseModel):
+class SessionSummary(BaseModel):
     id: int
     session_id: str
     participant_id: str
     start_time: int
     end_time: Optional[int] = None
     completed: bool
-    trial_responses: List[TrialResponseSchema] = []
 
     class Config:
         from_attributes = True
 
 
+class SessionResponse(SessionSummary):
+    trial_responses: List[TrialResponseSchema] = []
+
+
 class TrialResponseCreate(BaseModel):
     session_id: str
     participant_id: str
@@ -153,6 +159,11 @@ class EventLogSchema(BaseModel):
         from_attributes = True
 
 
+class EventLogPage(BaseModel):
+    items: List[EventLogSchema]
+    next_cursor: Optional[str] = None
+
+
 class EyeTrackingDataCreate(BaseModel):
     session_id: str
     trial_id: int
@@ -162,6 +173,14 @@ class EyeTrackingDataCreate(BaseModel):
     pupil_diameter: Optional[float] = None
 
 
+class EyeTrackingStreamSample(BaseModel):
+    trial_id: int
+    timestamp: int
+    gaze_x: Optional[float] = None
+    gaze_y: Optional[float] = None
+    pupil_diameter: Optional[float] = None
+
+
 class EyeTrackingDataSchema(BaseModel):
     id: int
     session_id: str
@@ -175,6 +194,91 @@ class EyeTrackingDataSchema(BaseModel):
         from_attributes = True
 
 
+class EyeTrackingPage(BaseModel):
+    items: List[EyeTrackingDataSchema]
+    next_cursor: Optional[str] = None
+
+
+class EyeTrackingBatchResponse(BaseModel):
+    received: int
+    inserted: int
+
+
+class PupilTrialSummary(BaseModel):
+    trial_id: int
+    sample_count: int
+    baseline_pupil: Optional[float] = None
+    mean_pupil_change: Optional[float] = None
+    peak_pupil_change: Optional[float] = None
+    peak_latency_ms: Optional[float] = None
+    missing_ratio: float
+    sample_rate_hz: Optional[float] = None
+
+
+class PupilSummaryResponse(BaseModel):
+    session_id: str
+    completed: bool
+    trials: List[PupilTrialSummary] = []
+
+
+class MeanStd(BaseModel):
+    mean: Optional[float] = None
+    std: Optional[float] = None
+
+
+class TrialStatsSchema(BaseModel):
+    trial_id: int
+    response_count: int
+    response_time: MeanStd
+    feedback_count: int
+    mental_effort: MeanStd
+    confidence: MeanStd
+    eye_tracking_sample_count: int
+
+
+class TrialAccuracy(BaseModel):
+    trial_id: int
+    response_count: int
+    correct_count: int
+    accuracy: Optional[float] = None
+
+
+class ResponseTimeStats(BaseModel):
+    trial_id: int
+    response_count: int
+    mean: Optional[float] = None
+    min: Optional[int] = None
+    p50: Optional[int] = None
+    p90: Optional[int] = None
+    p95: Optional[int] = None
+    p99: Optional[int] = None
+    max: Optional[int] = None
+
+
+class TLXScores(BaseModel):
+    count: int
+    mental_demand: Optional[float] = None
+    physical_demand: Optional[float] = None
+    temporal_demand: Optional[float] = None
+    performance: Optional[float] = None
+    effort: Optional[float] = None
+    frustration: Optional[float] = None
+    raw_tlx: Optional[float] = None
+
+
+class SAMScores(BaseModel):
+    count: int
+    pleasure: Optional[float] = None
+    arousal: Optional[float] = None
+    dominance: Optional[float] = None
+
+
+class ParticipantQuestionnaires(BaseModel):
+    participant_id: str
+    tlx: Optional[TLXScores] = None
+    sam: Optional[SAMScores] = None
+
+
 class TrialCreate(BaseModel):
     trial_id: int
     stimulus_url: str
@@ -193,6 +297,20 @@ class TrialSchema(BaseModel):
         from_attributes = True
 
 
+class PreprocessingJobSchema(BaseModel):
+    session_id: str
+    status: str
+    attempts: int
+    trial_count: Optional[int] = None
+    sample_count: Optional[int] = None
+    output_path: Optional[str] = None
+    error: Optional[str] = None
+    updated_at: Optional[datetime] = None
+
+    class Config:
+        from_attributes = True
+
+
 class HealthResponse(BaseModel):
     status: str
     message: str
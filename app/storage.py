@@ -0,0 +1,32 @@
+"""Local-disk helpers shared by the archive, preprocessing and the write-behind spool."""
+import os
+import shutil
+from pathlib import Path
+from typing import Dict
+
+import numpy as np
+
+
+def write_columns(directory: Path, columns: Dict[str, np.ndarray]) -> None:
+    """Write one ``<name>.npy`` file per column to a temp dir, then swap it into place"""
+    tmp = directory.with_name(directory.name + ".tmp")
+    shutil.rmtree(tmp, ignore_errors=True)
+    tmp.mkdir(parents=True)
+    for name, values in columns.items():
+        with open(tmp / f"{name}.npy", "wb") as f:
+            np.save(f, values)
+            f.flush()
+            os.fsync(f.fileno())
+    shutil.rmtree(directory, ignore_errors=True)
+    os.replace(tmp, directory)
+
+
+def pid_alive(pid: int) -> bool:
+    """Whether a process with this pid exists on this host"""
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
@@ -0,0 +1,154 @@
+"""WebSocket ingest for live eye tracking streams.
+
+One connection carries one participant's session. Frames are batches of
+samples, either a JSON array of ``EyeTrackingStreamSample`` objects or a
+packed binary payload (see ``app.eye_tracking``). Samples are coalesced
+server-side and written in bulk every ``ws_flush_interval`` seconds, or
+sooner once ``ws_flush_batch_size`` rows are buffered. After each flush the
+server sends ``{"type": "ack", "persisted": <total rows>, "last_timestamp": <ms>}``
+so the client can drop everything up to ``last_timestamp`` from its local buffer.
+
+A batch that fails to write goes back to the front of the buffer and is
+retried with exponential backoff, so an ack never covers unpersisted samples.
+If the buffer cannot be written when the buffer limit is hit or the stream
+ends, the socket is closed with code 1011 and the client must resend
+everything it has not seen acked.
+"""
+import asyncio
+import json
+import logging
+from typing import Dict, List, Optional
+
+from fastapi import WebSocket, WebSocketDisconnect
+from pydantic import TypeAdapter, ValidationError
+
+from app.cache import invalidate_session
+from app.config import settings
+from app.database import run_in_session
+from app.eye_tracking import PackedFormatError, bulk_insert, decode_samples, records_to_rows
+from app.models import EyeTrackingData
+from app.schemas import EyeTrackingStreamSample
+from app.write_behind import write_behind
+
+logger = logging.getLogger(__name__)
+
+samples_adapter = TypeAdapter(List[EyeTrackingStreamSample])
+
+# Cap on the delay between retries of a failing flush
+MAX_RETRY_DELAY = 10.0
+
+
+class EyeTrackingStream:
+    def __init__(self, websocket: WebSocket, session_id: str):
+        self.websocket = websocket
+        self.session_id = session_id
+        self.rows: List[Dict] = []
+        self.persisted = 0
+        self.last_timestamp: Optional[int] = None
+        self._wakeup = asyncio.Event()
+        self._closed = asyncio.Event()
+        self._flush_lock = asyncio.Lock()
+
+    def _decode(self, message: dict) -> List[Dict]:
+        if message.get("bytes") is not None:
+            session_id, trial_id, records = decode_samples(message["bytes"])
+            if session_id != self.session_id:
+                raise ValueError("Packed session_id does not match the connection")
+            return records_to_rows(session_id, trial_id, records)
+        samples = samples_adapter.validate_json(message.get("text") or "")
+        return [{"session_id": self.session_id, **sample.model_dump()} for sample in samples]
+
+    async def _receive(self) -> None:
+        while True:
+            message = await self.websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                return
+            try:
+                rows = self._decode(message)
+            except (PackedFormatError, ValidationError, ValueError) as exc:
+                await self._send({"type": "error", "detail": str(exc)})
+                continue
+            self.rows.extend(rows)
+            if len(self.rows) >= settings.ws_max_buffered_rows:
+                # Writer is falling behind: stop reading until this flush lands (raises if it can't)
+                await self.flush()
+            elif len(self.rows) >= settings.ws_flush_batch_size:
+                self._wakeup.set()
+
+    async def _flush_periodically(self) -> None:
+        failures = 0
+        while True:
+            if failures:
+                # Backing off: batch-size wakeups are ignored until the retry is due
+                event = self._closed
+                timeout = min(settings.ws_flush_interval * 2 ** failures, MAX_RETRY_DELAY)
+            else:
+                event, timeout = self._wakeup, settings.ws_flush_interval
+            try:
+                await asyncio.wait_for(event.wait(), timeout=timeout)
+            except asyncio.TimeoutError:
+                pass
+            if self._closed.is_set():
+                return
+            self._wakeup.clear()
+            try:
+                await self.flush()
+                failures = 0
+            except Exception:
+                failures += 1
+                logger.exception("Flush failed for session %s; %d samples kept for retry", self.session_id, len(self.rows))
+
+    async def _send(self, payload: dict) -> None:
+        try:
+            await self.websocket.send_text(json.dumps(payload))
+        except (WebSocketDisconnect, RuntimeError):
+            pass  # client already gone; its data is still persisted
+
+    async def _close(self, code: int, reason: str) -> None:
+        try:
+            await self.websocket.close(code=code, reason=reason)
+        except (WebSocketDisconnect, RuntimeError):
+            pass
+
+    async def flush(self, ack: bool = True) -> None:
+        async with self._flush_lock:
+            if not self.rows:
+                return
+            batch, self.rows = self.rows, []
+            try:
+                if write_behind is not None:
+                    write_behind.append(EyeTrackingData.__tablename__, batch)
+                else:
+                    await run_in_session(bulk_insert, batch)
+                    invalidate_session(self.session_id)
+            except Exception:
+                # Ahead of anything received meanwhile, so the next flush writes it first
+                self.rows[:0] = batch
+                raise
+            self.persisted += len(batch)
+            batch_last = max(row["timestamp"] for row in batch)
+            self.last_timestamp = max(self.last_timestamp or batch_last, batch_last)
+            if ack:
+                await self._send({"type": "ack", "persisted": self.persisted, "last_timestamp": self.last_timestamp})
+
+    async def run(self) -> None:
+        flusher = asyncio.create_task(self._flush_periodically())
+        failed = False
+        try:
+            await self._receive()
+        except Exception:
+            failed = True
+            logger.exception("Stream for session %s failed", self.session_id)
+        finally:
+            # Signalled rather than cancelled, so a flush in progress finishes (or requeues its batch)
+            self._closed.set()
+            self._wakeup.set()
+            await flusher
+            try:
+                # After a failure the client is still connected: tell it what was persisted
+                await self.flush(ack=failed)
+            except Exception:
+                failed = True
+                logger.exception("Final flush failed for session %s; client must resend unacked samples", self.session_id)
+        if failed:
+            await self._close(1011, "Could not persist all samples; resend unacknowledged samples")
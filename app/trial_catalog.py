@@ -0,0 +1,131 @@
+"""In-memory trial catalog.
+
+The ``trials`` table is small and read on every trial response (to score it),
+so each worker keeps it as an immutable snapshot: a ``MappingProxyType`` of
+trial_id -> ``TrialSchema`` plus the pre-encoded JSON list and its ETag.
+Readers take ``trial_catalog.snapshot`` once and never see a half-built map;
+a refresh builds a new snapshot and swaps the single reference.
+
+The worker that writes a trial refreshes immediately. Other workers pick the
+change up on their next periodic reload (``TRIAL_CATALOG_REFRESH_INTERVAL``).
+Responses they score in between can be fixed with
+``python -m app.trial_catalog rescore``.
+"""
+import argparse
+import asyncio
+import hashlib
+import logging
+from types import MappingProxyType
+from typing import Mapping, Optional
+
+import orjson
+from sqlalchemy import case, null, select, update
+from sqlalchemy.orm import Session as DBSession
+
+from app.config import settings
+from app.database import SessionLocal, run_in_session
+from app.models import Trial, TrialResponse
+from app.schemas import TrialSchema
+
+logger = logging.getLogger(__name__)
+
+
+class CatalogSnapshot:
+    __slots__ = ("trials", "body", "etag")
+
+    def __init__(self, trials: Mapping[int, TrialSchema]):
+        self.trials = MappingProxyType(dict(trials))
+        self.body = orjson.dumps([trial.model_dump() for _, trial in sorted(self.trials.items())])
+        self.etag = f'"{hashlib.blake2b(self.body, digest_size=16).hexdigest()}"'
+
+
+def load_snapshot(db: DBSession) -> CatalogSnapshot:
+    trials = db.execute(select(Trial)).scalars()
+    return CatalogSnapshot({trial.trial_id: TrialSchema.model_validate(trial) for trial in trials})
+
+
+def score(correct_answer: Optional[str], selected_option: str) -> Optional[bool]:
+    """is_correct for a response; None when the trial has no correct answer"""
+    if correct_answer is None:
+        return None
+    return selected_option == correct_answer
+
+
+def rescore(db: DBSession, trial_id: Optional[int] = None) -> int:
+    """Recompute trial_responses.is_correct from the trials table (one trial or all); caller commits"""
+    answer = select(Trial.correct_answer).where(Trial.trial_id == TrialResponse.trial_id).scalar_subquery()
+    stmt = update(TrialResponse).values(
+        is_correct=case((answer.is_(None), null()), else_=TrialResponse.selected_option == answer)
+    )
+    if trial_id is not None:
+        stmt = stmt.where(TrialResponse.trial_id == trial_id)
+    return db.execute(stmt).rowcount
+
+
+class TrialCatalog:
+    def __init__(self, refresh_interval: float):
+        self.refresh_interval = refresh_interval
+        self.snapshot = CatalogSnapshot({})
+        self.refreshes = 0
+        self._task: Optional[asyncio.Task] = None
+        self._lock: Optional[asyncio.Lock] = None
+
+    def install(self, snapshot: CatalogSnapshot) -> None:
+        # A single reference swap: concurrent readers see the old map or the new one
+        if snapshot.etag != self.snapshot.etag:
+            self.snapshot = snapshot
+            self.refreshes += 1
+
+    async def refresh(self) -> None:
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        # Serialized so a slow periodic reload can't install an older snapshot over a fresh one
+        async with self._lock:
+            self.install(await run_in_session(load_snapshot))
+
+    def correct_answer(self, trial_id: int) -> Optional[str]:
+        trial = self.snapshot.trials.get(trial_id)
+        return trial.correct_answer if trial is not None else None
+
+    async def start(self) -> None:
+        await self.refresh()
+        if self.refresh_interval > 0:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.refresh_interval)
+            try:
+                await self.refresh()
+            except Exception:
+                logger.exception("Trial catalog refresh failed; keeping the previous snapshot")
+
+    def stats(self):
+        return {"trials": len(self.snapshot.trials), "etag": self.snapshot.etag, "refreshes": self.refreshes}
+
+
+trial_catalog = TrialCatalog(settings.trial_catalog_refresh_interval)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Maintain trial_responses.is_correct")
+    parser.add_argument("command", choices=["rescore"])
+    parser.add_argument("--trial-id", type=int)
+    args = parser.parse_args()
+    with SessionLocal() as db:
+        count = rescore(db, args.trial_id)
+        db.commit()
+    print(f"Rescored {count} trial responses")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+"""Incrementally maintained per-trial aggregates.
+
+Ingest handlers call the ``record_*`` helpers before committing, so the
+``trial_stats`` row moves in the same transaction as the rows it summarizes.
+Each helper is a single upsert adding to running counts, sums and sums of
+squares, which is enough to serve counts, means and standard deviations in
+O(1). ``python -m app.trial_stats rebuild`` recomputes the table from scratch;
+run it while ingest is quiet, since it replaces every row.
+"""
+import argparse
+import math
+from collections import Counter
+from typing import Dict, Iterable, Optional
+
+from sqlalchemy import delete, func, select
+from sqlalchemy.orm import Session as DBSession
+
+from app.database import SessionLocal, dialect_insert
+from app.models import EyeTrackingArchive, EyeTrackingData, FeedbackResponse, TrialResponse, TrialStats
+
+COUNTERS = [column.name for column in TrialStats.__table__.columns if column.name not in ("trial_id", "updated_at")]
+
+
+def _bump(db: DBSession, trial_id: int, **deltas: int) -> None:
+    stmt = dialect_insert(db, TrialStats).values(trial_id=trial_id, **deltas)
+    table = TrialStats.__table__
+    if db.get_bind().dialect.name == "mysql":
+        stmt = stmt.on_duplicate_key_update({name: table.c[name] + stmt.inserted[name] for name in deltas})
+    else:
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[table.c.trial_id],
+            set_={name: table.c[name] + stmt.excluded[name] for name in deltas},
+        )
+    db.execute(stmt)
+
+
+def record_trial_response(db: DBSession, trial_id: int, response_time: int) -> None:
+    _bump(db, trial_id, response_count=1, response_time_sum=response_time, response_time_sumsq=response_time ** 2)
+
+
+def record_feedback(db: DBSession, trial_id: int, mental_effort: int, confidence: int) -> None:
+    _bump(
+        db,
+        trial_id,
+        feedback_count=1,
+        mental_effort_sum=mental_effort,
+        mental_effort_sumsq=mental_effort ** 2,
+        confidence_sum=confidence,
+        confidence_sumsq=confidence ** 2,
+    )
+
+
+def record_eye_tracking(db: DBSession, trial_ids: Iterable[int]) -> None:
+    """One upsert per distinct trial, in a fixed order to avoid lock-order deadlocks"""
+    for trial_id, count in sorted(Counter(trial_ids).items()):
+        _bump(db, trial_id, eye_tracking_sample_count=count)
+
+
+def _mean_std(count: int, total: int, sumsq: int) -> Dict[str, Optional[float]]:
+    if not count:
+        return {"mean": None, "std": None}
+    mean = total / count
+    return {"mean": mean, "std": math.sqrt(max(sumsq / count - mean * mean, 0.0))}
+
+
+def describe(stats: TrialStats) -> Dict:
+    return {
+        "trial_id": stats.trial_id,
+        "response_count": stats.response_count,
+        "response_time": _mean_std(stats.response_count, stats.response_time_sum, stats.response_time_sumsq),
+        "feedback_count": stats.feedback_count,
+        "mental_effort": _mean_std(stats.feedback_count, stats.mental_effort_sum, stats.mental_effort_sumsq),
+        "confidence": _mean_std(stats.feedback_count, stats.confidence_sum, stats.confidence_sumsq),
+        "eye_tracking_sample_count": stats.eye_tracking_sample_count,
+    }
+
+
+def rebuild(db: DBSession) -> int:
+    """Recompute every trial_stats row from the source tables in one transaction"""
+    rows: Dict[int, Dict[str, int]] = {}
+
+    def merge(stmt, names):
+        for trial_id, *values in db.execute(stmt):
+            row = rows.setdefault(trial_id, dict.fromkeys(COUNTERS, 0))
+            for name, value in zip(names, values):
+                row[name] += int(value or 0)
+
+    merge(
+        select(
+            TrialResponse.trial_id,
+            func.count(),
+            func.sum(TrialResponse.response_time),
+            func.sum(TrialResponse.response_time * TrialResponse.response_time),
+        ).group_by(TrialResponse.trial_id),
+        ["response_count", "response_time_sum", "response_time_sumsq"],
+    )
+    merge(
+        select(
+            FeedbackResponse.trial_id,
+            func.count(),
+            func.sum(FeedbackResponse.mental_effort),
+            func.sum(FeedbackResponse.mental_effort * FeedbackResponse.mental_effort),
+            func.sum(FeedbackResponse.confidence),
+            func.sum(FeedbackResponse.confidence * FeedbackResponse.confidence),
+        ).group_by(FeedbackResponse.trial_id),
+        ["feedback_count", "mental_effort_sum", "mental_effort_sumsq", "confidence_sum", "confidence_sumsq"],
+    )
+    merge(
+        select(EyeTrackingData.trial_id, func.count()).group_by(EyeTrackingData.trial_id),
+        ["eye_tracking_sample_count"],
+    )
+    # Archived samples no longer have rows in eye_tracking_data
+    merge(
+        select(EyeTrackingArchive.trial_id, func.sum(EyeTrackingArchive.sample_count))
+        .group_by(EyeTrackingArchive.trial_id),
+        ["eye_tracking_sample_count"],
+    )
+
+    db.execute(delete(TrialStats))
+    db.add_all(TrialStats(trial_id=trial_id, **values) for trial_id, values in rows.items())
+    db.commit()
+    return len(rows)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Maintain the trial_stats aggregate table")
+    parser.add_argument("command", choices=["rebuild"])
+    parser.parse_args()
+    with SessionLocal() as db:
+        print(f"Rebuilt trial_stats for {rebuild(db)} trials")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,274 @@
+"""Opt-in write-behind buffer for high-volume ingest tables.
+
+Rows are acknowledged once they are appended to an in-memory queue and to an
+append-only spool segment on local disk. A background task flushes the queue
+to the database when it reaches ``write_behind_batch_size`` rows or every
+``write_behind_flush_interval`` seconds, then deletes the flushed segments.
+Segments left behind by a crashed worker are replayed on the next startup.
+"""
+import asyncio
+import json
+import logging
+import os
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import func, insert, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session as DBSession
+
+from app.cache import invalidate_session, known_sessions
+from app import metrics
+from app.config import settings
+from app.database import run_in_session
+from app.models import EventLog, EyeTrackingData, StudySession
+from app.storage import pid_alive
+from app.trial_stats import record_eye_tracking
+
+logger = logging.getLogger(__name__)
+
+TABLES = {
+    EventLog.__tablename__: EventLog,
+    EyeTrackingData.__tablename__: EyeTrackingData,
+}
+
+
+class WriteBehindFull(Exception):
+    """The database has fallen so far behind that no more rows are accepted"""
+
+
+def _insert(db: DBSession, table: str, rows: List[Dict]) -> None:
+    db.execute(insert(TABLES[table]), rows)
+    if table == EyeTrackingData.__tablename__:
+        record_eye_tracking(db, (row["trial_id"] for row in rows))
+
+
+def _touch_completed(db: DBSession, event_logs: List[Dict]) -> None:
+    """Move updated_at of completed sessions that got late event logs, as the synchronous endpoint does.
+
+    Sessions cached as in progress are skipped; unknown ones (e.g. rows replayed
+    from the spool after a restart) are left to the ``completed`` predicate.
+    """
+    session_ids = {row["session_id"] for row in event_logs if known_sessions.get(row["session_id"]) is not False}
+    if not session_ids:
+        return
+    db.execute(
+        update(StudySession)
+        .where(StudySession.session_id.in_(session_ids), StudySession.completed.is_(True))
+        .values(updated_at=func.current_timestamp())
+    )
+
+
+def _insert_rows(db: DBSession, batch: List[Tuple[str, Dict]], chunk_size: int) -> None:
+    by_table: Dict[str, List[Dict]] = {}
+    for table, row in batch:
+        by_table.setdefault(table, []).append(row)
+    try:
+        for table, rows in by_table.items():
+            for start in range(0, len(rows), chunk_size):
+                _insert(db, table, rows[start:start + chunk_size])
+        _touch_completed(db, by_table.get(EventLog.__tablename__, []))
+        db.commit()
+    except IntegrityError:
+        # A session was deleted after its rows were accepted: keep the good rows. One
+        # transaction with a savepoint per row, so a failure partway through leaves
+        # nothing behind when flush() requeues the batch.
+        db.rollback()
+        for table, rows in by_table.items():
+            for row in rows:
+                try:
+                    with db.begin_nested():
+                        _insert(db, table, [row])
+                except IntegrityError:
+                    logger.warning("Dropping spooled %s row for missing session %s", table, row.get("session_id"))
+        _touch_completed(db, by_table.get(EventLog.__tablename__, []))
+        db.commit()
+
+
+class WriteBehindBuffer:
+    def __init__(
+        self, spool_dir: str, batch_size: int, flush_interval: float, fsync: bool = False, max_pending_rows: int = 0
+    ):
+        self.spool_dir = Path(spool_dir)
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.fsync = fsync
+        self.max_pending_rows = max_pending_rows
+
+        self._pending: List[Tuple[str, Dict]] = []
+        self._sealed: List[Path] = []
+        self._segment: Optional[Path] = None
+        self._file = None
+        self._seq = 0
+        self._started_ms = 0
+        self._wakeup = asyncio.Event()
+        self._flush_lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+
+        self.flushed_rows = 0
+        self.flush_count = 0
+        self.failed_flushes = 0
+        self.rejected_rows = 0
+        self.last_flush_seconds = 0.0
+        self.max_flush_seconds = 0.0
+
+    # Spool segments are named <pid>-<start time>-<seq>.spool so workers never share a file
+
+    def _next_segment_path(self) -> Path:
+        self._seq += 1
+        return self.spool_dir / f"{os.getpid()}-{self._started_ms}-{self._seq}.spool"
+
+    def _open_segment(self) -> None:
+        self._segment = self._next_segment_path()
+        self._file = open(self._segment, "a", encoding="utf-8")
+
+    def _seal_segment(self) -> None:
+        if self._file is not None:
+            self._file.close()
+            self._sealed.append(self._segment)
+        self._file = None
+        self._segment = None
+
+    def _claim_orphans(self) -> None:
+        """Take over segments from dead workers and load their rows into the queue"""
+        for path in sorted(self.spool_dir.glob("*.spool"), key=lambda p: p.stat().st_mtime):
+            owner = path.name.split("-", 1)[0]
+            # Our own pid here means a previous process that was given the same pid
+            if owner.isdigit() and int(owner) != os.getpid() and pid_alive(int(owner)):
+                continue
+            claimed = self._next_segment_path()
+            try:
+                os.rename(path, claimed)
+            except FileNotFoundError:
+                continue  # another worker claimed it first
+            with open(claimed, encoding="utf-8") as spool:
+                for line in spool:
+                    try:
+                        record = json.loads(line)
+                    except json.JSONDecodeError:
+                        # Torn final write from the crash
+                        logger.warning("Skipping truncated record in %s", claimed)
+                        continue
+                    self._pending.append((record["table"], record["row"]))
+            self._sealed.append(claimed)
+        if self._pending:
+            logger.info("Replaying %d spooled rows", len(self._pending))
+        metrics.set_write_behind_pending(len(self._pending))
+
+    async def start(self) -> None:
+        self.spool_dir.mkdir(parents=True, exist_ok=True)
+        self._started_ms = int(time.time() * 1000)
+        self._claim_orphans()
+        self._open_segment()
+        self._task = asyncio.create_task(self._run())
+        if self._pending:
+            self._wakeup.set()
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        try:
+            await self.flush()
+        except Exception:
+            logger.exception("Final write-behind flush failed; rows stay in the spool for replay")
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+            # Nothing pending means the open segment was fully flushed
+            if not self._pending and self._segment is not None:
+                self._segment.unlink(missing_ok=True)
+
+    def append(self, table: str, rows: List[Dict]) -> None:
+        """Durably queue rows for ``table``; returns once they are in the spool.
+
+        Raises ``WriteBehindFull`` instead while ``max_pending_rows`` rows are
+        already waiting, so an unreachable database can't grow the queue until
+        the worker runs out of memory.
+        """
+        if self.max_pending_rows and len(self._pending) + len(rows) > self.max_pending_rows:
+            self.rejected_rows += len(rows)
+            raise WriteBehindFull(f"{len(self._pending)} rows are waiting for the database")
+        lines = "".join(json.dumps({"table": table, "row": row}) + "\n" for row in rows)
+        self._file.write(lines)
+        self._file.flush()
+        if self.fsync:
+            os.fsync(self._file.fileno())
+        self._pending.extend((table, row) for row in rows)
+        metrics.set_write_behind_pending(len(self._pending))
+        if len(self._pending) >= self.batch_size:
+            self._wakeup.set()
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                await self.flush()
+            except Exception:
+                logger.exception("Write-behind flush failed; will retry")
+
+    async def flush(self) -> None:
+        async with self._flush_lock:
+            if not self._pending:
+                return
+            batch, self._pending = self._pending, []
+            # New rows go to a fresh segment; the sealed ones are deleted once persisted
+            self._seal_segment()
+            self._open_segment()
+            sealed, self._sealed = self._sealed, []
+
+            start = time.perf_counter()
+            try:
+                await run_in_session(_insert_rows, batch, self.batch_size)
+            except Exception:
+                self._pending[:0] = batch
+                self._sealed[:0] = sealed
+                self.failed_flushes += 1
+                raise
+            finally:
+                metrics.set_write_behind_pending(len(self._pending))
+
+            elapsed = time.perf_counter() - start
+            for session_id in {row["session_id"] for _, row in batch}:
+                invalidate_session(session_id)
+            for path in sealed:
+                path.unlink(missing_ok=True)
+            self.flushed_rows += len(batch)
+            self.flush_count += 1
+            self.last_flush_seconds = elapsed
+            self.max_flush_seconds = max(self.max_flush_seconds, elapsed)
+            metrics.observe_write_behind_flush(elapsed)
+
+    def stats(self) -> Dict:
+        return {
+            "queue_depth": len(self._pending),
+            "spool_segments": len(self._sealed) + (1 if self._file is not None else 0),
+            "flushed_rows": self.flushed_rows,
+            "flush_count": self.flush_count,
+            "failed_flushes": self.failed_flushes,
+            "rejected_rows": self.rejected_rows,
+            "last_flush_seconds": self.last_flush_seconds,
+            "max_flush_seconds": self.max_flush_seconds,
+        }
+
+
+write_behind = (
+    WriteBehindBuffer(
+        settings.write_behind_spool_dir,
+        settings.write_behind_batch_size,
+        settings.write_behind_flush_interval,
+        settings.write_behind_fsync,
+        settings.write_behind_max_pending_rows,
+    )
+    if settings.write_behind_enabled
+    else None
+)
@@ -0,0 +1 @@
+# Standalone benchmark scripts (run with `python -m benchmarks.<name>`)
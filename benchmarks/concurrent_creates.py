@@ -0,0 +1,100 @@
+#!/usr/bin/env python
+"""
+Fire identical writes concurrently at a running server and check they collapse.
+
+Two scenarios:
+  * N concurrent ``POST /api/sessions`` with the same session_id must all
+    succeed and all return the same row id (native upsert, no IntegrityError).
+  * N concurrent ``POST /api/trial-responses`` sharing one ``Idempotency-Key``
+    must all return the same body, and exactly one row must be written.
+
+Usage:
+    uvicorn app.main:app --port 8000 &
+    python -m benchmarks.concurrent_creates --url http://127.0.0.1:8000 --concurrency 50
+"""
+import argparse
+import json
+import time
+import uuid
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from urllib.error import HTTPError
+from urllib.request import Request, urlopen
+
+
+def get(url: str):
+    with urlopen(url, timeout=30) as response:
+        return json.loads(response.read())
+
+
+def post(url: str, body: dict, headers: dict = None):
+    request = Request(
+        url,
+        data=json.dumps(body).encode(),
+        headers={"Content-Type": "application/json", **(headers or {})},
+        method="POST",
+    )
+    try:
+        with urlopen(request, timeout=30) as response:
+            return response.status, json.loads(response.read())
+    except HTTPError as exc:
+        return exc.code, None
+
+
+def fire(n: int, fn):
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=n) as pool:
+        results = list(pool.map(lambda _: fn(), range(n)))
+    return results, time.perf_counter() - start
+
+
+def report(name: str, results, elapsed: float, rows: int = 1) -> bool:
+    statuses = Counter(status for status, _ in results)
+    bodies = {json.dumps(body, sort_keys=True) for _, body in results if body is not None}
+    ok = set(statuses) == {200} and len(bodies) == 1 and rows == 1
+    print(
+        f"{name:<28} {elapsed * 1000:8.1f} ms  statuses={dict(statuses)}  "
+        f"distinct bodies={len(bodies)}  rows={rows}  {'OK' if ok else 'FAIL'}"
+    )
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://127.0.0.1:8000")
+    parser.add_argument("--concurrency", type=int, default=50)
+    args = parser.parse_args()
+
+    session_id = f"bench-{uuid.uuid4().hex[:12]}"
+    session = {"session_id": session_id, "participant_id": "bench", "start_time": int(time.time() * 1000)}
+    results, elapsed = fire(args.concurrency, lambda: post(f"{args.url}/api/sessions", session))
+    sessions_ok = report("create session", results, elapsed)
+
+    key = uuid.uuid4().hex
+    now = session["start_time"]
+    response = {
+        "session_id": session_id,
+        "participant_id": "bench",
+        "trial_id": 1,
+        "question_number": 1,
+        "selected_option": "A",
+        "stimulus_start_time": now,
+        "answer_time": now + 1200,
+        "next_clicked_time": now + 1500,
+        "cross_start_time": now - 500,
+        "cross_end_time": now,
+        "response_time": 1200,
+        "timestamp": now + 1200,
+    }
+    results, elapsed = fire(
+        args.concurrency,
+        lambda: post(f"{args.url}/api/trial-responses", response, {"Idempotency-Key": key}),
+    )
+    stored = get(f"{args.url}/api/sessions/{session_id}")["trial_responses"]
+    responses_ok = report("trial response (same key)", results, elapsed, rows=len(stored))
+
+    raise SystemExit(0 if sessions_ok and responses_ok else 1)
+
+
+if __name__ == "__main__":
+    main()
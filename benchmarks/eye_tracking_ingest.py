@@ -0,0 +1,116 @@
+#!/usr/bin/env python
+"""
+Compare the JSON and packed binary eye tracking ingest paths.
+
+For each path this measures the request body size and the server-side cost of
+turning the body into insert rows (decode + validation), and optionally the
+bulk insert into a throwaway SQLite database.
+"""
+import argparse
+import json
+import time
+from typing import List
+
+import numpy as np
+from pydantic import TypeAdapter
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app.database import Base
+from app.eye_tracking import RECORD_DTYPE, bulk_insert, decode_samples, encode_samples, records_to_rows
+from app.models import StudySession
+from app.schemas import EyeTrackingDataCreate
+
+SESSION_ID = "bench-session"
+TRIAL_ID = 1
+
+samples_adapter = TypeAdapter(List[EyeTrackingDataCreate])
+
+
+def make_records(n: int) -> np.ndarray:
+    rng = np.random.default_rng(0)
+    records = np.empty(n, dtype=RECORD_DTYPE)
+    records["timestamp"] = 1_700_000_000_000 + np.arange(n) * 4
+    records["gaze_x"] = rng.uniform(0, 1920, n)
+    records["gaze_y"] = rng.uniform(0, 1080, n)
+    records["pupil_diameter"] = rng.normal(3.5, 0.3, n)
+    # ~3% missing samples (blinks)
+    missing = rng.random(n) < 0.03
+    for field in ("gaze_x", "gaze_y", "pupil_diameter"):
+        records[field][missing] = np.nan
+    return records
+
+
+def json_body(records: np.ndarray) -> bytes:
+    def value(v):
+        return None if np.isnan(v) else float(v)
+
+    return json.dumps([
+        {
+            "session_id": SESSION_ID,
+            "trial_id": TRIAL_ID,
+            "timestamp": int(r["timestamp"]),
+            "gaze_x": value(r["gaze_x"]),
+            "gaze_y": value(r["gaze_y"]),
+            "pupil_diameter": value(r["pupil_diameter"]),
+        }
+        for r in records
+    ]).encode()
+
+
+def json_rows(body: bytes):
+    samples = samples_adapter.validate_python(json.loads(body))
+    return [sample.model_dump() for sample in samples]
+
+
+def packed_rows(body: bytes):
+    session_id, trial_id, records = decode_samples(body)
+    return records_to_rows(session_id, trial_id, records)
+
+
+def best_of(repeat: int, fn, *args) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(*args)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def insert_time(rows) -> float:
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(bind=engine)
+    Session = sessionmaker(bind=engine)
+    with Session() as db:
+        db.add(StudySession(session_id=SESSION_ID, participant_id="p", start_time=0))
+        db.commit()
+        start = time.perf_counter()
+        bulk_insert(db, rows)
+        return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--samples", type=int, default=10000)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--no-db", action="store_true", help="skip the SQLite insert step")
+    args = parser.parse_args()
+
+    records = make_records(args.samples)
+    bodies = {
+        "json": (json_body(records), json_rows),
+        "packed": (encode_samples(SESSION_ID, TRIAL_ID, records), packed_rows),
+    }
+
+    print(f"{'path':<8} {'bytes':>10} {'B/sample':>9} {'decode ms':>10} {'us/sample':>10} {'insert ms':>10}")
+    for name, (body, to_rows) in bodies.items():
+        decode = best_of(args.repeat, to_rows, body)
+        insert = 0.0 if args.no_db else insert_time(to_rows(body))
+        print(
+            f"{name:<8} {len(body):>10} {len(body) / args.samples:>9.1f} "
+            f"{decode * 1e3:>10.2f} {decode * 1e6 / args.samples:>10.2f} {insert * 1e3:>10.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+#!/usr/bin/env python
+"""
+Compare OFFSET and keyset pagination for eye tracking range reads.
+
+Builds a synthetic single-session table in a SQLite file (reused across runs)
+and times fetching one page at increasing depths with both strategies.
+"""
+import argparse
+import os
+import time
+
+import numpy as np
+from sqlalchemy import create_engine, insert, select
+from sqlalchemy.orm import sessionmaker
+
+from app.database import Base
+from app.eye_tracking import read_page
+from app.models import EyeTrackingData, StudySession
+
+SESSION_ID = "bench-session"
+
+
+def populate(db, rows: int, trials: int) -> None:
+    rng = np.random.default_rng(0)
+    db.add(StudySession(session_id=SESSION_ID, participant_id="p", start_time=0))
+    per_trial = rows // trials
+    for trial in range(trials):
+        timestamps = trial * 10_000_000 + np.arange(per_trial) * 4
+        pupil = rng.normal(3.5, 0.3, per_trial)
+        db.execute(insert(EyeTrackingData), [
+            {"session_id": SESSION_ID, "trial_id": trial, "timestamp": int(ts), "pupil_diameter": float(p)}
+            for ts, p in zip(timestamps, pupil)
+        ])
+    db.commit()
+
+
+def offset_page(db, depth: int, limit: int):
+    table = EyeTrackingData.__table__
+    stmt = (
+        select(table)
+        .where(table.c.session_id == SESSION_ID)
+        .order_by(table.c.trial_id, table.c.timestamp, table.c.id)
+        .offset(depth)
+        .limit(limit)
+    )
+    return db.execute(stmt).all()
+
+
+def timed(repeat: int, fn, *args) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(*args)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--trials", type=int, default=40)
+    parser.add_argument("--limit", type=int, default=1000)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--db", default="bench_eye_tracking.db")
+    args = parser.parse_args()
+
+    fresh = not os.path.exists(args.db)
+    engine = create_engine(f"sqlite:///{args.db}")
+    Base.metadata.create_all(bind=engine)
+    Session = sessionmaker(bind=engine)
+
+    with Session() as db:
+        if fresh:
+            print(f"Populating {args.rows} rows into {args.db} ...")
+            populate(db, args.rows, args.trials)
+        total = db.query(EyeTrackingData).count()
+
+        print(f"{'depth':>10} {'offset ms':>10} {'keyset ms':>10}")
+        depth = args.limit
+        while depth < total:
+            # Cursor for the page at this depth: the keyset position of the preceding row
+            last = offset_page(db, depth - 1, 1)[0]
+            cursor = (last.trial_id, last.timestamp, last.id)
+            offset_s = timed(args.repeat, offset_page, db, depth, args.limit)
+            keyset_s = timed(args.repeat, read_page, db, SESSION_ID, None, None, None, cursor, args.limit)
+            print(f"{depth:>10} {offset_s * 1e3:>10.2f} {keyset_s * 1e3:>10.2f}")
+            depth *= 4
+
+
+if __name__ == "__main__":
+    main()
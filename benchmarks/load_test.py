@@ -0,0 +1,288 @@
+#!/usr/bin/env python
+"""
+Load test: N simulated participants running full study sessions.
+
+Starts ``app.main:app`` under uvicorn against a throwaway SQLite database
+(``DB_URL``), then runs every participant on its own keep-alive connection
+through the real study flow:
+
+    create session
+    per trial: trial_start event, eye tracking batches (``--hz`` samples per
+               second for ``--trial-seconds``, posted every ``--batch-ms``),
+               trial response, feedback, trial_end event
+    SAM, NASA-TLX, then PUT the session as completed
+
+Reports overall requests/s, client-side latency percentiles per endpoint and
+the server's SQL statement counts (scraped from ``/metrics``), and writes
+everything to a JSON file so runs can be diffed:
+
+    python -m benchmarks.load_test --participants 20 --trials 10 --output results.json
+
+Pass ``--url`` to target an already running server instead (MySQL etc.).
+By default batches are sent back to back; ``--realtime`` paces them like a
+real tracker would.
+"""
+import argparse
+import http.client
+import json
+import os
+import platform
+import sqlite3
+import subprocess
+import sys
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+from urllib.parse import urlsplit
+
+import numpy as np
+
+DB_PATH = "bench_load.db"
+
+
+class Client:
+    """One participant's keep-alive HTTP connection, recording latency per endpoint"""
+
+    def __init__(self, url: str, latencies: Dict[str, List[float]], errors: Dict[str, int], lock: threading.Lock):
+        parts = urlsplit(url)
+        self.conn = http.client.HTTPConnection(parts.hostname, parts.port or 80, timeout=60)
+        self.latencies = latencies
+        self.errors = errors
+        self.lock = lock
+
+    def request(self, method: str, path: str, endpoint: str, body=None):
+        payload = json.dumps(body).encode() if body is not None else None
+        headers = {"Content-Type": "application/json"} if payload is not None else {}
+        start = time.perf_counter()
+        self.conn.request(method, path, body=payload, headers=headers)
+        response = self.conn.getresponse()
+        data = response.read()
+        elapsed = time.perf_counter() - start
+        with self.lock:
+            self.latencies[endpoint].append(elapsed)
+            if response.status >= 400:
+                self.errors[endpoint] += 1
+        return response.status, data
+
+    def close(self):
+        self.conn.close()
+
+
+def run_participant(index: int, args, client: Client) -> None:
+    session_id = f"load-{args.run_id}-{index}"
+    participant_id = f"participant-{index}"
+    now = int(time.time() * 1000)
+    client.request("POST", "/api/sessions", "POST /api/sessions", {
+        "session_id": session_id, "participant_id": participant_id, "start_time": now,
+    })
+
+    samples_per_batch = max(1, int(args.hz * args.batch_ms / 1000))
+    batches_per_trial = max(1, int(args.trial_seconds * 1000 / args.batch_ms))
+    rng = np.random.default_rng(index)
+    for trial_id in range(1, args.trials + 1):
+        trial_start = int(time.time() * 1000)
+        client.request("POST", "/api/event-logs", "POST /api/event-logs", {
+            "session_id": session_id, "event_type": "trial_start",
+            "event_data": {"trial_id": trial_id}, "timestamp": trial_start,
+        })
+        for batch in range(batches_per_trial):
+            first = trial_start + batch * args.batch_ms
+            step = 1000 / args.hz
+            samples = [
+                {
+                    "session_id": session_id,
+                    "trial_id": trial_id,
+                    "timestamp": int(first + i * step),
+                    "gaze_x": float(x),
+                    "gaze_y": float(y),
+                    "pupil_diameter": float(p),
+                }
+                for i, (x, y, p) in enumerate(zip(
+                    rng.uniform(0, 1920, samples_per_batch),
+                    rng.uniform(0, 1080, samples_per_batch),
+                    rng.normal(3.5, 0.3, samples_per_batch),
+                ))
+            ]
+            client.request("POST", "/api/eye-tracking/batch", "POST /api/eye-tracking/batch", samples)
+            if args.realtime:
+                time.sleep(args.batch_ms / 1000)
+
+        answer = trial_start + 1500
+        client.request("POST", "/api/trial-responses", "POST /api/trial-responses", {
+            "session_id": session_id, "participant_id": participant_id, "trial_id": trial_id,
+            "question_number": trial_id, "selected_option": "A",
+            "stimulus_start_time": trial_start, "answer_time": answer, "next_clicked_time": answer + 300,
+            "cross_start_time": trial_start - 500, "cross_end_time": trial_start,
+            "response_time": 1500, "timestamp": answer,
+        })
+        client.request("POST", "/api/feedback-responses", "POST /api/feedback-responses", {
+            "session_id": session_id, "participant_id": participant_id, "trial_id": trial_id,
+            "question_id": trial_id, "mental_effort": int(rng.integers(1, 10)),
+            "confidence": int(rng.integers(1, 10)), "familiarity": int(rng.integers(1, 5)),
+            "timestamp": answer + 1000,
+        })
+        client.request("POST", "/api/event-logs", "POST /api/event-logs", {
+            "session_id": session_id, "event_type": "trial_end",
+            "event_data": {"trial_id": trial_id}, "timestamp": answer + 2000,
+        })
+
+    end = int(time.time() * 1000)
+    client.request("POST", "/api/sam-responses", "POST /api/sam-responses", {
+        "session_id": session_id, "participant_id": participant_id,
+        "pleasure": 5, "arousal": 5, "dominance": 5, "timestamp": end,
+    })
+    client.request("POST", "/api/tlx-responses", "POST /api/tlx-responses", {
+        "session_id": session_id, "participant_id": participant_id,
+        "mental_demand": 50, "physical_demand": 10, "temporal_demand": 40,
+        "performance": 70, "effort": 60, "frustration": 20, "timestamp": end,
+    })
+    client.request("PUT", f"/api/sessions/{session_id}", "PUT /api/sessions/{session_id}", {
+        "completed": True, "end_time": end,
+    })
+
+
+def scrape_query_counts(url: str) -> Optional[Dict]:
+    """Read the server's SQL statement counters (total and per route) from /metrics"""
+    parts = urlsplit(url)
+    conn = http.client.HTTPConnection(parts.hostname, parts.port or 80, timeout=30)
+    try:
+        conn.request("GET", "/metrics")
+        response = conn.getresponse()
+        if response.status != 200:
+            return None
+        text = response.read().decode()
+    finally:
+        conn.close()
+
+    counts = {"total": 0.0, "routes": defaultdict(lambda: {"sum": 0.0, "count": 0.0})}
+    for line in text.splitlines():
+        if line.startswith("db_queries_total{"):
+            counts["total"] += float(line.rsplit(" ", 1)[1])
+        for suffix in ("sum", "count"):
+            prefix = f"http_request_db_queries_{suffix}{{"
+            if line.startswith(prefix):
+                labels, value = line[len(prefix):].rsplit("} ", 1)
+                fields = {k: v.strip('"') for k, v in (item.split("=", 1) for item in labels.split(","))}
+                counts["routes"][f"{fields['method']} {fields['route']}"][suffix] += float(value)
+    return counts
+
+
+def query_delta(before: Dict, after: Dict) -> Dict:
+    """SQL statements issued between two scrapes: total and mean per request by route"""
+    per_request = {}
+    for route, stats in after["routes"].items():
+        prior = before["routes"].get(route, {"sum": 0.0, "count": 0.0})
+        requests = stats["count"] - prior["count"]
+        if requests:
+            per_request[route] = round((stats["sum"] - prior["sum"]) / requests, 2)
+    return {"total": int(after["total"] - before["total"]), "per_request": per_request}
+
+
+def percentiles(values: List[float]) -> Dict[str, float]:
+    ms = np.asarray(values) * 1000
+    return {
+        "count": len(values),
+        "mean_ms": round(float(ms.mean()), 3),
+        **{f"p{p}_ms": round(float(np.percentile(ms, p)), 3) for p in (50, 90, 95, 99)},
+        "max_ms": round(float(ms.max()), 3),
+    }
+
+
+def start_server(args) -> subprocess.Popen:
+    for path in (DB_PATH, DB_PATH + "-wal", DB_PATH + "-shm"):
+        if os.path.exists(path):
+            os.remove(path)
+    # WAL lets readers run alongside the single SQLite writer; the mode is stored in the file
+    sqlite3.connect(DB_PATH).execute("PRAGMA journal_mode=WAL").close()
+
+    env = {
+        **os.environ,
+        "DB_URL": f"sqlite:///{DB_PATH}?timeout=30",
+        "METRICS_ENABLED": "true",
+    }
+    env.pop("PROMETHEUS_MULTIPROC_DIR", None)
+    subprocess.run([sys.executable, "-m", "app.migrate"], env=env, check=True, stdout=subprocess.DEVNULL)
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(args.port), "--log-level", "warning"],
+        env=env,
+    )
+    url = f"http://127.0.0.1:{args.port}"
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            conn = http.client.HTTPConnection("127.0.0.1", args.port, timeout=1)
+            conn.request("GET", "/health")
+            if conn.getresponse().status == 200:
+                return server
+        except OSError:
+            time.sleep(0.2)
+    server.terminate()
+    raise SystemExit(f"Server did not come up on {url}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--participants", type=int, default=10)
+    parser.add_argument("--trials", type=int, default=5)
+    parser.add_argument("--hz", type=float, default=60, help="Eye tracker sample rate")
+    parser.add_argument("--trial-seconds", type=float, default=5)
+    parser.add_argument("--batch-ms", type=int, default=500, help="Eye tracking upload interval")
+    parser.add_argument("--realtime", action="store_true", help="Sleep between batches like a real tracker")
+    parser.add_argument("--url", help="Target a running server instead of starting one on SQLite")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--output", default="load_test_results.json")
+    args = parser.parse_args()
+    args.run_id = f"{int(time.time())}"
+
+    server = None if args.url else start_server(args)
+    url = args.url or f"http://127.0.0.1:{args.port}"
+    latencies: Dict[str, List[float]] = defaultdict(list)
+    errors: Dict[str, int] = defaultdict(int)
+    lock = threading.Lock()
+    try:
+        queries_before = scrape_query_counts(url)
+        clients = [Client(url, latencies, errors, lock) for _ in range(args.participants)]
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.participants) as pool:
+            for future in [pool.submit(run_participant, i, args, c) for i, c in enumerate(clients)]:
+                future.result()
+        elapsed = time.perf_counter() - start
+        for client in clients:
+            client.close()
+        queries = scrape_query_counts(url)
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+
+    total_requests = sum(len(v) for v in latencies.values())
+    if queries is not None and queries_before is not None:
+        queries = query_delta(queries_before, queries)
+    results = {
+        "config": {k: v for k, v in vars(args).items() if k != "output"},
+        "python": platform.python_version(),
+        "elapsed_s": round(elapsed, 3),
+        "requests": total_requests,
+        "requests_per_s": round(total_requests / elapsed, 1),
+        "errors": dict(errors),
+        "endpoints": {name: percentiles(values) for name, values in sorted(latencies.items())},
+        "db_queries": queries,
+    }
+
+    print(f"{total_requests} requests in {elapsed:.2f}s = {results['requests_per_s']} req/s, errors: {dict(errors) or 0}")
+    print(f"{'endpoint':<36} {'count':>6} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'queries/req':>12}")
+    per_request = (queries or {}).get("per_request", {})
+    for name, stats in results["endpoints"].items():
+        print(
+            f"{name:<36} {stats['count']:>6} {stats['p50_ms']:>8.2f} {stats['p95_ms']:>8.2f} "
+            f"{stats['p99_ms']:>8.2f} {per_request.get(name, float('nan')):>12}"
+        )
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
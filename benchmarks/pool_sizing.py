@@ -0,0 +1,130 @@
+#!/usr/bin/env python
+"""
+Pool sizing guide: connection budget per worker, checkout wait and pre-ping cost.
+
+1. Budget: every worker process owns its own pool, so the server sees up to
+   ``workers * (DB_POOL_SIZE + DB_MAX_OVERFLOW)`` connections. Given the
+   server's ``max_connections`` this prints the largest pool each worker can
+   have while leaving headroom for migrations, the archiver and admin sessions.
+
+2. Checkout wait: ``--threads`` threads (one worker's DB thread pool) each run
+   ``--queries`` statements that hold their connection for ``--hold-ms``,
+   for every pool size in ``--pool-sizes``. Once threads outnumber
+   connections, time spent waiting in the pool grows quickly.
+
+3. pre_ping: the same checkout/``SELECT 1``/checkin loop with
+   ``pool_pre_ping`` off and on. Each pre-ping is one extra round trip per
+   checkout, so run this against the real server (``--url``) to see what it
+   costs there; against the default local SQLite file it is close to free.
+
+    python -m benchmarks.pool_sizing --workers 4 --max-connections 151
+    python -m benchmarks.pool_sizing --url "mysql+pymysql://user:pass@db:3306/pupil_study"
+"""
+import argparse
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import List
+
+import numpy as np
+from sqlalchemy import create_engine, text
+from sqlalchemy.pool import QueuePool
+
+from app.config import settings
+from app.database import _connect_args
+
+DEFAULT_URL = "sqlite:///bench_pool.db"
+RESERVED_CONNECTIONS = 10
+
+
+def budget(workers: int, max_connections: int) -> None:
+    per_worker = (max_connections - RESERVED_CONNECTIONS) // workers
+    configured = settings.db_pool_size + settings.db_max_overflow
+    print(f"Connection budget: {max_connections} max_connections, {RESERVED_CONNECTIONS} reserved, {workers} workers")
+    print(f"  per worker: at most {per_worker} connections (DB_POOL_SIZE + DB_MAX_OVERFLOW)")
+    print(f"  configured: {settings.db_pool_size} + {settings.db_max_overflow} = {configured} per worker, "
+          f"{configured * workers} total {'OK' if configured <= per_worker else 'OVER BUDGET'}")
+    print()
+
+
+def bench_engine(url: str, pool_size: int, pre_ping: bool):
+    return create_engine(
+        url,
+        poolclass=QueuePool,
+        pool_size=pool_size,
+        max_overflow=0,
+        pool_timeout=300,
+        pool_pre_ping=pre_ping,
+        connect_args=_connect_args(url),
+    )
+
+
+def checkout_wait(url: str, pool_sizes: List[int], threads: int, queries: int, hold_ms: float) -> None:
+    print(f"Checkout wait: {threads} threads x {queries} statements, each holding its connection {hold_ms} ms")
+    print(f"{'pool':>6} {'stmts/s':>10} {'wait p50 ms':>12} {'wait p95 ms':>12} {'wait max ms':>12}")
+    for size in pool_sizes:
+        engine = bench_engine(url, size, settings.db_pool_pre_ping)
+        waits: List[float] = []
+        lock = threading.Lock()
+
+        def worker():
+            local = []
+            for _ in range(queries):
+                start = time.perf_counter()
+                with engine.connect() as conn:
+                    local.append(time.perf_counter() - start)
+                    conn.execute(text("SELECT 1"))
+                    time.sleep(hold_ms / 1000)
+            with lock:
+                waits.extend(local)
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=threads) as pool:
+            for future in [pool.submit(worker) for _ in range(threads)]:
+                future.result()
+        elapsed = time.perf_counter() - start
+        engine.dispose()
+
+        ms = np.asarray(waits) * 1000
+        print(f"{size:>6} {len(waits) / elapsed:>10.0f} {np.percentile(ms, 50):>12.2f} "
+              f"{np.percentile(ms, 95):>12.2f} {ms.max():>12.2f}")
+    print()
+
+
+def pre_ping_cost(url: str, checkouts: int) -> None:
+    print(f"pool_pre_ping: {checkouts} checkout + SELECT 1 + checkin cycles on one connection")
+    results = {}
+    for pre_ping in (False, True):
+        engine = bench_engine(url, 1, pre_ping)
+        with engine.connect() as conn:  # open the connection outside the timed loop
+            conn.execute(text("SELECT 1"))
+        start = time.perf_counter()
+        for _ in range(checkouts):
+            with engine.connect() as conn:
+                conn.execute(text("SELECT 1"))
+        results[pre_ping] = (time.perf_counter() - start) / checkouts
+        engine.dispose()
+        print(f"  pre_ping={str(pre_ping):<5} {results[pre_ping] * 1e6:9.1f} us per checkout")
+    print(f"  pre-ping adds {(results[True] - results[False]) * 1e6:.1f} us to every checkout")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default=DEFAULT_URL)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--max-connections", type=int, default=151, help="MySQL max_connections (default 151)")
+    parser.add_argument("--pool-sizes", default="2,5,10,20,30")
+    parser.add_argument("--threads", type=int, default=settings.db_thread_pool_size or 30)
+    parser.add_argument("--queries", type=int, default=50)
+    parser.add_argument("--hold-ms", type=float, default=5.0)
+    parser.add_argument("--checkouts", type=int, default=2000)
+    args = parser.parse_args()
+
+    budget(args.workers, args.max_connections)
+    checkout_wait(args.url, [int(size) for size in args.pool_sizes.split(",")], args.threads, args.queries, args.hold_ms)
+    pre_ping_cost(args.url, args.checkouts)
+
+
+if __name__ == "__main__":
+    main()
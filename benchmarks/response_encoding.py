@@ -0,0 +1,128 @@
+#!/usr/bin/env python
+"""
+Compare encode time and bytes on the wire for ``GET /api/sessions/{id}/responses``.
+
+Builds one session with ``--trials`` trial responses and ``--events`` event
+logs in a throwaway SQLite database, then times:
+
+  * old path: ORM objects -> ``jsonable_encoder`` -> stdlib ``json`` (JSONResponse)
+  * new path: row mappings -> orjson (ORJSONResponse)
+
+and the size/time of the encoded body under gzip and zstd.
+
+    python -m benchmarks.response_encoding --trials 2000 --events 10000
+"""
+import argparse
+import gzip
+import json
+import os
+import time
+
+import orjson
+from fastapi.encoders import jsonable_encoder
+from sqlalchemy import create_engine, insert, select
+from sqlalchemy.orm import sessionmaker
+
+from app.database import Base
+from app.models import EventLog, StudySession, TrialResponse
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+DB_PATH = "bench_encoding.db"
+SESSION_ID = "bench-session"
+
+
+def setup(trials: int, events: int):
+    if os.path.exists(DB_PATH):
+        os.remove(DB_PATH)
+    engine = create_engine(f"sqlite:///{DB_PATH}")
+    Base.metadata.create_all(engine)
+    with engine.begin() as conn:
+        conn.execute(insert(StudySession), [{"session_id": SESSION_ID, "participant_id": "p1", "start_time": 0}])
+        conn.execute(insert(TrialResponse), [
+            {
+                "session_id": SESSION_ID, "participant_id": "p1", "trial_id": i, "question_number": i,
+                "selected_option": "B", "stimulus_start_time": i * 10_000, "answer_time": i * 10_000 + 1500,
+                "next_clicked_time": i * 10_000 + 1800, "cross_start_time": i * 10_000 - 500,
+                "cross_end_time": i * 10_000, "response_time": 1500, "timestamp": i * 10_000 + 1500,
+            }
+            for i in range(trials)
+        ])
+        conn.execute(insert(EventLog), [
+            {
+                "session_id": SESSION_ID, "event_type": "click",
+                "event_data": {"x": i % 1920, "y": i % 1080, "target": "next"}, "timestamp": i * 100,
+            }
+            for i in range(events)
+        ])
+    return sessionmaker(bind=engine)
+
+
+def old_path(db) -> bytes:
+    session = db.query(StudySession).filter(StudySession.session_id == SESSION_ID).first()
+    trial_responses = db.query(TrialResponse).filter(TrialResponse.session_id == SESSION_ID).all()
+    event_logs = db.query(EventLog).filter(EventLog.session_id == SESSION_ID).all()
+    content = jsonable_encoder({"session": session, "trial_responses": trial_responses, "event_logs": event_logs})
+    # What JSONResponse.render does
+    return json.dumps(content, ensure_ascii=False, allow_nan=False, indent=None, separators=(",", ":")).encode()
+
+
+def new_path(db) -> bytes:
+    def rows(model):
+        table = model.__table__
+        return [dict(row) for row in db.execute(select(table).where(table.c.session_id == SESSION_ID)).mappings()]
+
+    return orjson.dumps({
+        "session": rows(StudySession)[0],
+        "trial_responses": rows(TrialResponse),
+        "event_logs": rows(EventLog),
+    })
+
+
+def timed(fn, repeat: int):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    return result, best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--trials", type=int, default=2000)
+    parser.add_argument("--events", type=int, default=10000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    Session = setup(args.trials, args.events)
+    print(f"{args.trials} trial responses + {args.events} event logs, best of {args.repeat}")
+    print(f"{'path':<32} {'ms':>9} {'bytes':>11}")
+
+    def run(fn):
+        def call():
+            with Session() as db:
+                return fn(db)
+        return call
+
+    old_body, old_time = timed(run(old_path), args.repeat)
+    new_body, new_time = timed(run(new_path), args.repeat)
+    assert json.loads(old_body) == json.loads(new_body), "payloads differ"
+    print(f"{'ORM + jsonable_encoder + json':<32} {old_time * 1000:>9.1f} {len(old_body):>11,}")
+    print(f"{'row mappings + orjson':<32} {new_time * 1000:>9.1f} {len(new_body):>11,}  ({old_time / new_time:.1f}x faster)")
+
+    codecs = [("gzip -6", lambda body: gzip.compress(body, compresslevel=6))]
+    if zstandard is not None:
+        codecs.append(("zstd -3", zstandard.ZstdCompressor(level=3).compress))
+    for name, compress in codecs:
+        compressed, elapsed = timed(lambda: compress(new_body), args.repeat)
+        print(f"{'  + ' + name:<32} {elapsed * 1000:>9.1f} {len(compressed):>11,}  ({len(new_body) / len(compressed):.1f}x smaller)")
+
+    os.remove(DB_PATH)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+#!/usr/bin/env python
+"""
+Time to first request for the single-process and gunicorn launchers.
+
+For each launcher the server is started against a migrated throwaway SQLite
+database and timed from process spawn until ``/health`` answers, then the
+first DB-backed request (``GET /api/trials/{id}/stats``) is timed on its own,
+with and without ``DB_POOL_WARMUP``. Also reports the import time of
+``app.main`` alone.
+
+    python -m benchmarks.startup_time --workers 4
+"""
+import argparse
+import http.client
+import os
+import subprocess
+import sys
+import time
+
+DB_PATH = "bench_startup.db"
+PORT = 8766
+
+
+def get(path: str, timeout: float = 1.0) -> int:
+    conn = http.client.HTTPConnection("127.0.0.1", PORT, timeout=timeout)
+    try:
+        conn.request("GET", path)
+        response = conn.getresponse()
+        response.read()
+        return response.status
+    finally:
+        conn.close()
+
+
+def measure(command, env) -> dict:
+    start = time.perf_counter()
+    server = subprocess.Popen(command, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        deadline = start + 60
+        while True:
+            try:
+                if get("/health") == 200:
+                    break
+            except OSError:
+                pass
+            if time.perf_counter() > deadline or server.poll() is not None:
+                raise SystemExit(f"Server did not start: {' '.join(command)}")
+            time.sleep(0.01)
+        ready = time.perf_counter() - start
+        first_db_start = time.perf_counter()
+        get("/api/trials/1/stats", timeout=30)
+        first_db = time.perf_counter() - first_db_start
+        return {"ready_s": ready, "first_db_request_ms": first_db * 1000}
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def import_time(env) -> float:
+    out = subprocess.run(
+        [sys.executable, "-c", "import time; t = time.perf_counter(); import app.main; print(time.perf_counter() - t)"],
+        env=env, capture_output=True, text=True, check=True,
+    )
+    return float(out.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--warmup", type=int, default=4, help="DB_POOL_WARMUP for the warm runs")
+    args = parser.parse_args()
+
+    if os.path.exists(DB_PATH):
+        os.remove(DB_PATH)
+    env = {**os.environ, "DB_URL": f"sqlite:///{DB_PATH}", "SCHEMA_CHECK": "warn"}
+    env.pop("PROMETHEUS_MULTIPROC_DIR", None)
+    subprocess.run([sys.executable, "-m", "app.migrate"], env=env, check=True, stdout=subprocess.DEVNULL)
+
+    print(f"import app.main: {import_time(env) * 1000:.0f} ms")
+    launchers = {
+        "uvicorn (1 process)": [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(PORT)],
+        f"gunicorn ({args.workers} workers)": [
+            sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py",
+            "--workers", str(args.workers), "--bind", f"127.0.0.1:{PORT}", "app.main:app",
+        ],
+    }
+    print(f"{'launcher':<24} {'warmup':>6} {'ready ms':>9} {'first DB request ms':>20}")
+    for name, command in launchers.items():
+        for warmup in (0, args.warmup):
+            result = measure(command, {**env, "DB_POOL_WARMUP": str(warmup)})
+            print(f"{name:<24} {warmup:>6} {result['ready_s'] * 1000:>9.0f} {result['first_db_request_ms']:>20.2f}")
+    os.remove(DB_PATH)
+
+
+if __name__ == "__main__":
+    main()
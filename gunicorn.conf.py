@@ -0,0 +1,61 @@
+"""
+Production launcher: gunicorn managing uvicorn workers.
+
+    gunicorn -c gunicorn.conf.py app.main:app      (or: python run.py --prod)
+
+- preload_app imports the app once in the master, so workers fork with the code
+  already loaded instead of each importing it. No DB connection is opened at
+  import, and post_fork drops any pooled connection a worker would otherwise share.
+- The master checks the schema version once in on_starting (SCHEMA_CHECK=strict
+  stops it before any worker starts). With DB_POOL_WARMUP each worker opens pooled
+  connections in its lifespan startup before taking traffic.
+- SIGHUP re-reads this config and replaces workers, letting in-flight requests
+  finish within graceful_timeout. With preload_app the new workers fork from the
+  app the master already imported, so HUP never loads new code.
+- Deploying new code: send USR2 (the master re-executes itself and starts a new
+  master with the new code alongside the old one), then WINCH to the old master
+  to drain its workers, then QUIT to it. Or simply restart the service.
+- max_requests recycles workers periodically (with jitter, so they don't all
+  restart at once).
+"""
+import multiprocessing
+import os
+
+bind = os.environ.get("BIND", "0.0.0.0:8000")
+workers = int(os.environ.get("WEB_CONCURRENCY", multiprocessing.cpu_count()))
+worker_class = "uvicorn.workers.UvicornWorker"
+preload_app = True
+timeout = int(os.environ.get("WORKER_TIMEOUT", 60))
+graceful_timeout = int(os.environ.get("GRACEFUL_TIMEOUT", 30))
+keepalive = 5
+max_requests = int(os.environ.get("MAX_REQUESTS", 0))
+max_requests_jitter = max_requests // 10
+accesslog = os.environ.get("ACCESS_LOG") or None
+
+
+def on_starting(server):
+    from app import migrate
+    from app.config import settings
+    from app.database import SessionLocal, engine
+
+    if settings.schema_check != "off":
+        with SessionLocal() as db:
+            migrate.check_schema(db)
+        # Workers must not inherit the master's connection
+        engine.dispose()
+    # Forked workers see this and skip their own check
+    migrate.schema_checked = True
+
+
+def post_fork(server, worker):
+    from app.database import dispose_after_fork
+
+    dispose_after_fork()
+
+
+def child_exit(server, worker):
+    # Let /metrics drop the live gauges of a worker that is gone
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        from prometheus_client import multiprocess
+
+        multiprocess.mark_process_dead(worker.pid)
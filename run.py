@@ -1,10 +1,18 @@
 #!/usr/bin/env python
 """
 Script to run the FastAPI application
+
+    python run.py          development server with auto-reload
+    python run.py --prod   gunicorn with uvicorn workers (see gunicorn.conf.py)
 """
+import os
+import sys
+
 import uvicorn
 
 if __name__ == "__main__":
+    if "--prod" in sys.argv[1:]:
+        os.execvp("gunicorn", ["gunicorn", "-c", "gunicorn.conf.py", "app.main:app"])
     uvicorn.run(
         "app.main:app",
         host="0.0.0.0",
@@ -0,0 +1,71 @@
+"""Shared fixtures: the app on a throwaway SQLite database, plus a SQL statement counter.
+
+The database URL has to be in the environment before ``app.config`` is
+imported, so it is set here at collection time rather than in a fixture.
+"""
+import os
+import tempfile
+
+DB_DIR = tempfile.mkdtemp(prefix="pupil-study-tests-")
+os.environ["DB_URL"] = f"sqlite:///{DB_DIR}/primary.db"
+os.environ["DB_REPLICA_URLS"] = ""
+os.environ["WRITE_BEHIND_ENABLED"] = "false"
+os.environ["PREPROCESSING_ENABLED"] = "false"
+os.environ["METRICS_ENABLED"] = "false"
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import event
+
+from app.database import engine
+from app.main import app
+from app.migrate import migrate
+
+
+@pytest.fixture(scope="session")
+def client():
+    migrate()
+    with TestClient(app) as client:
+        yield client
+
+
+@pytest.fixture
+def statements():
+    """SQL statements sent to the primary while the test runs"""
+    executed = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        executed.append(statement)
+
+    event.listen(engine, "before_cursor_execute", record)
+    yield executed
+    event.remove(engine, "before_cursor_execute", record)
+
+
+@pytest.fixture
+def make_session(client):
+    """Create a study session and return its id"""
+    def make(session_id: str, **fields) -> str:
+        body = {"session_id": session_id, "participant_id": "p1", "start_time": 1000, **fields}
+        assert client.post("/api/sessions", json=body).status_code == 200
+        return session_id
+
+    return make
+
+
+def trial_response(session_id: str, trial_id: int, **fields) -> dict:
+    return {
+        "session_id": session_id,
+        "participant_id": "p1",
+        "trial_id": trial_id,
+        "question_number": 1,
+        "selected_option": "A",
+        "stimulus_start_time": 0,
+        "answer_time": 0,
+        "next_clicked_time": 0,
+        "cross_start_time": 0,
+        "cross_end_time": 0,
+        "response_time": 500,
+        "timestamp": 0,
+        **fields,
+    }
@@ -0,0 +1,23 @@
+from app.config import settings
+
+
+def test_compressed_response_has_a_weak_etag(client, monkeypatch):
+    monkeypatch.setattr(settings, "compression_min_size", 0)
+
+    plain = client.get("/api/trials", headers={"Accept-Encoding": "identity"})
+    compressed = client.get("/api/trials", headers={"Accept-Encoding": "gzip"})
+
+    assert "content-encoding" not in plain.headers
+    assert compressed.headers["content-encoding"] == "gzip"
+    assert compressed.headers["etag"] == "W/" + plain.headers["etag"]
+    assert compressed.content == plain.content
+
+
+def test_revalidation_matches_the_weak_etag(client, monkeypatch):
+    monkeypatch.setattr(settings, "compression_min_size", 0)
+    etag = client.get("/api/trials", headers={"Accept-Encoding": "gzip"}).headers["etag"]
+
+    response = client.get("/api/trials", headers={"Accept-Encoding": "gzip", "If-None-Match": etag})
+
+    assert response.status_code == 304
+    assert response.headers["etag"] == etag
@@ -0,0 +1,22 @@
+def test_pages_cover_every_event_once(client, make_session):
+    session_id = make_session("event-log-pages")
+    # Shared timestamps: the cursor must break ties on id
+    for i in range(7):
+        body = {"session_id": session_id, "event_type": "click", "timestamp": i // 3}
+        assert client.post("/api/event-logs", json=body).status_code == 200
+
+    seen, cursor = [], None
+    while True:
+        params = {"session_id": session_id, "limit": 2, **({"cursor": cursor} if cursor else {})}
+        page = client.get("/api/event-logs", params=params).json()
+        seen += [(item["timestamp"], item["id"]) for item in page["items"]]
+        cursor = page["next_cursor"]
+        if cursor is None:
+            break
+
+    assert len(seen) == 7
+    assert seen == sorted(set(seen))
+
+
+def test_session_id_is_required(client):
+    assert client.get("/api/event-logs", params={"event_type": "click"}).status_code == 422
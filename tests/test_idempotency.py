@@ -0,0 +1,75 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from app.database import SessionLocal
+from app.models import EventLog, StudySession, TrialResponse
+from tests.conftest import trial_response
+
+
+def _count(model, session_id: str) -> int:
+    with SessionLocal() as db:
+        return db.query(model).filter(model.session_id == session_id).count()
+
+
+def test_concurrent_requests_with_one_key_write_once(client, make_session):
+    session_id = make_session("idempotent-concurrent")
+    body = trial_response(session_id, 1)
+
+    def post(_):
+        response = client.post("/api/trial-responses", json=body, headers={"Idempotency-Key": "retry-1"})
+        return response.status_code, response.text
+
+    with ThreadPoolExecutor(max_workers=16) as pool:
+        results = list(pool.map(post, range(32)))
+
+    assert {status for status, _ in results} == {200}
+    assert len({text for _, text in results}) == 1
+    assert _count(TrialResponse, session_id) == 1
+
+
+def test_retry_replays_the_stored_response(client, make_session):
+    session_id = make_session("idempotent-replay")
+    body = {"session_id": session_id, "event_type": "click", "event_data": {"x": 1}, "timestamp": 5}
+    headers = {"Idempotency-Key": "event-1"}
+
+    first = client.post("/api/event-logs", json=body, headers=headers)
+    retry = client.post("/api/event-logs", json=body, headers=headers)
+
+    assert first.status_code == retry.status_code == 200
+    assert retry.json() == first.json()
+    assert _count(EventLog, session_id) == 1
+
+
+def test_key_reused_with_a_different_body_is_rejected(client, make_session):
+    session_id = make_session("idempotent-mismatch")
+    headers = {"Idempotency-Key": "reused"}
+
+    assert client.post("/api/trial-responses", json=trial_response(session_id, 1), headers=headers).status_code == 200
+    response = client.post("/api/trial-responses", json=trial_response(session_id, 2), headers=headers)
+
+    assert response.status_code == 422
+    assert _count(TrialResponse, session_id) == 1
+
+
+def test_failed_write_does_not_consume_the_key(client, make_session):
+    headers = {"Idempotency-Key": "missing-session"}
+    body = trial_response("idempotent-no-such-session", 1)
+
+    assert client.post("/api/trial-responses", json=body, headers=headers).status_code == 404
+    make_session("idempotent-no-such-session")
+    assert client.post("/api/trial-responses", json=body, headers=headers).status_code == 200
+
+
+def test_concurrent_identical_session_creates_write_once(client):
+    body = {"session_id": "concurrent-create", "participant_id": "p1", "start_time": 1000}
+
+    def post(_):
+        response = client.post("/api/sessions", json=body)
+        return response.status_code, response.json()["id"]
+
+    with ThreadPoolExecutor(max_workers=16) as pool:
+        results = list(pool.map(post, range(32)))
+
+    assert {status for status, _ in results} == {200}
+    assert len({session_pk for _, session_pk in results}) == 1
+    with SessionLocal() as db:
+        assert db.query(StudySession).filter(StudySession.session_id == body["session_id"]).count() == 1
@@ -0,0 +1,19 @@
+import numpy as np
+
+from app.pupillometry import interpolate_gaps, lowpass_fir
+
+
+def test_interpolate_gaps_keeps_a_lone_valid_sample():
+    timestamps = np.arange(4) * 10
+    values = np.array([np.nan, 3.0, np.nan, np.nan])
+
+    filled = interpolate_gaps(timestamps, values, np.isnan(values), max_gap_ms=100)
+
+    assert filled[1] == 3.0
+    assert np.isnan(filled[[0, 2, 3]]).all()
+
+
+def test_lowpass_fir_passes_a_linear_trend_through_the_edges():
+    values = np.linspace(3.0, 4.0, 50)
+
+    np.testing.assert_allclose(lowpass_fir(values, sample_rate=60, cutoff_hz=5), values)
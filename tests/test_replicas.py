@@ -0,0 +1,77 @@
+import pytest
+from sqlalchemy import event, insert
+from sqlalchemy.orm import sessionmaker
+
+from app import database
+from app.cache import recent_writes, session_bodies
+from app.database import Base, ReplicaRouter, make_engine
+from app.models import StudySession
+from tests.conftest import DB_DIR
+
+
+@pytest.fixture
+def replica(client, monkeypatch):
+    """Route reads to a second SQLite file, given a schema by the test (or left empty to break it)"""
+    engine = make_engine(f"sqlite:///{DB_DIR}/replica.db", "replica_0")
+    monkeypatch.setattr(database, "replica_engines", [engine])
+    monkeypatch.setattr(database, "ReplicaSessionLocals", [sessionmaker(autocommit=False, autoflush=False, bind=engine)])
+    monkeypatch.setattr(database, "replica_router", ReplicaRouter(1, retry_interval=60.0))
+    yield engine
+    Base.metadata.drop_all(engine)
+    engine.dispose()
+
+
+def _statement_counter(engine) -> list:
+    executed = []
+    event.listen(engine, "before_cursor_execute", lambda *args: executed.append(args[2]))
+    return executed
+
+
+def test_recent_write_is_read_from_the_primary(client, make_session, replica):
+    Base.metadata.create_all(replica)
+    replica_statements = _statement_counter(replica)
+    session_id = make_session("replica-read-your-writes")
+
+    # The replica has not caught up, but this process just wrote the session
+    assert client.get(f"/api/sessions/{session_id}").status_code == 200
+    assert replica_statements == []
+
+
+def test_stale_replica_serves_reads_once_the_window_passes(client, make_session, replica):
+    Base.metadata.create_all(replica)
+    session_id = make_session("replica-stale")
+    recent_writes.discard(session_id)
+
+    assert client.get(f"/api/sessions/{session_id}").status_code == 404
+
+    with replica.begin() as conn:
+        conn.execute(insert(StudySession).values(session_id=session_id, participant_id="p1", start_time=1000))
+    assert client.get(f"/api/sessions/{session_id}").status_code == 200
+
+
+def test_broken_replica_is_marked_down_and_skipped(client, make_session, replica):
+    # No schema on the replica: every query fails with OperationalError
+    replica_statements = _statement_counter(replica)
+    session_id = make_session("replica-broken")
+    recent_writes.discard(session_id)
+
+    assert client.get(f"/api/sessions/{session_id}").status_code == 200
+    assert replica_statements
+    assert database.replica_router.healthy() == [False]
+
+    attempts = len(replica_statements)
+    assert client.get(f"/api/sessions/{session_id}").status_code == 200
+    assert len(replica_statements) == attempts
+
+
+def test_completed_session_read_from_a_replica_is_not_cached(client, make_session, replica):
+    Base.metadata.create_all(replica)
+    session_id = make_session("replica-completed", completed=True)
+    recent_writes.discard(session_id)
+    with replica.begin() as conn:
+        conn.execute(
+            insert(StudySession).values(session_id=session_id, participant_id="p1", start_time=1000, completed=True)
+        )
+
+    assert client.get(f"/api/sessions/{session_id}").status_code == 200
+    assert session_bodies.get(("session+trial_responses", session_id)) is None
@@ -0,0 +1,119 @@
+from app.database import SessionLocal
+from app.write_behind import _insert_rows
+from tests.conftest import trial_response
+
+
+def test_include_empty_is_a_single_statement(client, make_session, statements):
+    session_id = make_session("include-empty")
+    client.post("/api/trial-responses", json=trial_response(session_id, 1))
+    statements.clear()
+
+    response = client.get(f"/api/sessions/{session_id}", params={"include": ""})
+
+    assert response.status_code == 200
+    assert "trial_responses" not in response.json()
+    assert len(statements) == 1
+
+
+def test_fields_is_a_single_statement(client, make_session, statements):
+    session_id = make_session("fields-projection")
+    statements.clear()
+
+    response = client.get(f"/api/sessions/{session_id}", params={"fields": "session_id,completed"})
+
+    assert response.status_code == 200
+    assert response.json() == {"session_id": session_id, "completed": False}
+    assert len(statements) == 1
+    assert "trial_responses" not in statements[0]
+
+
+def test_default_include_loads_responses_without_n_plus_one(client, make_session, statements):
+    session_id = make_session("include-default")
+    for trial_id in range(5):
+        client.post("/api/trial-responses", json=trial_response(session_id, trial_id))
+    statements.clear()
+
+    response = client.get(f"/api/sessions/{session_id}")
+
+    assert len(response.json()["trial_responses"]) == 5
+    assert len(statements) == 2
+
+
+def test_unknown_field_is_rejected(client, make_session):
+    session_id = make_session("fields-invalid")
+    assert client.get(f"/api/sessions/{session_id}", params={"fields": "password"}).status_code == 400
+
+
+def _session_updates(statements) -> list:
+    return [statement for statement in statements if statement.startswith("UPDATE study_sessions")]
+
+
+def test_write_into_session_in_progress_does_not_touch_it(client, make_session, statements):
+    session_id = make_session("touch-in-progress")
+    statements.clear()
+
+    client.post("/api/event-logs", json={"session_id": session_id, "event_type": "click", "timestamp": 1})
+
+    assert _session_updates(statements) == []
+
+
+def test_late_write_into_completed_session_touches_it(client, make_session, statements):
+    session_id = make_session("touch-completed", completed=True)
+    statements.clear()
+
+    client.post("/api/event-logs", json={"session_id": session_id, "event_type": "click", "timestamp": 1})
+
+    assert len(_session_updates(statements)) == 1
+
+
+def test_write_behind_flush_touches_only_completed_sessions(client, make_session, statements):
+    in_progress = make_session("touch-flush-in-progress")
+    completed = make_session("touch-flush-completed", completed=True)
+
+    def flush(*session_ids):
+        rows = [("event_logs", {"session_id": s, "event_type": "click", "timestamp": 1}) for s in session_ids]
+        statements.clear()
+        with SessionLocal() as db:
+            _insert_rows(db, rows, chunk_size=100)
+        return _session_updates(statements)
+
+    assert flush(in_progress) == []
+    assert len(flush(in_progress, completed)) == 1
+
+
+def test_create_new_session_is_a_single_statement(client, statements):
+    body = {"session_id": "create-new", "participant_id": "p1", "start_time": 1000}
+
+    assert client.post("/api/sessions", json=body).status_code == 200
+    assert len(statements) == 1
+    assert statements[0].startswith("INSERT INTO study_sessions")
+
+
+def test_create_existing_session_reads_responses_in_one_query(client, make_session, statements):
+    session_id = make_session("create-existing")
+    for trial_id in range(3):
+        client.post("/api/trial-responses", json=trial_response(session_id, trial_id))
+    statements.clear()
+
+    response = client.post("/api/sessions", json={"session_id": session_id, "participant_id": "p1", "start_time": 1000})
+
+    assert len(response.json()["trial_responses"]) == 3
+    assert len(statements) == 2
+    assert statements[0].startswith("INSERT INTO study_sessions")
+
+
+def test_update_session_is_one_update_and_two_selects(client, make_session, statements):
+    session_id = make_session("update-reload")
+    for trial_id in range(3):
+        client.post("/api/trial-responses", json=trial_response(session_id, trial_id))
+    statements.clear()
+
+    response = client.put(f"/api/sessions/{session_id}", json={"completed": True, "end_time": 2000})
+
+    assert response.status_code == 200
+    assert len(response.json()["trial_responses"]) == 3
+    assert [statement.split()[0] for statement in statements] == ["UPDATE", "SELECT", "SELECT"]
+
+
+def test_update_missing_session_is_404(client):
+    assert client.put("/api/sessions/update-missing", json={"completed": True}).status_code == 404
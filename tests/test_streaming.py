@@ -0,0 +1,62 @@
+from starlette.websockets import WebSocketDisconnect
+
+from app import streaming
+from app.eye_tracking import bulk_insert
+
+
+def _samples(start: int, count: int) -> list:
+    return [
+        {"trial_id": 1, "timestamp": ts, "gaze_x": 0.5, "gaze_y": 0.5, "pupil_diameter": 3.0}
+        for ts in range(start, start + count)
+    ]
+
+
+def _stored(client, session_id: str) -> list:
+    page = client.get(f"/api/sessions/{session_id}/eye-tracking", params={"limit": 1000}).json()
+    return [item["timestamp"] for item in page["items"]]
+
+
+def test_failed_flush_is_retried_before_the_ack(client, make_session, monkeypatch):
+    session_id = make_session("stream-flaky")
+    calls = []
+
+    def flaky_insert(db, rows):
+        calls.append(len(rows))
+        if len(calls) == 1:
+            raise RuntimeError("database unavailable")
+        return bulk_insert(db, rows)
+
+    monkeypatch.setattr(streaming, "bulk_insert", flaky_insert)
+    monkeypatch.setattr(streaming.settings, "ws_flush_interval", 0.01)
+    monkeypatch.setattr(streaming.settings, "ws_flush_batch_size", 10)
+
+    with client.websocket_connect(f"/ws/sessions/{session_id}/eye-tracking") as ws:
+        ws.send_json(_samples(1, 10))
+        ack = ws.receive_json()
+        # The failed batch was not acked on its own; the retry covers it
+        assert ack == {"type": "ack", "persisted": 10, "last_timestamp": 10}
+        ws.send_json(_samples(11, 5))
+        assert ws.receive_json()["persisted"] == 15
+
+    assert calls[:2] == [10, 10]
+    assert _stored(client, session_id) == list(range(1, 16))
+
+
+def test_final_flush_failure_closes_with_an_error(client, make_session, monkeypatch):
+    session_id = make_session("stream-down")
+
+    def failing_insert(db, rows):
+        raise RuntimeError("database unavailable")
+
+    monkeypatch.setattr(streaming, "bulk_insert", failing_insert)
+    monkeypatch.setattr(streaming.settings, "ws_flush_interval", 0.01)
+    monkeypatch.setattr(streaming.settings, "ws_max_buffered_rows", 5)
+
+    with client.websocket_connect(f"/ws/sessions/{session_id}/eye-tracking") as ws:
+        ws.send_json(_samples(1, 5))
+        try:
+            message = ws.receive()
+        except WebSocketDisconnect as exc:
+            message = {"code": exc.code}
+    assert message["code"] == 1011
+    assert _stored(client, session_id) == []
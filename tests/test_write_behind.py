@@ -0,0 +1,65 @@
+import asyncio
+
+import pytest
+from prometheus_client import REGISTRY
+from sqlalchemy.exc import OperationalError
+
+from app import write_behind
+from app.config import settings
+from app.database import SessionLocal
+from app.models import EventLog
+
+
+def _events(session_id: str) -> list:
+    with SessionLocal() as db:
+        return [row.event_type for row in db.query(EventLog).filter(EventLog.session_id == session_id).order_by(EventLog.id)]
+
+
+def _batch(session_id: str, *event_types) -> list:
+    return [("event_logs", {"session_id": session_id, "event_type": t, "timestamp": 1}) for t in event_types]
+
+
+def test_fallback_keeps_the_good_rows(client, make_session):
+    session_id = make_session("write-behind-fallback")
+
+    with SessionLocal() as db:
+        write_behind._insert_rows(db, _batch(session_id, "a", None, "b"), chunk_size=100)
+
+    assert _events(session_id) == ["a", "b"]
+
+
+def test_fallback_failing_partway_commits_nothing(client, make_session, monkeypatch):
+    session_id = make_session("write-behind-fallback-error")
+    insert, calls = write_behind._insert, []
+
+    def flaky_insert(db, table, rows):
+        calls.append(rows)
+        if len(calls) == 4:  # the bulk attempt, then "a" and the bad row: the connection drops on "b"
+            raise OperationalError("INSERT", {}, Exception("connection lost"))
+        insert(db, table, rows)
+
+    monkeypatch.setattr(write_behind, "_insert", flaky_insert)
+    with SessionLocal() as db, pytest.raises(OperationalError):
+        write_behind._insert_rows(db, _batch(session_id, "a", None, "b"), chunk_size=100)
+
+    # flush() requeues the whole batch, so nothing may have been committed
+    assert _events(session_id) == []
+
+
+def test_queue_depth_and_flush_duration_are_exported(client, make_session, monkeypatch, tmp_path):
+    monkeypatch.setattr(settings, "metrics_enabled", True)
+    session_id = make_session("write-behind-metrics")
+    flushes = REGISTRY.get_sample_value("write_behind_flush_seconds_count") or 0
+    buffer = write_behind.WriteBehindBuffer(str(tmp_path), batch_size=100, flush_interval=60)
+
+    async def run():
+        await buffer.start()
+        buffer.append("event_logs", [row for _, row in _batch(session_id, "a", "b", "c")])
+        pending = REGISTRY.get_sample_value("write_behind_pending_rows")
+        await buffer.flush()
+        await buffer.stop()
+        return pending
+
+    assert asyncio.run(run()) == 3
+    assert REGISTRY.get_sample_value("write_behind_pending_rows") == 0
+    assert REGISTRY.get_sample_value("write_behind_flush_seconds_count") == flushes + 1